@@ -0,0 +1,316 @@
+"""
+    Data API on the Flask server.
+
+    Routes return global, country and multi-country time series from the
+    metric stores of the published snapshot, which are built from the
+    processed frames. JSON responses are encoded once per query and data
+    version and served with ETags like pre-encoded callback responses.
+    Exports of all regions are streamed as CSV or NDJSON a chunk of regions
+    at a time, so they are never held in memory as a whole.
+
+        /api/v1/global
+        /api/v1/countries/<country>?province=<province>
+        /api/v1/series?country=<country>&country=<country>
+        /api/v1/export.csv
+        /api/v1/export.ndjson
+
+    Series routes take metric (confirmed, recovered, deaths or an indicator
+    name), all routes take type (cumulative or new) and start and end dates
+    as YYYY-MM-DD.
+"""
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import flask
+import numpy as np
+import pandas as pd
+
+import indicators
+import instrumentation
+import payloads
+import refresh
+import store
+from result_cache import ResultCache
+
+API_PREFIX = '/api/v1'
+
+API_CACHE_SIZE = int(os.environ.get('API_CACHE_SIZE', 256))
+
+METRICS = ['confirmed', 'recovered', 'deaths']
+
+# regions rendered per chunk of a streamed export
+EXPORT_CHUNK_REGIONS = 32
+
+# mimetypes are not compressed by Dash, so exports stay streamed
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+api_cache = ResultCache('api', API_CACHE_SIZE)
+instrumentation.register_cache('api', api_cache)
+
+# metric, metric type and slice of date positions requested
+Query = namedtuple('Query', ['metric', 'metric_type', 'dates'])
+
+
+class ApiError(Exception):
+    """
+        Invalid request, answered with status and message as JSON
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_query(args, dates):
+    """
+        Return Query of request arguments
+
+        Parameters
+        ----------
+
+        args : werkzeug.datastructures.MultiDict
+            Query string arguments
+
+        dates : pandas.DatetimeIndex
+            Dates of the metric stores
+
+
+        Return
+        ------
+
+        Query
+    """
+
+    metric = args.get('metric', 'confirmed')
+    if metric not in METRICS and metric not in indicators.INDICATORS:
+        raise ApiError('unknown metric {!r}'.format(metric))
+    metric_type = args.get('type', 'cumulative')
+    if metric_type not in store.METRIC_COLUMNS:
+        raise ApiError('type must be one of {}'.format(', '.join(store.METRIC_COLUMNS)))
+
+    bounds = []
+    for name in ('start', 'end'):
+        value = args.get(name)
+        if value is None:
+            bounds.append(None)
+            continue
+        try:
+            bound = pd.Timestamp(value)
+        except ValueError:
+            bound = None
+        if bound is None or pd.isnull(bound):
+            raise ApiError('{} must be a date as YYYY-MM-DD'.format(name))
+        bounds.append(bound)
+    start = 0 if bounds[0] is None else int(dates.searchsorted(bounds[0]))
+    stop = len(dates) if bounds[1] is None else int(dates.searchsorted(bounds[1], side='right'))
+    return Query(metric, metric_type, slice(start, stop))
+
+
+def get_matrix(stores, metric, metric_type, regions, dates):
+    """
+        Return region x date matrix of a metric, aligned with regions and
+        dates. Matrices with missing regions or dates are floats with NaN.
+
+        Parameters
+        ----------
+
+        stores : dict
+            store.MetricStore of every processed frame and of indicators
+
+        metric : str
+            Metric or indicator name
+
+        metric_type : str
+            One of ['cumulative', 'new'], ignored for indicators
+
+        regions : list
+            (country, province) tuples
+
+        dates : pandas.DatetimeIndex
+            Requested dates
+    """
+
+    if metric in METRICS:
+        metric_store, key = stores[metric], metric_type
+    else:
+        metric_store, key = stores[indicators.STORE_NAME], metric
+    rows = np.array([metric_store.region_pos.get(region, -1) for region in regions])
+    columns = metric_store.dates.get_indexer(dates)
+    matrix = metric_store.arrays[key][np.ix_(np.maximum(rows, 0), np.maximum(columns, 0))]
+    if (rows < 0).any() or (columns < 0).any():
+        matrix = matrix.astype('float64')
+        matrix[rows < 0] = np.nan
+        matrix[:, columns < 0] = np.nan
+    return matrix
+
+
+def build_series(snapshot, query, regions):
+    """
+        Return JSON document with series of regions
+    """
+
+    stores = snapshot.stores
+    dates = stores['confirmed'].dates[query.dates]
+    matrix = get_matrix(stores, query.metric, query.metric_type, regions, dates)
+    return {
+        'version': snapshot.version,
+        'metric': query.metric,
+        'type': query.metric_type,
+        'dates': dates.strftime('%Y-%m-%d').tolist(),
+        'series': [
+            {'country': country or None, 'province': province or None,
+             'values': store.to_list(values)}
+            for (country, province), values in zip(regions, matrix)
+        ],
+    }
+
+
+def _error_response(error):
+    response = flask.jsonify({'error': error.message})
+    response.status_code = error.status
+    return response
+
+
+def _serve_json(build):
+    # take the snapshot once, a concurrent refresh must not mix versions
+    snapshot = refresh.get_snapshot()
+    key = (flask.request.path, tuple(flask.request.args.items(multi=True)))
+    payload = api_cache.get(key, snapshot.version)
+    if payload is None:
+        try:
+            document = build(snapshot)
+        except ApiError as error:
+            return _error_response(error)
+        payload = payloads.encode_payload(json.dumps(document).encode())
+        api_cache.set(key, snapshot.version, payload)
+    return payloads.make_response(payload)
+
+
+def _check_countries(stores, countries):
+    unknown = [
+        country for country in countries
+        if (country, '') not in stores['confirmed'].region_pos
+    ]
+    if unknown:
+        raise ApiError('unknown countries: {}'.format(', '.join(unknown)), status=404)
+
+
+def get_global():
+    def build(snapshot):
+        query = parse_query(flask.request.args, snapshot.stores['confirmed'].dates)
+        return build_series(snapshot, query, [store.WORLD])
+    return _serve_json(build)
+
+
+def get_country(country):
+    def build(snapshot):
+        stores = snapshot.stores
+        query = parse_query(flask.request.args, stores['confirmed'].dates)
+        _check_countries(stores, [country])
+        province = flask.request.args.get('province', '')
+        if province and province not in stores['confirmed'].get_provinces(country):
+            raise ApiError('unknown province {!r} of {}'.format(province, country), status=404)
+        return build_series(snapshot, query, [(country, province)])
+    return _serve_json(build)
+
+
+def get_series():
+    def build(snapshot):
+        stores = snapshot.stores
+        query = parse_query(flask.request.args, stores['confirmed'].dates)
+        countries = flask.request.args.getlist('country')
+        if not countries:
+            raise ApiError('at least one country is required')
+        _check_countries(stores, countries)
+        return build_series(snapshot, query, [(country, '') for country in countries])
+    return _serve_json(build)
+
+
+def iter_export_chunks(snapshot, query, export_format):
+    """
+        Yield export of every country and province region with columns of
+        every metric, a chunk of EXPORT_CHUNK_REGIONS regions at a time.
+        Column 'level' tells countries from their provinces, countries of
+        provinces hold their sums, so totals are sums of one level only.
+        Country rows have no province, null like in series documents.
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Published data snapshot, kept for the whole export
+
+        query : Query
+            Requested metric type and dates, the metric is ignored
+
+        export_format : str
+            One of ['csv', 'ndjson']
+    """
+
+    stores = snapshot.stores
+    regions = [region for region in stores['confirmed'].regions if region != store.WORLD]
+    dates = stores['confirmed'].dates[query.dates]
+    date_strings = dates.strftime('%Y-%m-%d')
+    columns = ['country', 'province', 'level', 'date'] + METRICS
+
+    if export_format == 'csv':
+        yield ','.join(columns) + '\n'
+    for start in range(0, len(regions), EXPORT_CHUNK_REGIONS):
+        chunk = regions[start:start + EXPORT_CHUNK_REGIONS]
+        chunk_df = pd.DataFrame({
+            'country': np.repeat([country for country, _ in chunk], len(dates)),
+            'province': np.repeat([province or None for _, province in chunk], len(dates)),
+            'level': np.repeat(
+                ['province' if province else 'country' for _, province in chunk], len(dates)),
+            'date': np.tile(date_strings, len(chunk)),
+        })
+        for metric in METRICS:
+            chunk_df[metric] = get_matrix(
+                stores, metric, query.metric_type, chunk, dates).ravel()
+        if export_format == 'csv':
+            yield chunk_df.to_csv(header=False, index=False, float_format='%.10g')
+        else:
+            chunk_json = chunk_df.to_json(orient='records', lines=True)
+            yield chunk_json if chunk_json.endswith('\n') else chunk_json + '\n'
+
+
+def export(export_format):
+    snapshot = refresh.get_snapshot()
+    try:
+        query = parse_query(flask.request.args, snapshot.stores['confirmed'].dates)
+    except ApiError as error:
+        return _error_response(error)
+
+    etag = hashlib.sha1('{} {} {}'.format(
+        snapshot.version, export_format, sorted(flask.request.args.items(multi=True))
+    ).encode()).hexdigest()[:20]
+    if flask.request.if_none_match.contains(etag):
+        response = flask.Response(status=304)
+    else:
+        response = flask.Response(
+            flask.stream_with_context(iter_export_chunks(snapshot, query, export_format)),
+            mimetype=EXPORT_MIMETYPES[export_format]
+        )
+        response.headers['Content-Disposition'] = (
+            'attachment; filename=covid19-{}.{}'.format(query.metric_type, export_format))
+    response.set_etag(etag)
+    return response
+
+
+def init_app(server):
+    """
+        Add API routes to the Flask server
+    """
+
+    server.add_url_rule(API_PREFIX + '/global', 'api_global', get_global)
+    server.add_url_rule(
+        API_PREFIX + '/countries/<country>', 'api_country', get_country)
+    server.add_url_rule(API_PREFIX + '/series', 'api_series', get_series)
+    server.add_url_rule(
+        API_PREFIX + '/export.<any(csv, ndjson):export_format>', 'api_export', export)
@@ -1,7 +1,17 @@
+import os
+
 import dash
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
+# 'server' renders tab content on every button click, 'client' delivers
+# cumulative and new content of a tab once and switches in the browser
+SWITCH_MODE = os.environ.get('SWITCH_MODE', 'server')
+
+# 'figures' keeps a stable content skeleton and updates the traces of its
+# graphs, 'layout' renders the whole tab content on every interaction
+CONTENT_MODE = os.environ.get('CONTENT_MODE', 'figures')
+
 app = dash.Dash(
     __name__,
     external_stylesheets=external_stylesheets,
@@ -0,0 +1,571 @@
+"""
+    Load test of the dashboard replaying browser sessions.
+
+    Starts gunicorn with index:server, or uses a server already running at
+    --url, and drives its Dash callbacks the way dash-renderer does: every
+    session loads the page, fires the initial callbacks and then picks
+    random interactions, i.e. tab switches, cumulative and new cases
+    toggles, country selections, map slider moves and zooms of series
+    charts. Requests are built from the dependencies and the layout served
+    by the app and callbacks fire again on outputs of other callbacks, so
+    the same sessions run against any CONTENT_MODE, SWITCH_MODE or MAP_MODE.
+    Run from the root of the repo, e.g. on synthetic data
+
+        OFFLINE_DATA_DIR=data/synthetic python benchmarks/loadtest.py --workers 4 --concurrency 16
+
+    Prints throughput, p50/p95/p99 latency and bytes transferred by callback
+    output. Results saved with --save can be compared between changes.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import brotli
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DASH_UPDATE_PATH = '/_dash-update-component'
+
+# relative frequency of interactions of a session
+ACTIONS = {
+    'tab': 3,
+    'toggle': 3,
+    'country': 2,
+    'map': 2,
+    'zoom': 1,
+}
+
+# rounds of callbacks fired by outputs of other callbacks after one action
+MAX_ROUNDS = 10
+
+# first day of zoom windows
+ZOOM_START = np.datetime64('2020-02-01')
+
+
+def id_key(component_id):
+    """
+        Return id as sent by dash-renderer, dict ids as JSON with sorted keys
+    """
+
+    if isinstance(component_id, dict):
+        return json.dumps(component_id, sort_keys=True, separators=(',', ':'))
+    return component_id
+
+
+def parse_id(key):
+    if key.startswith('{'):
+        return json.loads(key)
+    return key
+
+
+def parse_dependency(dependency):
+    # 'id.property' with ids of pattern-matching callbacks as JSON
+    key, prop = dependency.rsplit('.', 1)
+    return parse_id(key), prop
+
+
+class Recorder:
+    """
+        Latency, size and errors of requests by name, shared by all sessions
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(list)
+        self.bytes = defaultdict(int)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, size, error=False):
+        with self._lock:
+            self.seconds[name].append(seconds)
+            self.bytes[name] += size
+            if error:
+                self.errors[name] += 1
+
+    def results(self, elapsed):
+        """
+            Return dict of results by request name and of all requests with
+            key 'total'
+        """
+
+        results = {}
+        for name, seconds in sorted(self.seconds.items()):
+            p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000
+            results[name] = {
+                'requests': len(seconds),
+                'errors': self.errors[name],
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+                'bytes': self.bytes[name],
+            }
+        requests = sum(len(seconds) for seconds in self.seconds.values())
+        results['total'] = {
+            'requests': requests,
+            'errors': sum(self.errors.values()),
+            'requests_per_second': requests / elapsed,
+            'bytes': sum(self.bytes.values()),
+            'seconds': elapsed,
+        }
+        return results
+
+
+class Client:
+    """
+        HTTP client of one session thread, accepting compressed responses
+        like a browser
+    """
+
+    def __init__(self, url, recorder):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(
+            parts.hostname, parts.port or 80, timeout=120)
+        self.prefix = parts.path.rstrip('/')
+        self.recorder = recorder
+
+    def request(self, name, path, body=None):
+        """
+            Return decoded JSON response, None for responses without content
+            or failed requests
+        """
+
+        headers = {'Accept-Encoding': 'br, gzip'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        started = time.perf_counter()
+        try:
+            self.connection.request(
+                'GET' if body is None else 'POST', self.prefix + path, data, headers)
+            response = self.connection.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.recorder.record(name, time.perf_counter() - started, 0, error=True)
+            return None
+        self.recorder.record(
+            name, time.perf_counter() - started, len(raw), response.status >= 400)
+
+        content_type = response.getheader('Content-Type') or ''
+        if response.status != 200 or 'json' not in content_type:
+            return None
+        encoding = response.getheader('Content-Encoding')
+        if encoding == 'br':
+            raw = brotli.decompress(raw)
+        elif encoding == 'gzip':
+            raw = gzip.decompress(raw)
+        return json.loads(raw.decode())
+
+
+class Callback:
+    """
+        Server callback of the app as listed by _dash-dependencies
+    """
+
+    def __init__(self, dependency):
+        self.output = dependency['output']
+        self.multi = self.output.startswith('..')
+        if self.multi:
+            outputs = self.output[2:-2].split('...')
+        else:
+            outputs = [self.output]
+        self.outputs = [parse_dependency(output) for output in outputs]
+        self.inputs = [(parse_id(item['id']), item['property']) for item in dependency['inputs']]
+        self.state = [(parse_id(item['id']), item['property']) for item in dependency['state']]
+        self.name = get_callback_name(self.outputs)
+
+    def wildcard_keys(self):
+        # keys of the first pattern-matching output with MATCH values
+        for component_id, _ in self.outputs:
+            if isinstance(component_id, dict):
+                return [key for key, value in component_id.items() if value == ['MATCH']]
+        return []
+
+
+def get_callback_name(outputs):
+    component_id, prop = outputs[0]
+    if isinstance(component_id, dict):
+        fixed = [value for value in component_id.values() if not isinstance(value, list)]
+        component_id = '{}[{}]'.format(','.join(fixed), ','.join(
+            key for key, value in component_id.items() if isinstance(value, list)))
+    name = '{}.{}'.format(component_id, prop)
+    if len(outputs) > 1:
+        name += ' +{}'.format(len(outputs) - 1)
+    return name
+
+
+def matches(pattern, component_id):
+    if not isinstance(pattern, dict) or not isinstance(component_id, dict):
+        return pattern == component_id
+    if set(pattern) != set(component_id):
+        return False
+    return all(
+        isinstance(value, list) or component_id[key] == value
+        for key, value in pattern.items()
+    )
+
+
+class Session:
+    """
+        Browser session: props of every component in the layout and
+        callbacks fired on their changes
+
+        Parameters
+        ----------
+
+        client : Client
+            HTTP client of the session thread
+
+        rng : random.Random
+            Random generator of interactions
+    """
+
+    def __init__(self, client, rng):
+        self.client = client
+        self.rng = rng
+        self.props = {}
+        self.callbacks = []
+
+    def load(self):
+        """
+            Load the page and fire initial callbacks, returns False if the
+            page could not be loaded
+        """
+
+        self.client.request('page /', '/')
+        layout = self.client.request('page _dash-layout', '/_dash-layout')
+        dependencies = self.client.request(
+            'page _dash-dependencies', '/_dash-dependencies')
+        if layout is None or dependencies is None:
+            return False
+        self.callbacks = [
+            Callback(dependency) for dependency in dependencies
+            if not dependency.get('clientside_function')
+        ]
+        self.props = {}
+        self.fire(self.initial_changes(self.register(layout)))
+        return True
+
+    def register(self, tree):
+        """
+            Register props of all components with an id in tree, return keys
+            of their ids
+        """
+
+        keys = set()
+        if isinstance(tree, list):
+            for child in tree:
+                keys |= self.register(child)
+        elif isinstance(tree, dict) and 'props' in tree:
+            props = tree['props']
+            if 'id' in props:
+                key = id_key(props['id'])
+                self.props[key] = dict(props)
+                keys.add(key)
+            keys |= self.register(props.get('children'))
+        return keys
+
+    def initial_changes(self, keys):
+        # new components fire the callbacks they are inputs of
+        return {
+            (id_key(component_id), prop)
+            for callback in self.callbacks
+            for pattern, prop in callback.inputs
+            for component_id in map(parse_id, keys)
+            if matches(pattern, component_id)
+        }
+
+    def instances(self):
+        """
+            Yield (callback, outputs, inputs, state) with concrete ids of
+            every callback whose inputs and outputs are in the layout
+        """
+
+        for callback in self.callbacks:
+            wildcard_keys = callback.wildcard_keys()
+            if wildcard_keys:
+                pattern = callback.outputs[0][0]
+                values = [
+                    {key: component_id[key] for key in wildcard_keys}
+                    for component_id in map(parse_id, self.props)
+                    if matches(pattern, component_id)
+                ]
+            else:
+                values = [{}]
+            for value in values:
+                def concrete(items):
+                    return [
+                        (dict(component_id, **value) if isinstance(component_id, dict) else component_id, prop)
+                        for component_id, prop in items
+                    ]
+                outputs, inputs = concrete(callback.outputs), concrete(callback.inputs)
+                if all(id_key(component_id) in self.props for component_id, _ in outputs + inputs):
+                    yield callback, outputs, inputs, concrete(callback.state)
+
+    def _items(self, dependencies):
+        return [
+            {'id': component_id, 'property': prop,
+             'value': self.props.get(id_key(component_id), {}).get(prop)}
+            for component_id, prop in dependencies
+        ]
+
+    def call(self, callback, outputs, inputs, state, changed):
+        """
+            Request callback and apply its response, return changed
+            (id, property) pairs and keys of new components
+        """
+
+        output_items = [{'id': component_id, 'property': prop} for component_id, prop in outputs]
+        body = {
+            'output': callback.output,
+            'outputs': output_items if callback.multi else output_items[0],
+            'inputs': self._items(inputs),
+            'state': self._items(state),
+            'changedPropIds': sorted(
+                '{}.{}'.format(key, prop) for key, prop in changed),
+        }
+        data = self.client.request(callback.name, DASH_UPDATE_PATH, body)
+        if data is None:
+            return set(), set()
+
+        response = data['response']
+        if not data.get('multi'):
+            response = {id_key(outputs[0][0]): response['props']}
+        updated = set()
+        new_keys = set()
+        for key, props in response.items():
+            self.props.setdefault(key, {}).update(props)
+            updated |= {(key, prop) for prop in props}
+            if 'children' in props:
+                new_keys |= self.register(props['children'])
+        return updated, new_keys
+
+    def fire(self, changed):
+        """
+            Fire callbacks of changed (id, property) pairs and of the changes
+            they cause, one round after another. Callbacks with inputs which
+            are outputs of other callbacks of the round wait for them.
+        """
+
+        deferred = {}
+        for _ in range(MAX_ROUNDS):
+            triggered = {}
+            for instance in self.instances():
+                callback, outputs, inputs, _ = instance
+                key = (callback.output, tuple(id_key(component_id) for component_id, _ in outputs))
+                trigger = {
+                    (id_key(component_id), prop) for component_id, prop in inputs
+                } & changed | deferred.get(key, set())
+                if trigger:
+                    triggered[key] = instance, trigger
+            if not triggered:
+                return
+
+            pending = {
+                (id_key(component_id), prop)
+                for (_, outputs, _, _), _ in triggered.values()
+                for component_id, prop in outputs
+            }
+            waiting = {}
+            for key, ((callback, outputs, inputs, _), trigger) in triggered.items():
+                own = {(id_key(component_id), prop) for component_id, prop in outputs}
+                if any((id_key(component_id), prop) in pending - own
+                       for component_id, prop in inputs):
+                    waiting[key] = trigger
+            if len(waiting) == len(triggered):
+                # callbacks waiting for each other fire together
+                waiting = {}
+
+            changed = set()
+            for key, (instance, trigger) in triggered.items():
+                if key in waiting:
+                    continue
+                updated, new_keys = self.call(*instance, trigger)
+                changed |= updated | self.initial_changes(new_keys)
+            deferred = waiting
+
+    def set_prop(self, key, prop, value):
+        self.props[key][prop] = value
+        self.fire({(key, prop)})
+
+    def act(self):
+        """
+            Perform one random interaction
+        """
+
+        tab = self.props.get('tabs', {}).get('value')
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        if action == 'map' and (tab != 'global_tab' or 'map-date-slider' not in self.props):
+            action = 'tab'
+        if action == 'zoom' and tab not in ('country_tab', 'global_tab'):
+            action = 'toggle'
+
+        if action == 'tab':
+            tabs = [
+                child['props']['value'] for child in self.props['tabs']['children']
+                if child['props']['value'] != tab
+            ]
+            self.set_prop('tabs', 'value', self.rng.choice(tabs))
+        elif action == 'toggle':
+            buttons = ['cum_button', 'new_cases_button']
+            timestamps = [self.props[button]['n_clicks_timestamp'] or 0 for button in buttons]
+            # click the button which is not active
+            button = buttons[int(timestamps[0] > timestamps[1])]
+            self.props[button]['n_clicks'] = (self.props[button].get('n_clicks') or 0) + 1
+            self.set_prop(button, 'n_clicks_timestamp', int(time.time() * 1000))
+        elif action == 'country':
+            options = self.props['country-dropdown']['options']
+            self.set_prop('country-dropdown', 'value', self.rng.choice(options)['value'])
+        elif action == 'map':
+            slider = self.props['map-date-slider']
+            self.set_prop('map-date-slider', 'value', self.rng.randint(slider['min'], slider['max']))
+        elif action == 'zoom':
+            graphs = [
+                id_key(component_id)
+                for callback, _, inputs, _ in self.instances()
+                for component_id, prop in inputs if prop == 'relayoutData'
+            ]
+            if not graphs:
+                return
+            start = ZOOM_START + self.rng.randint(0, 300)
+            stop = start + self.rng.randint(14, 120)
+            self.set_prop(self.rng.choice(graphs), 'relayoutData', {
+                'xaxis.range[0]': str(start), 'xaxis.range[1]': str(stop)})
+
+
+def run_sessions(url, recorder, deadline, actions, think, seed):
+    """
+        Run sessions one after another until deadline, return number of
+        sessions and of interactions
+    """
+
+    rng = random.Random(seed)
+    client = Client(url, recorder)
+    n_sessions = n_actions = 0
+    while time.time() < deadline:
+        session = Session(client, rng)
+        if not session.load():
+            time.sleep(1)
+            continue
+        n_sessions += 1
+        for _ in range(actions):
+            if time.time() >= deadline:
+                break
+            time.sleep(think)
+            session.act()
+            n_actions += 1
+    return n_sessions, n_actions
+
+
+def wait_ready(url, process, timeout):
+    parts = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError('gunicorn exited with status {}'.format(process.returncode))
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+            connection.request('GET', parts.path.rstrip('/') + '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(1)
+    raise RuntimeError('server at {} is not ready after {}s'.format(url, timeout))
+
+
+def start_server(port, workers, threads, preload):
+    """
+        Start gunicorn with index:server in the root of the repo, the
+        environment is passed on to the app
+    """
+
+    command = [
+        sys.executable, '-m', 'gunicorn', 'index:server',
+        '--bind', '127.0.0.1:{}'.format(port),
+        '--workers', str(workers),
+        '--threads', str(threads),
+        '--timeout', '300',
+    ]
+    if preload:
+        command.append('--preload')
+    return subprocess.Popen(command, cwd=ROOT)
+
+
+def print_results(results):
+    print('{:<40} {:>8} {:>6} {:>9} {:>9} {:>9} {:>9} {:>10}'.format(
+        'request', 'count', 'errors', 'p50, ms', 'p95, ms', 'p99, ms', 'KiB/req', 'MiB total'))
+    for name, result in results.items():
+        if name == 'total':
+            continue
+        print('{:<40} {:>8} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.2f}'.format(
+            name[:40], result['requests'], result['errors'],
+            result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['bytes'] / result['requests'] / 1024, result['bytes'] / 2 ** 20))
+    total = results['total']
+    print('{} requests, {} errors in {:.1f}s: {:.1f} requests/s, {:.2f} MiB transferred'.format(
+        total['requests'], total['errors'], total['seconds'],
+        total['requests_per_second'], total['bytes'] / 2 ** 20))
+    print('{} sessions, {} interactions: {:.1f} interactions/s'.format(
+        total['sessions'], total['actions'], total['actions'] / total['seconds']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='test a running server instead of starting gunicorn')
+    parser.add_argument('--port', type=int, default=8051)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--preload', action='store_true', help='start gunicorn with --preload')
+    parser.add_argument('--concurrency', type=int, default=8, help='simultaneous sessions')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load')
+    parser.add_argument('--actions', type=int, default=20,
+                        help='interactions of a session before the page is loaded again')
+    parser.add_argument('--think', type=float, default=0, help='seconds between interactions')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--startup-timeout', type=float, default=600)
+    parser.add_argument('--save', help='write results to json file')
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        url = 'http://127.0.0.1:{}'.format(args.port)
+        process = start_server(args.port, args.workers, args.threads, args.preload)
+    try:
+        wait_ready(url, process, args.startup_timeout)
+        recorder = Recorder()
+        started = time.time()
+        deadline = started + args.duration
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            counts = list(executor.map(
+                lambda i: run_sessions(url, recorder, deadline, args.actions, args.think, args.seed + i),
+                range(args.concurrency)))
+        results = recorder.results(time.time() - started)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(30)
+
+    results['total']['sessions'] = sum(sessions for sessions, _ in counts)
+    results['total']['actions'] = sum(actions for _, actions in counts)
+    print_results(results)
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+    Benchmark of get_processed_df against the previous row-wise
+    implementation on synthetic data with a growing number of date columns.
+
+    Run from the root of the repo with
+
+        python benchmarks/processed_df.py
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layouts  # noqa: E402
+import reference  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def legacy_get_processed_df(metric_csv):
+    """
+        Implementation of get_processed_df before vectorization
+    """
+
+    source_df = pd.read_csv(metric_csv)
+    source_df.drop(columns=['Province/State'], inplace=True)
+    source_df.rename(columns={'Country/Region': 'country'}, inplace=True)
+    processed_df = source_df.drop(columns=['Lat', 'Long'])
+    source_df = source_df[['country', 'Lat', 'Long']].drop_duplicates('country')
+    processed_df = processed_df.melt(
+        id_vars='country',
+        var_name='date',
+        value_name='value'
+    )
+
+    centroid_df = pd.read_csv(
+        reference.COUNTRIES_COORDINATES_CSV, usecols=['admin', 'Longitude', 'Latitude'])
+
+    centroid_df.columns = ['country', 'Longitude', 'Latitude']
+    processed_df['date'] = pd.to_datetime(processed_df['date'])
+    processed_df = processed_df.groupby(['country', 'date']).value.sum().reset_index()
+    processed_df['prev_value'] = processed_df.groupby('country').value.shift(1)
+    processed_df['new_cases'] = processed_df.value - processed_df.prev_value
+    processed_df.fillna(value={'new_cases': 0}, inplace=True)
+    processed_df.drop(columns=['prev_value'], inplace=True)
+
+    processed_df = processed_df.merge(centroid_df, how='left', on='country')
+    processed_df = processed_df.merge(source_df, how='left', on='country')
+
+    processed_df['Lat'] = processed_df.apply(
+        lambda x: x['Latitude'] if pd.notna(x['Latitude']) else x['Lat'], axis=1)
+    processed_df['Long'] = processed_df.apply(
+        lambda x: x['Longitude'] if pd.notna(x['Longitude']) else x['Long'], axis=1)
+
+    processed_df.drop(columns=['Latitude', 'Longitude'], inplace=True)
+
+    return processed_df
+
+
+def timeit(func, csv, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(io.StringIO(csv))
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, nargs='+', default=[50, 100, 200, 400, 800])
+    parser.add_argument('--countries', type=int, default=190)
+    parser.add_argument('--provinces', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>6} {:>10} {:>12} {:>12} {:>9} {:>14} {:>14}'.format(
+        'days', 'rows', 'legacy, s', 'current, s', 'speedup',
+        'legacy, KiB', 'current, KiB'))
+    for n_days in args.days:
+        csv = synthetic.make_source_df(
+            args.countries, args.provinces, n_days).to_csv(index=False)
+        legacy_time, legacy_df = timeit(legacy_get_processed_df, csv, args.repeat)
+        current_time, current_df = timeit(layouts.get_processed_df, csv, args.repeat)
+        # coordinates are float32 in the compact frame
+        pd.testing.assert_frame_equal(
+            layouts.expand_processed_df(current_df), legacy_df,
+            check_dtype=False)
+        legacy_bytes = legacy_df.memory_usage(index=True, deep=True).sum()
+        current_bytes = layouts.get_memory_report(current_df)['total']
+        print('{:>6} {:>10} {:>12.3f} {:>12.3f} {:>8.1f}x {:>14.1f} {:>14.1f}'.format(
+            n_days, len(current_df), legacy_time, current_time,
+            legacy_time / current_time, legacy_bytes / 1024, current_bytes / 1024))
+
+
+if __name__ == '__main__':
+    main()
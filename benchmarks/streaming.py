@@ -0,0 +1,78 @@
+"""
+    Benchmark of streaming ingestion against get_processed_df on tall and
+    wide synthetic files, e.g. of the size of the US county files.
+
+    Run from the root of the repo with
+
+        python benchmarks/streaming.py --countries 60 --provinces 50 --days 1000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import layouts  # noqa: E402
+import streaming  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def measure(func, content):
+    """
+        Return seconds, peak traced memory and result of func on a fresh
+        file object of a copy of content
+    """
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    # copied while tracing, like the download held by load_processed_df()
+    source = io.BytesIO()
+    source.write(content)
+    source.seek(0)
+    result = func(source)
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--countries', type=int, default=60)
+    parser.add_argument('--provinces', type=int, default=50)
+    parser.add_argument('--days', type=int, default=1000)
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[500, 2000])
+    parser.add_argument('--chunk-columns', type=int, nargs='+', default=[0, 250])
+    args = parser.parse_args()
+
+    content = synthetic.make_source_df(
+        args.countries, args.provinces, args.days).to_csv(index=False).encode()
+    print('source: {:.1f} MiB'.format(len(content) / 2 ** 20))
+
+    print('{:<24} {:>10} {:>16} {:>18}'.format(
+        'path', 'seconds', 'traced peak, MiB', 'estimated peak, MiB'))
+    seconds, peak, expected = measure(layouts.get_processed_df, content)
+    print('{:<24} {:>10.3f} {:>16.1f} {:>18}'.format(
+        'get_processed_df', seconds, peak / 2 ** 20, ''))
+
+    for chunk_rows in args.chunk_rows:
+        for chunk_columns in args.chunk_columns:
+            report = {}
+            seconds, peak, result = measure(
+                lambda source: streaming.get_processed_df(
+                    source, report, chunk_rows, chunk_columns),
+                content)
+            pd.testing.assert_frame_equal(result, expected)
+            pd.testing.assert_frame_equal(result.attrs['coords'], expected.attrs['coords'])
+            print('{:<24} {:>10.3f} {:>16.1f} {:>18.1f}'.format(
+                'streaming {}x{}'.format(chunk_rows, chunk_columns or 'all'),
+                seconds, peak / 2 ** 20, report['estimated_peak_bytes'] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
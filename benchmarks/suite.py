@@ -0,0 +1,271 @@
+"""
+    Benchmark suite of the ingestion and rendering pipeline.
+
+    Times every stage on synthetic data, tracks its peak memory and the
+    serialized size of rendered figures and layouts. Results can be saved
+    and compared against a saved baseline, e.g.
+
+        python benchmarks/suite.py --save baseline.json
+        python benchmarks/suite.py --baseline baseline.json
+
+    The comparison exits with status 1 if any stage regressed.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plotly.utils import PlotlyJSONEncoder  # noqa: E402
+
+import compare as comparison  # noqa: E402
+import indicators  # noqa: E402
+import layouts  # noqa: E402
+import mapframes  # noqa: E402
+import refresh  # noqa: E402
+import skeleton  # noqa: E402
+import store  # noqa: E402
+import synthetic  # noqa: E402
+import views  # noqa: E402
+
+# timing differences below this are noise, not regressions
+MIN_SECONDS_DELTA = 0.005
+
+
+def measure(func, repeat):
+    """
+        Return best time of repeat runs, peak traced memory of one run and
+        result of func()
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak, result
+
+
+def payload_size(obj):
+    return len(json.dumps(obj, cls=PlotlyJSONEncoder).encode())
+
+
+def run_suite(data_dir, repeat):
+    """
+        Run all benchmarks on source files in data_dir
+
+        Return
+        ------
+
+        dict
+            Results by stage with keys ['seconds', 'peak_bytes'] and
+            'payload_bytes' for rendering stages
+    """
+
+    results = {}
+
+    def bench(name, func, payload=False):
+        seconds, peak, result = measure(func, repeat)
+        results[name] = {'seconds': seconds, 'peak_bytes': peak}
+        if payload:
+            results[name]['payload_bytes'] = payload_size(result)
+        return result
+
+    frames = {}
+    for metric in synthetic.METRICS:
+        path = os.path.join(data_dir, synthetic.FILE_NAME.format(metric))
+        frames[metric] = bench(
+            'get_processed_df[{}]'.format(metric),
+            lambda: layouts.get_processed_df(path)
+        )
+
+    confirmed_df = frames['confirmed']
+    country = confirmed_df.country.iloc[0]
+
+    # first call builds the metric store of a frame
+    bench('get_metric_ser[cold]', lambda: layouts.get_metric_ser(
+        confirmed_df.copy(), 'cumulative', country))
+
+    def get_all_series():
+        series = {}
+        for metric, df in frames.items():
+            for metric_type in ('cumulative', 'new'):
+                series[metric, metric_type, None] = layouts.get_metric_ser(
+                    df, metric_type)
+                series[metric, metric_type, country] = layouts.get_metric_ser(
+                    df, metric_type, country)
+        return series
+
+    series = bench('get_metric_ser[12 warm]', get_all_series)
+
+    def get_series(metric_type, selected_country):
+        return [
+            series[metric, metric_type, selected_country]
+            for metric in synthetic.METRICS
+        ]
+
+    stores = {metric: store.get_store(df) for metric, df in frames.items()}
+    stores[indicators.STORE_NAME] = bench(
+        'build_indicators', lambda: indicators.build_store(stores))
+    indicator_sers = {
+        (metric_type, selected_country): layouts.get_indicator_sers(
+            stores, metric_type, selected_country)
+        for metric_type in ('cumulative', 'new')
+        for selected_country in (None, country)
+    }
+
+    countries = list(stores['confirmed'].countries)
+    for n_countries in (1, comparison.COMPARE_MAX_COUNTRIES):
+        bench('build_comparison[{}]'.format(n_countries),
+              lambda: comparison.build_comparison(
+                  stores, countries[:n_countries], 'new_confirmed_mean7', 'aligned'))
+
+    bench('render_map_chart', lambda: layouts.render_map_chart(confirmed_df),
+          payload=True)
+    map_frames = bench('build_map_frames',
+                       lambda: mapframes.build_map_frames(confirmed_df))
+    bench('render_map_content', lambda: mapframes.render_map_content(map_frames),
+          payload=True)
+    bench('get_key_metrics_fig', lambda: layouts.get_key_metrics_fig(
+        *get_series('cumulative', None), 'cumulative'), payload=True)
+
+    bench('render_country_cumulative_content',
+          lambda: layouts.render_country_cumulative_content(
+              *get_series('cumulative', country),
+              indicator_sers['cumulative', country]),
+          payload=True)
+    bench('render_country_new_content',
+          lambda: layouts.render_country_new_content(
+              *get_series('new', country), indicator_sers['new', country]),
+          payload=True)
+    map_content = mapframes.render_map_content(map_frames)
+    bench('render_global_cumulative_content',
+          lambda: layouts.render_global_cumulative_content(
+              *get_series('cumulative', None),
+              indicator_sers['cumulative', None], map_content),
+          payload=True)
+    bench('render_global_new_content',
+          lambda: layouts.render_global_new_content(
+              *get_series('new', None), indicator_sers['new', None]),
+          payload=True)
+
+    # content skeleton sends traces of the charts instead of the layout
+    snapshot = refresh.Snapshot(
+        version='suite', created_at=time.time(), frames=frames, stores=stores,
+        map_frames=map_frames, layouts={})
+
+    def get_country_figures(metric_type, selected_country=country, province=None):
+        views.chart_cache.clear()
+        views.country_layout_cache.clear()
+        return [views.get_key_metrics_traces(
+            snapshot, metric_type, selected_country, province)] + [
+            skeleton.get_slot_data(snapshot, chart, selected_country, province)
+            for chart in skeleton.SLOT_CHARTS[metric_type]
+        ]
+
+    for metric_type in ('cumulative', 'new'):
+        bench('get_country_figures[{}]'.format(metric_type),
+              lambda: get_country_figures(metric_type), payload=True)
+
+    # provinces missing from recovered cases, like the ones of Canada
+    # in the JHU files, render with no data for recovered cases
+    split_countries = [
+        name for name in countries
+        if stores['confirmed'].get_provinces(name) and not stores['recovered'].get_provinces(name)
+    ]
+    if split_countries:
+        split_country = split_countries[0]
+        province = stores['confirmed'].get_provinces(split_country)[0]
+        for metric_type in ('cumulative', 'new'):
+            bench('render_province_layout[{}]'.format(metric_type),
+                  lambda: layouts.render_country_layout(
+                      stores, split_country, metric_type, province))
+            bench('get_province_figures[{}]'.format(metric_type),
+                  lambda: get_country_figures(metric_type, split_country, province),
+                  payload=True)
+    bench('get_templates', skeleton.get_templates, payload=True)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+        Print results next to baseline, return names of regressed stages
+    """
+
+    regressed = []
+    print('{:<36} {:>10} {:>8} {:>12} {:>8} {:>12} {:>8}'.format(
+        'stage', 'seconds', 'ratio', 'peak, KiB', 'ratio', 'payload, KiB', 'ratio'))
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        row = [name]
+        for key, scale in (('seconds', 1), ('peak_bytes', 1024), ('payload_bytes', 1024)):
+            value = result.get(key)
+            base_value = base.get(key)
+            if value is None:
+                row += ['', '']
+                continue
+            row.append('{:.4f}'.format(value) if scale == 1 else '{:.1f}'.format(value / scale))
+            if not base_value:
+                row.append('')
+                continue
+            ratio = value / base_value
+            row.append('{:.2f}'.format(ratio))
+            noise = key == 'seconds' and value - base_value < MIN_SECONDS_DELTA
+            if ratio > 1 + tolerance and not noise:
+                regressed.append('{} {}'.format(name, key))
+        print('{:<36} {:>10} {:>8} {:>12} {:>8} {:>12} {:>8}'.format(*row))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--countries', type=int, default=190)
+    parser.add_argument('--provinces', type=int, default=1)
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write results to json file')
+    parser.add_argument('--baseline', help='compare with results saved earlier')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative growth over baseline, default 0.2')
+    args = parser.parse_args()
+
+    params = {
+        'countries': args.countries,
+        'provinces': args.provinces,
+        'days': args.days,
+    }
+    with tempfile.TemporaryDirectory() as data_dir:
+        synthetic.write_sources(data_dir, args.countries, args.provinces, args.days)
+        results = run_suite(data_dir, args.repeat)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            saved = json.load(baseline_file)
+        if saved['params'] != params:
+            print('warning: baseline was run with {}'.format(saved['params']))
+        baseline = saved['results']
+    regressed = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump({'params': params, 'results': results}, save_file, indent=2)
+
+    if regressed:
+        print('regressions: {}'.format(', '.join(regressed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
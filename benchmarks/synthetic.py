@@ -0,0 +1,149 @@
+"""
+    Generator of synthetic time series csv files in JHU format.
+
+    Write files usable as OFFLINE_DATA_DIR with
+
+        python benchmarks/synthetic.py DIRECTORY --countries 190 --days 400
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import reference  # noqa: E402
+
+METRICS = ['confirmed', 'recovered', 'deaths']
+
+FILE_NAME = 'time_series_covid19_{}_global.csv'
+
+# daily growth rate of every metric, relative to confirmed
+METRIC_RATES = {
+    'confirmed': 1.0,
+    'recovered': 0.8,
+    'deaths': 0.03,
+}
+
+# position of a country split into provinces in all metrics but recovered,
+# which reports it as one country row like Canada in the JHU files
+SPLIT_COUNTRY = 1
+
+SPLIT_PROVINCES = 2
+
+
+def make_source_df(n_countries=190, provinces=1, n_days=400, metric='confirmed',
+                   unknown_every=10, seed=0):
+    """
+        Return synthetic source DataFrame in JHU format
+
+        Parameters
+        ----------
+
+        n_countries : int
+            Number of countries, named after the centroid file
+
+        provinces : int
+            Number of provinces of every country, 1 means country level rows
+            except for SPLIT_COUNTRY
+
+        n_days : int
+            Number of date columns starting from 2020-01-22
+
+        metric : str
+            One of ['confirmed', 'recovered', 'deaths']
+
+        unknown_every : int
+            Every n-th country gets a name unknown to the centroid file,
+            0 disables unknown countries
+
+        seed : int
+            Seed of the random generator, equal seeds give equal files
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Columns ['Province/State', 'Country/Region', 'Lat', 'Long'] and
+            one column per date like '1/22/20'
+    """
+
+    rng = np.random.RandomState(seed)
+    known = reference.get_reference().names
+    rows = []
+    for i in range(n_countries):
+        if i < len(known) and not (unknown_every and i % unknown_every == 0):
+            country = known[i]
+        else:
+            country = 'Unknown {}'.format(i)
+        if provinces > 1 or i == SPLIT_COUNTRY:
+            country_provinces = [
+                'Province {}'.format(j) for j in range(max(provinces, SPLIT_PROVINCES))]
+        else:
+            country_provinces = [np.nan]
+        for province in country_provinces:
+            rows.append((province, country, rng.uniform(-60, 60), rng.uniform(-180, 180)))
+    source_df = pd.DataFrame(
+        rows, columns=['Province/State', 'Country/Region', 'Lat', 'Long'])
+
+    # same confirmed curve for every metric of a seed, scaled down by metric
+    daily = rng.poisson(20, size=(len(source_df), n_days))
+    rate_rng = np.random.RandomState(seed + METRICS.index(metric) + 1)
+    daily = rate_rng.binomial(daily, METRIC_RATES[metric])
+    values = daily.cumsum(axis=1)
+
+    dates = pd.date_range('2020-01-22', periods=n_days)
+    date_columns = ['{}/{}/{}'.format(d.month, d.day, d.strftime('%y')) for d in dates]
+    source_df = pd.concat(
+        [source_df, pd.DataFrame(values, columns=date_columns)], axis=1)
+    if metric == 'recovered' and n_countries > SPLIT_COUNTRY:
+        split = source_df['Country/Region'] == source_df['Country/Region'].unique()[SPLIT_COUNTRY]
+        country_row = source_df[split].iloc[:1].copy()
+        country_row[date_columns] = source_df.loc[split, date_columns].sum().values
+        country_row['Province/State'] = np.nan
+        source_df = pd.concat(
+            [source_df[~split], country_row]).sort_index().reset_index(drop=True)
+    return source_df
+
+
+def write_sources(directory, n_countries=190, provinces=1, n_days=400, seed=0):
+    """
+        Write confirmed, recovered and deaths csv files to directory
+
+        Return
+        ------
+
+        dict
+            Paths of written files by metric
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for metric in METRICS:
+        paths[metric] = os.path.join(directory, FILE_NAME.format(metric))
+        make_source_df(
+            n_countries, provinces, n_days, metric, seed=seed
+        ).to_csv(paths[metric], index=False)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('directory')
+    parser.add_argument('--countries', type=int, default=190)
+    parser.add_argument('--provinces', type=int, default=1)
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_sources(
+        args.directory, args.countries, args.provinces, args.days, args.seed)
+    for path in paths.values():
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,18 @@
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, MATCH
+from dash.exceptions import PreventUpdate
 
-from app import app
+from app import app, CONTENT_MODE, SWITCH_MODE
+import compare
+import downsample
+import instrumentation
+import layouts
+import mapframes
+import refresh
+import views
 
 
 # determine which button is pressed
-@app.callback(
-    [Output('cum_button', 'style'),
-     Output('new_cases_button', 'style')],
-    [Input('cum_button', 'n_clicks_timestamp'),
-     Input('new_cases_button', 'n_clicks_timestamp')]
-)
+@instrumentation.timed_callback
 def set_active_button_color(btn1, btn2):
     active = {'backgroundColor': '#008CBA', 'color': 'white'}
     passive = {'backgroundColor': '#e7e7e7', 'color': 'black'}
@@ -17,3 +20,162 @@ def set_active_button_color(btn1, btn2):
         return (active, passive)
     else:
         return (passive, active)
+
+
+button_color_outputs = [Output('cum_button', 'style'),
+                        Output('new_cases_button', 'style')]
+button_color_inputs = [Input('cum_button', 'n_clicks_timestamp'),
+                       Input('new_cases_button', 'n_clicks_timestamp')]
+
+if SWITCH_MODE == 'client':
+    app.clientside_callback(
+        """
+        function(btn1, btn2) {
+            var active = {'backgroundColor': '#008CBA', 'color': 'white'};
+            var passive = {'backgroundColor': '#e7e7e7', 'color': 'black'};
+            if (Number(btn1) > Number(btn2)) {
+                return [active, passive];
+            }
+            return [passive, active];
+        }
+        """,
+        button_color_outputs,
+        button_color_inputs
+    )
+else:
+    app.callback(button_color_outputs, button_color_inputs)(set_active_button_color)
+
+
+# list provinces of the selected country, hidden for undivided countries
+@app.callback(
+    [Output('province-dropdown', 'options'),
+     Output('province-dropdown', 'value'),
+     Output('province-selector', 'style')],
+    [Input('country-dropdown', 'value')]
+)
+@instrumentation.timed_callback
+def update_province_dropdown(country):
+    provinces = layouts.get_provinces(refresh.get_snapshot().stores, country)
+    options = [{'label': province, 'value': province} for province in provinces]
+    style = {'width': 300, 'margin': '0 auto 10px'}
+    if not provinces:
+        style['display'] = 'none'
+    return options, None, style
+
+
+# overlay selected countries on the comparison tab
+@app.callback(
+    Output('compare-graph', 'figure'),
+    [Input('compare-countries', 'value'),
+     Input('compare-chart', 'value'),
+     Input('compare-mode', 'value'),
+     Input('compare-threshold', 'value')]
+)
+@instrumentation.timed_callback
+def update_comparison(countries, chart, mode, threshold):
+    if chart is None or mode is None:
+        raise PreventUpdate
+    if not threshold or threshold < 1:
+        threshold = compare.DEFAULT_THRESHOLD
+    return views.get_comparison_figure(
+        refresh.get_snapshot(), countries or [], chart, mode, threshold)
+
+
+# fetch requested map frame together with its neighbours
+@app.callback(
+    Output('map-frame-store', 'data'),
+    [Input('map-date-slider', 'value')]
+)
+@instrumentation.timed_callback
+def fetch_map_frames(index):
+    map_frames = refresh.get_snapshot().map_frames
+    if map_frames is None or index is None:
+        raise PreventUpdate
+    index = min(int(index), len(map_frames.traces) - 1)
+    return mapframes.get_prefetched_traces(map_frames, index)
+
+
+# replace points of a zoomed series graph with points of the visible window
+@instrumentation.timed_callback
+def zoom_series_graph(relayout_data, figure, graph_id):
+    if figure is None:
+        raise PreventUpdate
+    chart = views.get_chart(
+        refresh.get_snapshot(), graph_id['chart'], graph_id['country'],
+        graph_id.get('province'))
+    window = downsample.get_window(relayout_data, chart.dates)
+    if window is None:
+        raise PreventUpdate
+    positions = downsample.select(chart.pyramid, *window)
+    x = chart.dates[positions]
+    data = [
+        dict(trace, x=x, y=values[positions])
+        for trace, values in zip(figure['data'], chart.values)
+    ]
+    return dict(figure, data=data)
+
+
+# graphs of the content skeleton are zoomed by their slot callbacks
+if downsample.DOWNSAMPLE_MODE == 'adaptive' and CONTENT_MODE == 'layout':
+    series_graph = {
+        'type': downsample.GRAPH_TYPE, 'chart': MATCH, 'country': MATCH, 'province': MATCH}
+    app.callback(
+        Output(series_graph, 'figure'),
+        [Input(series_graph, 'relayoutData')],
+        [State(series_graph, 'figure'),
+         State(series_graph, 'id')]
+    )(zoom_series_graph)
+
+
+# draw map frame from the store, waits for the store if it is not fetched yet
+app.clientside_callback(
+    """
+    function(index, traces, figure, dates) {
+        var trace = traces && traces[String(index)];
+        if (!trace) {
+            return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+        }
+        return [{'data': [trace], 'layout': figure.layout}, dates[index]];
+    }
+    """,
+    [Output('map-graph', 'figure'),
+     Output('map-date-label', 'children')],
+    [Input('map-date-slider', 'value'),
+     Input('map-frame-store', 'data')],
+    [State('map-graph', 'figure'),
+     State('map-frame-dates', 'data')]
+)
+
+
+# start and pause map playback
+app.clientside_callback(
+    """
+    function(n_clicks) {
+        var playing = n_clicks % 2 === 1;
+        return [!playing, playing ? 'Pause' : 'Play'];
+    }
+    """,
+    [Output('map-interval', 'disabled'),
+     Output('map-play-button', 'children')],
+    [Input('map-play-button', 'n_clicks')]
+)
+
+
+# advance map slider during playback once the next frame is prefetched
+app.clientside_callback(
+    """
+    function(n_intervals, index, max_index, traces) {
+        var next = index >= max_index ? 0 : index + 1;
+        // restart from the first frame even if it is not prefetched
+        if (next !== 0 && (!traces || !traces[String(next)])) {
+            return window.dash_clientside.no_update;
+        }
+        return next;
+    }
+    """,
+    Output('map-date-slider', 'value'),
+    [Input('map-interval', 'n_intervals')],
+    [State('map-date-slider', 'value'),
+     State('map-date-slider', 'max'),
+     State('map-frame-store', 'data')]
+)
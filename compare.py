@@ -0,0 +1,239 @@
+"""
+    Comparison of several countries on one chart.
+
+    Series of all selected countries are taken from the metric stores as one
+    country x date matrix, so scaling per capita and aligning countries by
+    the day of their Nth case are matrix operations and every further
+    country adds one row only.
+"""
+import os
+
+import dash_core_components as dcc
+import dash_html_components as html
+import numpy as np
+import pandas as pd
+
+import indicators
+
+# maximum number of countries drawn on the comparison chart
+COMPARE_MAX_COUNTRIES = int(os.environ.get('COMPARE_MAX_COUNTRIES', 10))
+
+DEFAULT_COUNTRIES = ['Russia', 'Italy', 'Germany']
+
+DEFAULT_CHART = 'new_confirmed_mean7'
+
+# cumulative confirmed cases which start day 0 in aligned mode
+DEFAULT_THRESHOLD = 100
+
+# chart names as in layouts.get_chart_series() and their titles
+CHARTS = [
+    ('confirmed', 'Confirmed Cases'),
+    ('recovered', 'Recovered'),
+    ('active', 'Active'),
+    ('deaths', 'Deaths'),
+    ('new_confirmed', 'New Cases'),
+    ('new_confirmed_mean7', 'New Cases, avg for the last 7 days'),
+    ('new_recovered', 'New Recovered'),
+    ('new_deaths', 'New Deaths'),
+    ('new_deaths_mean7', 'New Deaths, avg for the last 7 days'),
+]
+
+MODES = [
+    ('absolute', 'Absolute'),
+    ('per_capita', 'Per 100k population'),
+    ('aligned', 'Days since Nth case'),
+]
+
+
+def get_chart_store(stores, chart):
+    """
+        Return metric store of a chart and key of its matrix in the store
+
+        Parameters
+        ----------
+
+        stores : dict
+            store.MetricStore of every processed frame and of indicators
+
+        chart : str
+            One of the chart names of CHARTS
+
+
+        Return
+        ------
+
+        tuple
+            (store.MetricStore, metric type or indicator name)
+    """
+
+    metric_type = 'new' if chart.startswith('new_') else 'cumulative'
+    name = chart[len('new_'):] if metric_type == 'new' else chart
+    if name in stores:
+        return stores[name], metric_type
+    return stores[indicators.STORE_NAME], chart
+
+
+def align_rows(matrix, starts):
+    """
+        Shift every row of matrix left to start at its position in starts,
+        positions after the end of a row are NaN
+    """
+
+    n_dates = matrix.shape[1]
+    positions = starts[:, np.newaxis] + np.arange(n_dates)
+    valid = positions < n_dates
+    aligned = np.take_along_axis(matrix, np.minimum(positions, n_dates - 1), axis=1)
+    aligned[~valid] = np.nan
+    return aligned
+
+
+def build_comparison(stores, countries, chart, mode, threshold=DEFAULT_THRESHOLD):
+    """
+        Return series of the comparison chart
+
+        Parameters
+        ----------
+
+        stores : dict
+            store.MetricStore of every processed frame and of indicators
+
+        countries : list
+            Selected countries, unknown ones and those over
+            COMPARE_MAX_COUNTRIES are dropped
+
+        chart : str
+            One of the chart names of CHARTS
+
+        mode : str
+            One of ['absolute', 'per_capita', 'aligned']
+
+        threshold : int
+            Cumulative confirmed cases starting day 0 in aligned mode
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Column per country indexed by date, or by days since the Nth
+            case in aligned mode. Countries which have not reached the
+            threshold are dropped in aligned mode.
+    """
+
+    base = stores['confirmed']
+    chart_store, key = get_chart_store(stores, chart)
+    countries = [
+        country for country in countries
+        if (country, '') in base.region_pos and (country, '') in chart_store.region_pos
+    ][:COMPARE_MAX_COUNTRIES]
+    # one batched extraction for all countries
+    matrix = chart_store.get_rows(key, countries).astype('float64')
+    index = chart_store.dates
+
+    if mode == 'per_capita':
+        regions = pd.MultiIndex.from_arrays(
+            [countries, [''] * len(countries)], names=['country', 'province'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            matrix = matrix * 1e5 / indicators.get_population(regions)
+    elif mode == 'aligned':
+        reached = base.get_rows('cumulative', countries) >= threshold
+        has_reached = reached.any(axis=1)
+        countries = [country for country, keep in zip(countries, has_reached) if keep]
+        starts = reached[has_reached].argmax(axis=1)
+        matrix = align_rows(matrix[has_reached], starts)
+        # the country which reached the threshold first has the longest series
+        n_days = matrix.shape[1] - int(starts.min()) if len(starts) else 0
+        matrix = matrix[:, :n_days]
+        index = pd.RangeIndex(n_days, name='day')
+
+    return pd.DataFrame(matrix.T, index=index, columns=countries)
+
+
+def render_comparison_figure(comparison_df, chart, mode, threshold=DEFAULT_THRESHOLD):
+    """
+        Return figure with a line per country of build_comparison() result
+    """
+
+    title = dict(CHARTS)[chart]
+    if mode == 'per_capita':
+        title = '{} per 100k population'.format(title)
+    xaxis = {}
+    if mode == 'aligned':
+        xaxis['title'] = 'Days since {} confirmed cases'.format(threshold)
+
+    return {
+        'data': [
+            {
+                'x': comparison_df.index,
+                'y': comparison_df[country].values,
+                'type': 'line',
+                'name': country,
+            }
+            for country in comparison_df.columns
+        ],
+        'layout': {
+            'plot_bgcolor': '#FFFFFF',
+            'paper_bgcolor': '#FFFFFF',
+            'legend': {
+                'orientation': 'h',
+                'x': 0.5,
+                'xanchor': 'center',
+            },
+            'title': {
+                'text': title,
+                'font': {
+                    'size': 24,
+                }
+            },
+            'xaxis': xaxis,
+        }
+    }
+
+
+def render_compare_layout(countries):
+    """
+        Return controls and graph of the comparison tab. Controls keep their
+        values while the tab is rendered again.
+
+        Parameter
+        ---------
+
+        countries : list
+            Countries offered for comparison
+    """
+
+    return html.Div([
+        html.Div([
+            dcc.Dropdown(
+                id='compare-countries',
+                options=[{'label': country, 'value': country} for country in countries],
+                value=[country for country in DEFAULT_COUNTRIES if country in countries],
+                multi=True,
+                placeholder='Up to {} countries'.format(COMPARE_MAX_COUNTRIES),
+                persistence=True
+            ),
+            dcc.Dropdown(
+                id='compare-chart',
+                options=[{'label': title, 'value': chart} for chart, title in CHARTS],
+                value=DEFAULT_CHART,
+                clearable=False,
+                persistence=True
+            ),
+            dcc.RadioItems(
+                id='compare-mode',
+                options=[{'label': title, 'value': mode} for mode, title in MODES],
+                value='absolute',
+                labelStyle={'display': 'inline-block', 'marginRight': 10},
+                persistence=True
+            ),
+            dcc.Input(
+                id='compare-threshold',
+                type='number',
+                min=1,
+                value=DEFAULT_THRESHOLD,
+                debounce=True,
+                persistence=True
+            ),
+        ], style={'width': 600, 'margin': '10px auto'}),
+        dcc.Graph(id='compare-graph'),
+    ])
@@ -0,0 +1,195 @@
+"""
+    Adaptive resolution of time series charts.
+
+    Charts are shipped downsampled with Largest-Triangle-Three-Buckets to
+    about DOWNSAMPLE_POINTS points, roughly one bar per a few pixels of the
+    plot width. Zooming fetches the points of the visible window from a
+    pyramid of LTTB samples at halving resolutions, down to every daily
+    point once the window is small enough.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# 'adaptive' downsamples series charts, 'full' ships every point
+DOWNSAMPLE_MODE = os.environ.get('DOWNSAMPLE_MODE', 'adaptive')
+
+# points of a series shipped for the visible window
+DOWNSAMPLE_POINTS = int(os.environ.get('DOWNSAMPLE_POINTS', 300))
+
+# type of pattern-matching ids of series graphs
+GRAPH_TYPE = 'series-graph'
+
+
+def graph_id(chart, country=None, province=None):
+    """
+        Return pattern-matching id of a series graph
+
+        Parameters
+        ----------
+
+        chart : str
+            Chart name as in layouts.get_chart_series()
+
+        country : str
+            Country name, None for worldwide charts
+
+        province : str
+            Province name, None for whole countries
+    """
+
+    return {
+        'type': GRAPH_TYPE,
+        'chart': chart,
+        'country': country or '',
+        'province': province or '',
+    }
+
+
+def lttb(y, n_out):
+    """
+        Return positions of n_out points of y selected with
+        Largest-Triangle-Three-Buckets. Points are assumed to be equally
+        spaced, the first and the last point are always kept.
+
+        Parameters
+        ----------
+
+        y : numpy.ndarray
+            Series values, NaN counts as 0 when points are compared
+
+        n_out : int
+            Number of points to keep
+
+
+        Return
+        ------
+
+        numpy.ndarray
+            Sorted positions of selected points
+    """
+
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:n_out]
+
+    y = np.nan_to_num(np.asarray(y, dtype='float64'))
+    x = np.arange(n, dtype='float64')
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+
+    selected = np.empty(n_out, dtype='int64')
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_stop = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_stop = n - 1, n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        # twice the area of triangles (a, candidate, next bucket average)
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a])
+            - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def build_pyramid(y, n_points=DOWNSAMPLE_POINTS):
+    """
+        Return LTTB samples of y at halving resolutions, from every point
+        down to at most n_points points
+
+        Return
+        ------
+
+        list
+            Sorted position arrays, finest first
+    """
+
+    levels = [np.arange(len(y))]
+    while len(levels[-1]) > n_points:
+        levels.append(lttb(y, max(len(levels[-1]) // 2, min(n_points, 3))))
+    return levels
+
+
+def select(pyramid, start, stop, n_points=DOWNSAMPLE_POINTS):
+    """
+        Return positions of points between start and stop from the finest
+        level with at most n_points of them, plus a neighbour on every side
+        so lines continue past the window edges
+
+        Parameters
+        ----------
+
+        pyramid : list
+            Levels returned by build_pyramid()
+
+        start, stop : int
+            Window of positions, stop is exclusive
+    """
+
+    for positions in pyramid:
+        lo = np.searchsorted(positions, start)
+        hi = np.searchsorted(positions, stop)
+        if hi - lo <= n_points:
+            break
+    return positions[max(lo - 1, 0):hi + 1]
+
+
+def downsample(x, ys, n_points=DOWNSAMPLE_POINTS):
+    """
+        Return x and every series of ys downsampled at points selected on
+        the first series
+    """
+
+    positions = select(build_pyramid(ys[0], n_points), 0, len(x), n_points)
+    return x[positions], [np.asarray(y)[positions] for y in ys]
+
+
+def get_window(relayout_data, dates):
+    """
+        Return window of positions in dates shown after a relayout event or
+        None if the x axis did not change
+
+        Parameters
+        ----------
+
+        relayout_data : dict
+            relayoutData property of dcc.Graph
+
+        dates : pandas.DatetimeIndex
+            Dates of the chart
+
+
+        Return
+        ------
+
+        tuple
+            (start, stop) positions, stop is exclusive
+    """
+
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return 0, len(dates)
+    if 'xaxis.range[0]' in relayout_data:
+        bounds = [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    elif 'xaxis.range' in relayout_data:
+        bounds = relayout_data['xaxis.range']
+    else:
+        return None
+    try:
+        # plotly sends bounds with or without time of day
+        start, stop = (pd.Timestamp(bound) for bound in bounds)
+    except (TypeError, ValueError):
+        return None
+    return int(dates.searchsorted(start)), int(dates.searchsorted(stop, side='right'))
@@ -0,0 +1,193 @@
+"""
+    On-disk cache of processed DataFrames.
+
+    Every frame is stored as a directory with one .npy file per column,
+    keyed by the content hash of its source, in a directory per source
+    which keeps the KEEP_FRAMES latest entries. Text columns are stored as
+    integer codes plus a json list of categories. Timestamps and frames in
+    DataFrame.attrs are stored alongside, attrs frames with their index.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from sources import CACHE_DIR, is_stale_tmp
+
+FRAMES_DIR = os.path.join(CACHE_DIR, 'frames')
+
+# entries kept per source, older ones are removed on save
+KEEP_FRAMES = 2
+
+
+def _frame_dir(name, key):
+    return os.path.join(FRAMES_DIR, name, key)
+
+
+def _read_columns(frame_dir):
+    with open(os.path.join(frame_dir, 'columns.json')) as columns_file:
+        columns = json.load(columns_file)
+
+    data = {}
+    for i, column in enumerate(columns):
+        values = np.load(os.path.join(frame_dir, '{}.npy'.format(i)))
+        if column['categories'] is not None:
+            values = pd.Categorical.from_codes(values, column['categories'])
+            if not column['categorical']:
+                values = np.asarray(values, dtype=object)
+        data[column['name']] = values
+    return pd.DataFrame(data, columns=[column['name'] for column in columns])
+
+
+def _write_columns(frame_dir, df):
+    os.makedirs(frame_dir, exist_ok=True)
+    columns = []
+    for i, name in enumerate(df.columns):
+        ser = df[name]
+        categorical = isinstance(ser.dtype, pd.CategoricalDtype)
+        text = not (
+            pd.api.types.is_numeric_dtype(ser)
+            or pd.api.types.is_datetime64_any_dtype(ser)
+        )
+        if categorical or text:
+            cat = ser.astype('category').cat
+            values = cat.codes.to_numpy()
+            categories = cat.categories.tolist()
+        else:
+            values = ser.to_numpy()
+            categories = None
+        np.save(os.path.join(frame_dir, '{}.npy'.format(i)), values)
+        columns.append({
+            'name': name,
+            'categorical': categorical,
+            'categories': categories,
+        })
+
+    with open(os.path.join(frame_dir, 'columns.json'), 'w') as columns_file:
+        json.dump(columns, columns_file)
+
+
+def load(name, key):
+    """
+        Return cached DataFrame or None if there is no entry for the key
+
+        Parameters
+        ----------
+
+        name : str
+            Name of the source
+
+        key : str
+            Cache key, e.g. digest of the source file
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+    """
+
+    frame_dir = _frame_dir(name, key)
+    try:
+        df = _read_columns(frame_dir)
+        with open(os.path.join(frame_dir, 'attrs.json')) as attrs_file:
+            attrs = json.load(attrs_file)
+    except (OSError, ValueError):
+        return None
+
+    for i, attr in enumerate(attrs):
+        if attr['type'] == 'frame':
+            attr_df = _read_columns(os.path.join(frame_dir, 'attrs-{}'.format(i)))
+            df.attrs[attr['name']] = attr_df.set_index(attr_df.columns[0])
+        elif attr['type'] == 'timestamp':
+            df.attrs[attr['name']] = pd.Timestamp(attr['value'])
+        else:
+            df.attrs[attr['name']] = attr['value']
+    return df
+
+
+def save(name, key, df):
+    """
+        Store DataFrame in the cache under the key and remove older entries
+        of the source. An entry stored by another process is kept as is.
+
+        Parameters
+        ----------
+
+        name : str
+            Name of the source
+
+        key : str
+            Cache key, e.g. digest of the source file
+
+        df : pandas.DataFrame
+            Frame with numeric, datetime, text or categorical columns and
+            attrs of JSON types, timestamps or such frames
+    """
+
+    frame_dir = _frame_dir(name, key)
+    if os.path.isdir(frame_dir):
+        # entries are written atomically, an existing one is complete
+        os.utime(frame_dir)
+    else:
+        _write_entry(frame_dir, df)
+    _remove_old_entries(os.path.dirname(frame_dir))
+    _remove_flat_entries()
+
+
+def _write_entry(frame_dir, df):
+    tmp_dir = '{}.{}.tmp'.format(frame_dir, os.getpid())
+    try:
+        _write_frame(tmp_dir, df)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    try:
+        os.replace(tmp_dir, frame_dir)
+    except OSError:
+        # stored by another process meanwhile
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(frame_dir):
+            raise
+
+
+def _write_frame(tmp_dir, df):
+    _write_columns(tmp_dir, df)
+
+    attrs = []
+    for i, (name, value) in enumerate(df.attrs.items()):
+        if isinstance(value, pd.DataFrame):
+            # index is stored as the first column
+            _write_columns(
+                os.path.join(tmp_dir, 'attrs-{}'.format(i)), value.reset_index())
+            attrs.append({'name': name, 'type': 'frame'})
+        elif isinstance(value, pd.Timestamp):
+            attrs.append({'name': name, 'type': 'timestamp', 'value': value.isoformat()})
+        else:
+            attrs.append({'name': name, 'type': 'json', 'value': value})
+    with open(os.path.join(tmp_dir, 'attrs.json'), 'w') as attrs_file:
+        json.dump(attrs, attrs_file)
+
+
+def _remove_old_entries(source_dir):
+    entries = []
+    for entry in os.scandir(source_dir):
+        if entry.name.endswith('.tmp'):
+            # left by a process which died while writing
+            if is_stale_tmp(entry.name):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif entry.is_dir():
+            entries.append(entry)
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in entries[KEEP_FRAMES:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _remove_flat_entries():
+    # entries stored directly in FRAMES_DIR before directories per source
+    for entry in os.scandir(FRAMES_DIR):
+        if is_stale_tmp(entry.name) or (
+                entry.is_dir() and os.path.exists(os.path.join(entry.path, 'columns.json'))):
+            shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,157 @@
+"""
+    Incremental ingestion of the time series files.
+
+    The source files only gain new date columns, while historical values are
+    corrected occasionally. The region x date matrices of the last processed
+    file are kept on disk together with a hash of every source column, so
+    only new or changed date columns are aggregated and new cases are only
+    recomputed next to them. A change of the rows or a reordering of the
+    date columns falls back to a full rebuild.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import layouts
+from sources import CACHE_DIR
+
+STATE_DIR = os.path.join(CACHE_DIR, 'incremental')
+
+ID_COLUMNS = ['Province/State', 'Country/Region', 'Lat', 'Long']
+
+
+def _state_dir(name):
+    return os.path.join(STATE_DIR, name)
+
+
+def _hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def _load_state(name):
+    state_dir = _state_dir(name)
+    try:
+        with open(os.path.join(state_dir, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+        values = np.load(os.path.join(state_dir, 'values.npy'))
+        new_cases = np.load(os.path.join(state_dir, 'new_cases.npy'))
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != layouts.PROCESSED_DF_VERSION:
+        return None
+    return meta, values, new_cases
+
+
+def _save_state(name, meta, values, new_cases):
+    state_dir = _state_dir(name)
+    tmp_dir = '{}.{}.tmp'.format(state_dir, os.getpid())
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, 'values.npy'), values)
+    np.save(os.path.join(tmp_dir, 'new_cases.npy'), new_cases)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.replace(tmp_dir, state_dir)
+
+
+def get_processed_df(name, metric_csv, stats=None):
+    """
+        Return the same DataFrame as layouts.get_processed_df() processing
+        only date columns which changed since the previous call
+
+        Parameters
+        ----------
+
+        name : str
+            Name of the source, e.g. file name
+
+        metric_csv : str or file-like object
+            Full url path to target csv file
+
+        stats : dict
+            If provided, filled with 'mode' ('full' or 'incremental') and
+            number of 'changed_columns'
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Processed DataFrame
+    """
+
+    raw_df = pd.read_csv(metric_csv)
+    date_columns = [column for column in raw_df.columns if column not in ID_COLUMNS]
+    dates = pd.to_datetime(date_columns)
+    id_hash = _hash_bytes(pd.util.hash_pandas_object(
+        raw_df[['Province/State', 'Country/Region']], index=False).values.tobytes())
+    column_hashes = [
+        _hash_bytes(raw_df[column].to_numpy().tobytes()) for column in date_columns
+    ]
+    source_df = layouts.prepare_source_df(raw_df)
+
+    state = _load_state(name)
+    appendable = state is not None and dates.is_monotonic_increasing
+    if appendable:
+        meta, prev_values, prev_new_cases = state
+        n_prev = len(meta['columns'])
+        appendable = (
+            meta['id_hash'] == id_hash
+            and meta['columns'] == date_columns[:n_prev]
+        )
+
+    if appendable:
+        changed = [
+            i for i, column_hash in enumerate(column_hashes)
+            if i >= n_prev or column_hash != meta['column_hashes'][i]
+        ]
+        regions = pd.MultiIndex.from_tuples(
+            [tuple(region) for region in meta['regions']], names=['country', 'province'])
+        values = prev_values
+        new_cases = prev_new_cases
+        if changed:
+            changed_df = layouts.aggregate_regions(
+                source_df[['country', 'province'] + [date_columns[i] for i in changed]])
+            values = np.empty(
+                (len(regions), len(date_columns)),
+                dtype=np.result_type(prev_values.dtype, *changed_df.dtypes)
+            )
+            values[:, :n_prev] = prev_values
+            values[:, changed] = changed_df.reindex(regions).to_numpy()
+
+            # new cases change only in changed columns and right after them
+            new_cases = np.zeros(values.shape, dtype='float64')
+            new_cases[:, :n_prev] = prev_new_cases
+            boundary = set(changed) | {i + 1 for i in changed}
+            boundary = np.array(
+                [i for i in sorted(boundary) if 0 < i < len(date_columns)], dtype=int)
+            new_cases[:, boundary] = values[:, boundary] - values[:, boundary - 1]
+        wide_df = pd.DataFrame(values, index=regions, columns=dates)
+        mode = 'incremental'
+    else:
+        changed = list(range(len(date_columns)))
+        wide_df = layouts.aggregate_regions(source_df)
+        values = wide_df.to_numpy()
+        new_cases = layouts.get_new_cases(values)
+        mode = 'full'
+
+    if stats is not None:
+        stats['mode'] = mode
+        stats['changed_columns'] = len(changed)
+
+    if changed and dates.is_monotonic_increasing:
+        _save_state(name, {
+            'version': layouts.PROCESSED_DF_VERSION,
+            'id_hash': id_hash,
+            'columns': date_columns,
+            'column_hashes': column_hashes,
+            'regions': wide_df.index.tolist(),
+        }, values, new_cases)
+
+    lat, long = layouts.get_country_coords(
+        source_df, layouts.get_region_countries(wide_df.index))
+    return layouts.build_processed_df(wide_df, new_cases, lat, long)
@@ -1,66 +1,322 @@
+import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, MATCH
+from dash.exceptions import PreventUpdate
 
-from app import app, server
+from app import app, server, CONTENT_MODE, SWITCH_MODE
+import api
+import compare
+import downsample
+import instrumentation
 import layouts
+import payloads
+import refresh
+import skeleton
+import views
 import callbacks
 
+# publish the first data snapshot, requests keep refreshing it in background
+refresh.start()
 
-app.layout = html.Div([
-    # title of the dashboard
-    html.H1('COVID-19 Dashboard'),
-    # section with buttons
-    html.Div([
-        html.Button(
-            'Cumulative', id='cum_button', n_clicks_timestamp=1,
-            className='btn active',
-            style={'backgroundColor': '#e7e7e7', 'color': 'black'}
+
+def serve_layout():
+    # evaluated on every page load, country options follow data refreshes
+    countries = layouts.get_countries(refresh.get_snapshot().stores)
+    return html.Div([
+        # title of the dashboard
+        html.H1('COVID-19 Dashboard'),
+        # section with buttons
+        html.Div([
+            html.Button(
+                'Cumulative', id='cum_button', n_clicks_timestamp=1,
+                className='btn active',
+                style={'backgroundColor': '#e7e7e7', 'color': 'black'}
+            ),
+            html.Button(
+                'New Cases', id='new_cases_button', n_clicks_timestamp=0,
+                className='btn',
+                style={'backgroundColor': '#e7e7e7', 'color': 'black'}
+            )
+        ], style={'textAlign': 'center'}
+        ),
+        html.Div(
+            id='button-clicked',
+            style={'textAlign': 'center', 'marginBottom': 10}
+        ),
+        # country selector for the country tab
+        html.Div(
+            dcc.Dropdown(
+                id='country-dropdown',
+                options=[{'label': country, 'value': country} for country in countries],
+                value=views.DEFAULT_COUNTRY,
+                clearable=False
+            ),
+            style={'width': 300, 'margin': '0 auto 10px'}
+        ),
+        # province drill-down of countries split into provinces
+        html.Div(
+            dcc.Dropdown(
+                id='province-dropdown',
+                placeholder='All provinces',
+                options=[],
+                value=None
+            ),
+            id='province-selector',
+            style={'display': 'none'}
+        ),
+        # section with tabs
+        dcc.Tabs(
+            id="tabs", value='country_tab',
+            children=[
+                dcc.Tab(label='Country', value='country_tab'),
+                dcc.Tab(label='World', value='global_tab'),
+                dcc.Tab(label='Compare', value='compare_tab'),
+            ]
         ),
-        html.Button(
-            'New Cases', id='new_cases_button', n_clicks_timestamp=0,
-            className='btn',
-            style={'backgroundColor': '#e7e7e7', 'color': 'black'}
-        )
-    ], style={'textAlign': 'center'}
-    ),
-    html.Div(
-        id='button-clicked',
-        style={'textAlign': 'center', 'marginBottom': 10}
-    ),
-    # section with tabs
-    dcc.Tabs(
-        id="tabs", value='rus_tab',
-        children=[
-            dcc.Tab(label='Russia', value='rus_tab'),
-            dcc.Tab(label='World', value='global_tab'),
-        ]
-    ),
-    html.Div(id='tabs-content'),
-])
-
-
-@app.callback(
-    Output('tabs-content', 'children'),
-    [
-        Input('tabs', 'value'),
-        Input('cum_button', 'n_clicks_timestamp'),
-        Input('new_cases_button', 'n_clicks_timestamp')
+    ] + get_content_components())
+
+
+def get_content_components():
+    if CONTENT_MODE == 'figures':
+        return [skeleton.render_skeleton()]
+    return [
+        html.Div(id='tabs-content'),
+        # cumulative and new content of the tab in client switch mode
+        dcc.Store(id='content-store'),
     ]
-)
-def render_content(tab, btn1, btn2):
-    # Russia tab cumulative stats
-    if tab == 'rus_tab' and (int(btn1) > int(btn2)):
-        return layouts.rus_cum_layout
-    # Russia tab new cases stats
-    elif tab == 'rus_tab' and (int(btn1) < int(btn2)):
-        return layouts.rus_new_layout
-    # world tab cumulative stats
-    elif tab == 'global_tab' and (int(btn1) > int(btn2)):
-        return layouts.global_cum_layout
-    # world tab new cases stats
-    elif tab == 'global_tab' and (int(btn1) < int(btn2)):
-        return layouts.global_new_layout
+
+
+app.layout = serve_layout
+
+
+def get_layout(snapshot, tab, metric_type, country, province=None):
+    # country tab stats
+    if tab == 'country_tab':
+        return views.get_country_layout(snapshot, country, metric_type, province)
+    # world tab stats
+    elif tab == 'global_tab' and metric_type == 'cumulative':
+        return snapshot.layouts['global_cum']
+    elif tab == 'global_tab' and metric_type == 'new':
+        return snapshot.layouts['global_new']
+    # comparison of several countries, the same for both metric types
+    elif tab == 'compare_tab':
+        return compare.render_compare_layout(layouts.get_countries(snapshot.stores))
+
+
+@instrumentation.timed_callback
+def render_content(tab, btn1, btn2, country, province):
+    # take the snapshot once, a concurrent refresh must not mix versions
+    snapshot = refresh.get_snapshot()
+    if int(btn1) > int(btn2):
+        return get_layout(snapshot, tab, 'cumulative', country, province)
+    elif int(btn1) < int(btn2):
+        return get_layout(snapshot, tab, 'new', country, province)
+
+
+@instrumentation.timed_callback
+def render_content_data(tab, country, province):
+    # both metric types at once, buttons switch between them in the browser
+    snapshot = refresh.get_snapshot()
+    return {
+        'cumulative': get_layout(snapshot, tab, 'cumulative', country, province),
+        'new': get_layout(snapshot, tab, 'new', country, province),
+    }
+
+
+@instrumentation.timed_callback
+def update_key_metrics(tab, btn1, btn2, country, province):
+    metric_type = skeleton.get_metric_type(btn1, btn2)
+    if tab not in ('country_tab', 'global_tab') or metric_type is None:
+        raise PreventUpdate
+    if tab == 'global_tab':
+        country = province = None
+    return views.get_key_metrics_traces(
+        refresh.get_snapshot(), metric_type, country, province)
+
+
+@instrumentation.timed_callback
+def update_sections(tab, btn1, btn2, map_version, compare_version):
+    # map and comparison controls are rendered once per data version
+    snapshot = refresh.get_snapshot()
+    hidden = {'display': 'none'}
+    show_map = (tab == 'global_tab'
+                and skeleton.get_metric_type(btn1, btn2) == 'cumulative')
+    show_compare = tab == 'compare_tab'
+
+    map_children = compare_children = dash.no_update
+    if show_map and map_version != snapshot.version:
+        map_children, map_version = snapshot.layouts['map'], snapshot.version
+    if show_compare and compare_version != snapshot.version:
+        compare_children = compare.render_compare_layout(layouts.get_countries(snapshot.stores))
+        compare_version = snapshot.version
+    return (
+        hidden if show_compare else {},
+        map_children, {} if show_map else hidden, map_version,
+        compare_children, {} if show_compare else hidden, compare_version,
+    )
+
+
+@instrumentation.timed_callback
+def update_slot(tab, btn1, btn2, country, province, relayout_data, graph_id, current):
+    if tab not in ('country_tab', 'global_tab'):
+        # hidden slots keep their charts for the way back
+        raise PreventUpdate
+    snapshot = refresh.get_snapshot()
+    chart = skeleton.get_slot_chart(
+        tab, skeleton.get_metric_type(btn1, btn2), graph_id['slot'])
+    if chart is None:
+        if current and current['chart'] is None:
+            raise PreventUpdate
+        return {'key': None, 'chart': None}
+    if tab == 'global_tab':
+        country = province = None
+
+    triggered = [item['prop_id'] for item in dash.callback_context.triggered]
+    if all(prop.endswith('.relayoutData') for prop in triggered):
+        # points of the visible window of the zoomed chart
+        if downsample.DOWNSAMPLE_MODE != 'adaptive':
+            raise PreventUpdate
+        dates = views.get_chart(snapshot, chart, country, province).dates
+        window = downsample.get_window(relayout_data, dates)
+        if window is None:
+            raise PreventUpdate
+        return skeleton.get_slot_data(snapshot, chart, country, province, window)
+
+    # unchanged charts are not sent again
+    if current and current['key'] == skeleton.get_slot_key(snapshot, chart, country, province):
+        raise PreventUpdate
+    return skeleton.get_slot_data(snapshot, chart, country, province)
+
+
+content_inputs = [
+    Input('tabs', 'value'),
+    Input('cum_button', 'n_clicks_timestamp'),
+    Input('new_cases_button', 'n_clicks_timestamp'),
+    Input('country-dropdown', 'value'),
+    Input('province-dropdown', 'value')
+]
+
+if CONTENT_MODE == 'figures':
+    app.callback(
+        Output('key-metrics-data', 'data'), content_inputs
+    )(update_key_metrics)
+    app.clientside_callback(
+        """
+        function(traces, templates) {
+            if (!traces) {
+                return window.dash_clientside.no_update;
+            }
+            return {'data': traces, 'layout': templates.key_metrics.layout};
+        }
+        """,
+        Output('key-metrics-graph', 'figure'),
+        [Input('key-metrics-data', 'data')],
+        [State('figure-templates', 'data')]
+    )
+    app.callback(
+        [Output('series-section', 'style'),
+         Output('map-section', 'children'),
+         Output('map-section', 'style'),
+         Output('map-version', 'data'),
+         Output('compare-section', 'children'),
+         Output('compare-section', 'style'),
+         Output('compare-version', 'data')],
+        content_inputs[:3],
+        [State('map-version', 'data'),
+         State('compare-version', 'data')]
+    )(update_sections)
+    slot_graph = {'type': skeleton.SLOT_TYPE, 'slot': MATCH}
+    slot_data = {'type': skeleton.SLOT_DATA_TYPE, 'slot': MATCH}
+    app.callback(
+        Output(slot_data, 'data'),
+        content_inputs + [Input(slot_graph, 'relayoutData')],
+        [State(slot_graph, 'id'),
+         State(slot_data, 'data')]
+    )(update_slot)
+    # merge points of a slot into the template of its chart
+    app.clientside_callback(
+        """
+        function(data, templates) {
+            if (!data) {
+                return [window.dash_clientside.no_update, window.dash_clientside.no_update];
+            }
+            if (!data.chart) {
+                return [window.dash_clientside.no_update, {'display': 'none'}];
+            }
+            var template = templates[data.chart];
+            var traces = template.data.map(function(trace, i) {
+                return Object.assign({}, trace, {'x': data.x, 'y': data.ys[i]});
+            });
+            var layout = Object.assign({}, template.layout, {
+                'xaxis': Object.assign({}, template.layout.xaxis, {'range': data.range}),
+                // zoom is kept while points of the same chart are replaced
+                'uirevision': data.key.join('|')
+            });
+            return [{'data': traces, 'layout': layout}, {}];
+        }
+        """,
+        [Output(slot_graph, 'figure'),
+         Output(slot_graph, 'style')],
+        [Input(slot_data, 'data')],
+        [State('figure-templates', 'data')]
+    )
+elif SWITCH_MODE == 'client':
+    app.callback(
+        Output('content-store', 'data'),
+        [Input('tabs', 'value'),
+         Input('country-dropdown', 'value'),
+         Input('province-dropdown', 'value')]
+    )(render_content_data)
+    app.clientside_callback(
+        """
+        function(data, btn1, btn2) {
+            if (!data) {
+                return window.dash_clientside.no_update;
+            }
+            return Number(btn1) > Number(btn2) ? data.cumulative : data['new'];
+        }
+        """,
+        Output('tabs-content', 'children'),
+        [Input('content-store', 'data'),
+         Input('cum_button', 'n_clicks_timestamp'),
+         Input('new_cases_button', 'n_clicks_timestamp')]
+    )
+else:
+    app.callback(
+        Output('tabs-content', 'children'), content_inputs
+    )(render_content)
+
+
+def get_content_key(inputs):
+    # inputs which select the layout returned by render_content
+    cumulative = (int(inputs['cum_button.n_clicks_timestamp'])
+                  > int(inputs['new_cases_button.n_clicks_timestamp']))
+    return (inputs['tabs.value'], cumulative) + get_region_key(inputs)
+
+
+def get_content_data_key(inputs):
+    return (inputs['tabs.value'],) + get_region_key(inputs)
+
+
+def get_region_key(inputs):
+    if inputs['tabs.value'] != 'country_tab':
+        return (None, None)
+    return (inputs['country-dropdown.value'], inputs.get('province-dropdown.value') or None)
+
+
+# installed first, so requests answered from pre-encoded payloads are timed too
+instrumentation.init_app(app)
+
+# before payloads, whose cached responses skip later hooks
+refresh.init_app(server)
+
+payloads.register('tabs-content.children', get_content_key)
+payloads.register('key-metrics-data.data', get_content_key)
+payloads.register('content-store.data', get_content_data_key)
+payloads.init_app(server)
+
+api.init_app(server)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,206 @@
+"""
+    Derived indicators of the metric stores.
+
+    Indicators are computed for every region of the rollup cube at once as
+    matrix operations and kept in a MetricStore next to the stores of the
+    base metrics, so views only slice rows. New indicators are added with
+    register() and are available to every view by name.
+"""
+import functools
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import reference
+from store import MetricStore
+
+METRICS = ['confirmed', 'recovered', 'deaths']
+
+# key of the indicator store among the metric stores
+STORE_NAME = 'indicators'
+
+ROLLING_WINDOW = 7
+
+# dtype None keeps the dtype computed by the function
+Indicator = namedtuple('Indicator', ['name', 'func', 'dtype'])
+
+INDICATORS = OrderedDict()
+
+
+def register(name, dtype='float32'):
+    """
+        Decorator registering function computing an indicator
+
+        The function gets a dict of region x date matrices: cumulative
+        values of every metric by metric name, new cases by 'new_' + metric
+        name, indicators registered before by their name and 'population'
+        as a column vector. It returns a matrix of the same shape.
+
+        Parameters
+        ----------
+
+        name : str
+            Name of the indicator in the indicator store
+
+        dtype : str
+            Dtype the result is stored in, None keeps it as computed
+    """
+
+    def decorator(func):
+        INDICATORS[name] = Indicator(name, func, dtype)
+        return func
+    return decorator
+
+
+def shift(matrix, periods):
+    """
+        Return float matrix shifted by periods along dates, NaN in front
+    """
+
+    shifted = np.full(matrix.shape, np.nan)
+    if periods < matrix.shape[1]:
+        shifted[:, periods:] = matrix[:, :matrix.shape[1] - periods]
+    return shifted
+
+
+def rolling_mean(matrix, window):
+    """
+        Return mean of the last window values along dates, NaN until the
+        window is full like pandas.Series.rolling(window).mean()
+    """
+
+    cumsum = np.cumsum(matrix, axis=1, dtype='float64')
+    result = np.full(matrix.shape, np.nan)
+    if window <= matrix.shape[1]:
+        result[:, window - 1:] = cumsum[:, window - 1:]
+        result[:, window:] -= cumsum[:, :-window]
+        result[:, window - 1:] /= window
+    return result
+
+
+def _divide(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.true_divide(numerator, denominator)
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+@register('active', dtype=None)
+def active(m):
+    return m['confirmed'] - m['recovered']
+
+
+@register('new_active', dtype=None)
+def new_active(m):
+    return m['new_confirmed'] - m['new_recovered']
+
+
+@register('cfr')
+def cfr(m):
+    # case fatality rate among closed cases
+    return _divide(m['deaths'], m['deaths'] + m['recovered'])
+
+
+def _new_cases_mean(metric, m):
+    return rolling_mean(m['new_' + metric], ROLLING_WINDOW).round()
+
+
+for _metric in METRICS:
+    register('new_{}_mean{}'.format(_metric, ROLLING_WINDOW))(
+        functools.partial(_new_cases_mean, _metric))
+
+
+@register('growth_rate')
+def growth_rate(m):
+    # average daily growth of confirmed cases over the rolling window
+    ratio = _divide(m['confirmed'], shift(m['confirmed'], ROLLING_WINDOW))
+    return ratio ** (1 / ROLLING_WINDOW) - 1
+
+
+@register('doubling_time')
+def doubling_time(m):
+    # days until confirmed cases double at the current growth rate
+    rate = np.where(m['growth_rate'] > 0, m['growth_rate'], np.nan)
+    return np.log(2) / np.log1p(rate)
+
+
+@register('confirmed_per_100k')
+def confirmed_per_100k(m):
+    return _divide(m['confirmed'] * 1e5, m['population'])
+
+
+@register('deaths_per_100k')
+def deaths_per_100k(m):
+    return _divide(m['deaths'] * 1e5, m['population'])
+
+
+@register('new_confirmed_mean7_per_100k')
+def new_confirmed_mean_per_100k(m):
+    return _divide(m['new_confirmed_mean7'] * 1e5, m['population'])
+
+
+def get_population(regions):
+    """
+        Return population of every region as a column vector. Countries
+        use the reference data, the world the sum of known countries and
+        provinces are unknown (NaN).
+    """
+
+    countries = regions.get_level_values('country')
+    provinces = regions.get_level_values('province')
+    values = reference.get_reference().get_population(countries)
+    values[provinces != ''] = np.nan
+    is_country = (provinces == '') & (countries != '')
+    values[(countries == '') & (provinces == '')] = np.nansum(values[is_country])
+    return values[:, np.newaxis]
+
+
+def _align(metric_store, base):
+    # rows and columns of another source may differ, missing ones are NaN
+    if metric_store.regions.equals(base.regions) and metric_store.dates.equals(base.dates):
+        return metric_store.arrays
+    rows = np.array([metric_store.region_pos.get(region, -1) for region in base.regions])
+    columns = metric_store.dates.get_indexer(base.dates)
+    aligned = {}
+    for metric_type, matrix in metric_store.arrays.items():
+        result = np.full((len(rows), len(columns)), np.nan)
+        found = np.ix_(rows >= 0, columns >= 0)
+        result[found] = matrix[np.ix_(rows[rows >= 0], columns[columns >= 0])]
+        aligned[metric_type] = result
+    return aligned
+
+
+def build_store(stores):
+    """
+        Compute all registered indicators
+
+        Parameter
+        ---------
+
+        stores : dict
+            store.MetricStore of every metric with keys
+            ['confirmed', 'recovered', 'deaths']
+
+
+        Return
+        ------
+
+        store.MetricStore
+            Store with one matrix per indicator on the regions and dates of
+            the confirmed store, read with get_series(indicator name, ...)
+    """
+
+    base = stores['confirmed']
+    inputs = {'population': get_population(base.regions)}
+    for metric in METRICS:
+        arrays = _align(stores[metric], base)
+        inputs[metric] = arrays['cumulative']
+        inputs['new_' + metric] = arrays['new']
+
+    arrays = {}
+    for indicator in INDICATORS.values():
+        matrix = np.asarray(indicator.func(inputs))
+        if indicator.dtype is not None:
+            matrix = matrix.astype(indicator.dtype)
+        inputs[indicator.name] = arrays[indicator.name] = matrix
+    return MetricStore(base.regions, base.dates, arrays)
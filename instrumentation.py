@@ -0,0 +1,275 @@
+"""
+    Lightweight latency and size instrumentation.
+
+    Pipeline stages, data refreshes and Dash callbacks record histograms
+    which are exposed in Prometheus text format on the /metrics route. With
+    METRICS_ENABLED=0 the decorators return functions unchanged and
+    observations return immediately. Metrics are kept per process, so every
+    gunicorn worker reports its own.
+"""
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+import flask
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+SIZE_BUCKETS = (
+    1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+DASH_UPDATE_PATH = '_dash-update-component'
+
+
+class Histogram:
+    """
+        Cumulative histogram with a set of labels per series
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # bucket counts, sum, count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help_text),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        with self._lock:
+            series_items = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in sorted(self._series.items())
+            ]
+        for key, counts, total, count in series_items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(key + (('le', _format_value(bound)),)),
+                    cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                self.name, _format_labels(key + (('le', '+Inf'),)), count))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(key), total))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(key), count))
+        return lines
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in key
+    ) + '}'
+
+
+stage_seconds = Histogram(
+    'dashboard_stage_seconds', 'Duration of data pipeline stages.', LATENCY_BUCKETS)
+refresh_seconds = Histogram(
+    'dashboard_refresh_seconds', 'Duration of data refreshes.', LATENCY_BUCKETS)
+callback_seconds = Histogram(
+    'dashboard_callback_seconds',
+    'Duration of Dash callback functions without serialization.', LATENCY_BUCKETS)
+request_seconds = Histogram(
+    'dashboard_callback_request_seconds',
+    'Duration of Dash callback requests including serialization.', LATENCY_BUCKETS)
+response_bytes = Histogram(
+    'dashboard_callback_response_bytes',
+    'Size of Dash callback response bodies.', SIZE_BUCKETS)
+
+HISTOGRAMS = [
+    stage_seconds, refresh_seconds, callback_seconds, request_seconds, response_bytes]
+
+# functions returning (name, type, help, {labels key: value}) tuples
+_collectors = []
+
+
+def observe_stage(stage, seconds, **labels):
+    """
+        Record duration of a pipeline stage
+    """
+
+    if METRICS_ENABLED:
+        stage_seconds.observe(seconds, stage=stage, **labels)
+
+
+@contextlib.contextmanager
+def _stage_timer(stage, labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage, **labels)
+
+
+def stage(name, **labels):
+    """
+        Return context manager timing a pipeline stage
+    """
+
+    if not METRICS_ENABLED:
+        return contextlib.nullcontext()
+    return _stage_timer(name, labels)
+
+
+def timed_stage(name):
+    """
+        Decorator timing every call of a function as pipeline stage
+    """
+
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _stage_timer(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_callback(func):
+    """
+        Decorator timing every call of a Dash callback function
+    """
+
+    if not METRICS_ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            callback_seconds.observe(
+                time.perf_counter() - started, callback=func.__name__)
+    return wrapper
+
+
+def register_collector(collector):
+    """
+        Register function returning extra metrics as list of
+        (name, type, help, {labels dict items tuple: value}) tuples
+    """
+
+    _collectors.append(collector)
+
+
+def register_cache(name, cache):
+    """
+        Expose size and counters of lru.LRUCache
+    """
+
+    def collect():
+        stats = cache.stats()
+        key = (('cache', name),)
+        return [
+            ('dashboard_cache_entries', 'gauge', 'Number of cached entries.',
+             {key: stats['size']}),
+            ('dashboard_cache_hits_total', 'counter', 'Number of cache hits.',
+             {key: stats['hits']}),
+            ('dashboard_cache_misses_total', 'counter', 'Number of cache misses.',
+             {key: stats['misses']}),
+            ('dashboard_cache_evictions_total', 'counter', 'Number of cache evictions.',
+             {key: stats['evictions']}),
+        ]
+
+    register_collector(collect)
+
+
+def expose():
+    """
+        Return all metrics in Prometheus text format
+    """
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.expose())
+
+    # collectors may report different label sets of the same metric
+    metrics = {}
+    for collector in _collectors:
+        for name, metric_type, help_text, samples in collector():
+            metrics.setdefault(name, (metric_type, help_text, {}))[2].update(samples)
+    for name, (metric_type, help_text, samples) in metrics.items():
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for key, value in sorted(samples.items()):
+            lines.append('{}{} {}'.format(name, _format_labels(key), value))
+    return '\n'.join(lines) + '\n'
+
+
+def _callback_name(app, output):
+    callback = app.callback_map.get(output, {}).get('callback')
+    return getattr(callback, '__name__', None) or output
+
+
+def _start_request():
+    if flask.request.path.endswith(DASH_UPDATE_PATH):
+        flask.g.metrics_started = time.perf_counter()
+
+
+def _finish_request(app, response):
+    started = flask.g.pop('metrics_started', None)
+    if started is None:
+        return response
+    body = flask.request.get_json(silent=True) or {}
+    labels = {
+        'callback': _callback_name(app, body.get('output', '')),
+        'status': str(response.status_code),
+    }
+    request_seconds.observe(time.perf_counter() - started, **labels)
+    if not response.is_streamed:
+        response_bytes.observe(
+            response.calculate_content_length() or 0,
+            encoding=response.headers.get('Content-Encoding', 'identity'),
+            **labels
+        )
+    return response
+
+
+def init_app(app):
+    """
+        Time Dash callback requests and add /metrics route. Call it before
+        other request hooks are installed, so cached responses are timed too.
+    """
+
+    if not METRICS_ENABLED:
+        return
+
+    server = app.server
+    server.before_request(_start_request)
+    server.after_request(lambda response: _finish_request(app, response))
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(
+            expose(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -1,18 +1,49 @@
 import dash_core_components as dcc
 import dash_html_components as html
 
-import plotly.graph_objs as go
-import plotly.express as px
+import concurrent.futures
+import logging
 import os
+import time
+import numpy as np
 import pandas as pd
 
+import downsample
+import frame_cache
+import incremental
+import indicators
+import instrumentation
+import mapframes
+import reference
+import sources
+import store
+import streaming
+
 CONFIRMED_CSV = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
 
 RECOVERED_CSV = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_recovered_global.csv'
 
 DEATHS_CSV = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv'
 
-COUNTRIES_COORDINATES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'country_centroids.csv')
+# bump when output of get_processed_df changes to invalidate cached frames
+PROCESSED_DF_VERSION = 5
+
+# compact dtypes of processed frames, day offsets cover ~90 years
+COUNTRY_CODE_DTYPE = 'int16'
+DAY_DTYPE = 'int16'
+COORD_DTYPE = 'float32'
+
+# number of sources fetched and processed in parallel, 1 disables the pool
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 3))
+
+# 'thread' or 'process'
+INGEST_EXECUTOR = os.environ.get('INGEST_EXECUTOR', 'thread')
+
+# 'full' processes whole sources, 'incremental' only new or changed dates,
+# 'streaming' parses sources in chunks with bounded memory
+INGEST_MODE = os.environ.get('INGEST_MODE', 'full')
+
+logger = logging.getLogger(__name__)
 
 
 def get_processed_df(metric_csv):
@@ -21,7 +52,7 @@ def get_processed_df(metric_csv):
         Parameter
         ---------
 
-        metrics_csv : str
+        metrics_csv : str or file-like object
             Full url path to target csv file
 
 
@@ -29,51 +60,218 @@ def get_processed_df(metric_csv):
         ------
 
         pandas.DataFrame
-            Return processed pandas DataFrame
-    """
-
-    source_df = pd.read_csv(metric_csv)
-    source_df.drop(columns=['Province/State'], inplace=True)
-    source_df.rename(columns={'Country/Region': 'country'}, inplace=True)
-    processed_df = source_df.drop(columns=['Lat', 'Long'])
-    source_df = source_df[['country', 'Lat', 'Long']].drop_duplicates('country')
-    processed_df = processed_df.melt(
-        id_vars='country',
-        var_name='date',
-        value_name='value'
-    )
+            Return processed pandas DataFrame in the compact format
+            described in build_processed_df()
+    """
 
-    centroid_df = pd.read_csv(
-        COUNTRIES_COORDINATES_CSV, usecols=['admin', 'Longitude', 'Latitude'])
-
-    centroid_df.columns = ['country', 'Longitude', 'Latitude']
-    processed_df['date'] = pd.to_datetime(processed_df['date'])
-    processed_df = processed_df.groupby(['country', 'date']).value.sum().reset_index()
-    processed_df['prev_value'] = processed_df.groupby('country').value.shift(1)
-    processed_df['new_cases'] = processed_df.value - processed_df.prev_value
-    processed_df.fillna(value={'new_cases': 0}, inplace=True)
-    processed_df.drop(columns=['prev_value'], inplace=True)
-
-    # join long and lat from centroid
-    processed_df = processed_df.merge(centroid_df, how='left', on='country')
-
-    # join long and lat for the
-    processed_df = processed_df.merge(
-        source_df,
-        how='left',
-        on='country'
-    )
+    source_df = prepare_source_df(pd.read_csv(metric_csv))
+    wide_df = aggregate_regions(source_df)
+    lat, long = get_country_coords(source_df, get_region_countries(wide_df.index))
+
+    return build_processed_df(
+        wide_df, get_new_cases(wide_df.to_numpy()), lat, long)
+
+
+def prepare_source_df(source_df):
+    """
+        Rename country and province columns of the source DataFrame. Rows
+        without a province are named after their country
+    """
+
+    source_df = source_df.rename(
+        columns={'Country/Region': 'country', 'Province/State': 'province'})
+    source_df['province'] = source_df['province'].fillna(source_df['country'])
+    return source_df
+
+
+def aggregate_regions(source_df):
+    """
+        Return (country, province) x date DataFrame with duplicate rows
+        summed up
+
+        Parameter
+        ---------
+
+        source_df : pandas.DataFrame
+            Source DataFrame prepared with prepare_source_df(), may contain
+            only a subset of date columns
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Cases indexed by sorted (country, province) with sorted
+            datetime columns
+    """
+
+    wide_df = source_df.drop(columns=['Lat', 'Long'], errors='ignore')
+    wide_df = wide_df.groupby(['country', 'province']).sum()
+    wide_df.columns = pd.to_datetime(wide_df.columns)
+    return wide_df.sort_index(axis=1)
 
-    processed_df['Lat'] = processed_df.apply(
-        lambda x: x['Latitude'] if pd.notna(x['Latitude']) else x['Lat'], axis=1)
-    processed_df['Long'] = processed_df.apply(
-        lambda x: x['Longitude'] if pd.notna(x['Longitude']) else x['Long'], axis=1)
 
-    processed_df.drop(columns=['Latitude', 'Longitude'], inplace=True)
+def get_region_countries(regions):
+    """
+        Return sorted countries of (country, province) index
+    """
 
+    return regions.get_level_values('country').unique()
+
+
+def get_new_cases(values):
+    """
+        Return new cases for country x date matrix of cumulative values
+    """
+
+    new_cases = np.zeros(values.shape, dtype='float64')
+    new_cases[:, 1:] = np.diff(values, axis=1)
+    return new_cases
+
+
+def get_country_coords(source_df, countries):
+    """
+        Return latitude and longitude arrays aligned with countries
+    """
+
+    # coordinates are resolved once per country: centroid if it is known,
+    # otherwise coordinates of the first province in the source file
+    coords_df = source_df[['country', 'Lat', 'Long']].drop_duplicates('country')
+    coords_df = coords_df.set_index('country').reindex(countries)
+    lat, long = reference.get_reference().get_coords(countries)
+    lat = np.where(np.isnan(lat), coords_df['Lat'].to_numpy(), lat)
+    long = np.where(np.isnan(long), coords_df['Long'].to_numpy(), long)
+    return lat, long
+
+
+def build_processed_df(wide_df, new_cases, lat, long):
+    """
+        Return long processed DataFrame from region x date matrices
+
+        Parameters
+        ----------
+
+        wide_df : pandas.DataFrame
+            Cumulative cases indexed by sorted (country, province) with
+            datetime columns
+
+        new_cases : numpy.ndarray
+            New cases matrix of the same shape
+
+        lat, long : numpy.ndarray
+            Coordinates of every country, see get_region_countries()
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Columns ['country', 'province', 'day', 'value', 'new_cases'].
+            Country and province are categorical, day is the offset from
+            attrs['start_date'] and attrs['coords'] holds ['Lat', 'Long']
+            once per country
+    """
+
+    regions = wide_df.index
+    countries = get_region_countries(regions)
+    provinces = pd.Categorical(regions.get_level_values('province'))
+    dates = wide_df.columns
+    values = wide_df.to_numpy()
+    new_cases = np.asarray(new_cases)
+    # world totals must fit too, they are summed up in the same dtype
+    count_dtype = get_count_dtype(
+        values, new_cases, values.sum(axis=0), new_cases.sum(axis=0))
+
+    start_date = dates[0] if len(dates) else pd.NaT
+    days = np.asarray((dates - start_date).days, dtype=DAY_DTYPE)
+    country_codes = countries.get_indexer(regions.get_level_values('country'))
+
+    processed_df = pd.DataFrame({
+        'country': pd.Categorical.from_codes(
+            np.repeat(country_codes.astype(COUNTRY_CODE_DTYPE), len(dates)),
+            categories=countries),
+        'province': pd.Categorical.from_codes(
+            np.repeat(provinces.codes, len(dates)),
+            categories=provinces.categories),
+        'day': np.tile(days, len(regions)),
+        'value': values.ravel().astype(count_dtype),
+        'new_cases': new_cases.ravel().astype(count_dtype),
+    })
+    processed_df.attrs['start_date'] = start_date
+    processed_df.attrs['coords'] = pd.DataFrame({
+        'Lat': np.asarray(lat, dtype=COORD_DTYPE),
+        'Long': np.asarray(long, dtype=COORD_DTYPE),
+    }, index=countries)
     return processed_df
 
 
+def get_count_dtype(*arrays):
+    """
+        Return int32 if all values of the arrays fit into it, int64 otherwise
+    """
+
+    limits = np.iinfo('int32')
+    for values in arrays:
+        if values.size and (values.min() < limits.min or values.max() > limits.max):
+            return np.dtype('int64')
+    return np.dtype('int32')
+
+
+def expand_processed_df(df):
+    """
+        Return processed DataFrame with provinces summed up and a row per
+        country and date in the format before compaction, for code working
+        with plain columns
+
+        Parameter
+        ---------
+
+        df : pandas.DataFrame
+            Processed DataFrame with function get_processed_df()
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Columns ['country', 'date', 'value', 'new_cases', 'Lat', 'Long']
+    """
+
+    country_df = df.groupby(['country', 'day'], observed=True, sort=True)[
+        ['value', 'new_cases']].sum().reset_index()
+    coords = df.attrs['coords']
+    codes = country_df['country'].cat.codes.to_numpy()
+    return pd.DataFrame({
+        'country': np.asarray(country_df['country'], dtype=object),
+        'date': df.attrs['start_date'] + pd.to_timedelta(
+            country_df['day'].to_numpy(), unit='D'),
+        'value': country_df['value'].to_numpy(),
+        'new_cases': country_df['new_cases'].to_numpy().astype('float64'),
+        'Lat': coords['Lat'].to_numpy().astype('float64')[codes],
+        'Long': coords['Long'].to_numpy().astype('float64')[codes],
+    })
+
+
+def get_memory_report(df):
+    """
+        Return memory used by a processed DataFrame
+
+        Return
+        ------
+
+        dict
+            Bytes by column including country names and coordinates kept
+            once per country, 'total' and number of 'rows'
+    """
+
+    report = df.memory_usage(index=True, deep=True).to_dict()
+    report['coords'] = int(df.attrs['coords'].memory_usage(index=True, deep=True).sum())
+    report = {str(name): int(size) for name, size in report.items()}
+    report['total'] = sum(report.values())
+    report['rows'] = len(df)
+    return report
+
+
 def get_metric_ser(df, metric_type, country=None):
     """
         Return specific metric from provided dataframe. If country
@@ -98,22 +296,14 @@ def get_metric_ser(df, metric_type, country=None):
             Grouped by date cases
     """
 
-    if not country:
-        if metric_type == 'cumulative':
-            return df.groupby('date').value.sum()
-        if metric_type == 'new':
-            return df.groupby('date').new_cases.sum()
-    if country:
-        if metric_type == 'cumulative':
-            return df[df['country'] == country].groupby('date').value.sum()
-        if metric_type == 'new':
-            return df[df['country'] == country].groupby('date').new_cases.sum()
+    return store.get_store(df).get_series(metric_type, country)
 
 
-def generate_plot(x, y, type, title, color,
-                  mean_legend=False, mean_y=None, xaxis_start_date='2020-03-01'):
+def get_plot_figure(x, y, type, title, color,
+                    mean_legend=False, mean_y=None, xaxis_start_date='2020-03-01'):
     """
-        Generate dash core components graph object
+        Return figure of a time series chart. Without dates in x the
+        initial date range of xaxis is left out, e.g. for chart templates
     """
 
     if mean_legend:
@@ -143,36 +333,209 @@ def generate_plot(x, y, type, title, color,
                 'marker': {'color': color},
             }
         ]
-    return dcc.Graph(
-        figure={
-            'data': data,
-            'layout': {
-                'plot_bgcolor': '#FFFFFF',
-                'paper_bgcolor': '#FFFFFF',
-                'font': {'color': color},
-                'legend': {
-                    'orientation': 'h',
-                    'x': 0.5,
-                    'xanchor': 'center',
-                },
-                'color': color,
-                'title': {
-                    'text': title,
-                    'font': {
-                        'color': color,
-                        'size': 24,
-                    }
-                },
-                'xaxis': {
-                    # initial date range of xaxis
-                    'range': [xaxis_start_date, (x.max() + pd.DateOffset(days=1)).strftime('%Y-%m-%d')]
-                },
-                # 'autosize': False,
-                # 'width': 600,
-                # 'height': 500,
-            }
+    figure = {
+        'data': data,
+        'layout': {
+            'plot_bgcolor': '#FFFFFF',
+            'paper_bgcolor': '#FFFFFF',
+            'font': {'color': color},
+            'legend': {
+                'orientation': 'h',
+                'x': 0.5,
+                'xanchor': 'center',
+            },
+            'color': color,
+            'title': {
+                'text': title,
+                'font': {
+                    'color': color,
+                    'size': 24,
+                }
+            },
+            'xaxis': {
+                # initial date range of xaxis
+                'range': [xaxis_start_date, get_range_end(x)]
+            } if len(x) else {},
+            # 'autosize': False,
+            # 'width': 600,
+            # 'height': 500,
         }
-    )
+    }
+    return figure
+
+
+def get_range_end(x):
+    """
+        Return end of the initial date range of xaxis, the day after the
+        last date of x
+    """
+
+    return (x.max() + pd.DateOffset(days=1)).strftime('%Y-%m-%d')
+
+
+def generate_plot(x, y, type, title, color,
+                  mean_legend=False, mean_y=None, xaxis_start_date='2020-03-01',
+                  graph_id=None):
+    """
+        Generate dash core components graph object. Graphs with graph_id
+        are downsampled in adaptive mode and refined on zoom
+    """
+
+    adaptive = graph_id is not None and downsample.DOWNSAMPLE_MODE == 'adaptive'
+    if adaptive:
+        if mean_y is None:
+            x, (y,) = downsample.downsample(x, [y])
+        else:
+            x, (y, mean_y) = downsample.downsample(x, [y, mean_y])
+
+    figure = get_plot_figure(
+        x, y, type, title, color, mean_legend, mean_y, xaxis_start_date)
+    if adaptive:
+        # keep zoom when the zoom callback replaces the data
+        figure['layout']['uirevision'] = 'zoom'
+    if graph_id is None:
+        return dcc.Graph(figure=figure)
+    return dcc.Graph(id=graph_id, figure=figure)
+
+
+def get_cfr_figure(x, y, xaxis_start_date):
+    """
+        Return figure of the case fatality rate chart
+    """
+
+    figure = get_plot_figure(x, y, 'line', 'Case Fatality Rate', 'purple',
+                             xaxis_start_date=xaxis_start_date)
+    figure['layout']['yaxis'] = {
+        'tickformat': ',.1%',
+    }
+    return figure
+
+
+def generate_cfr_plot(cfr_ser, xaxis_start_date, graph_id=None):
+    """
+        Generate case fatality rate graph object
+    """
+
+    x = cfr_ser.index
+    y = cfr_ser.values
+    adaptive = graph_id is not None and downsample.DOWNSAMPLE_MODE == 'adaptive'
+    if adaptive:
+        x, (y,) = downsample.downsample(x, [y])
+
+    figure = get_cfr_figure(x, y, xaxis_start_date)
+    if adaptive:
+        figure['layout']['uirevision'] = 'zoom'
+    if graph_id is None:
+        return dcc.Graph(figure=figure)
+    return dcc.Graph(id=graph_id, figure=figure)
+
+
+# indicators drawn by the layouts of every metric type
+INDICATOR_CHARTS = {
+    'cumulative': ['active', 'cfr'],
+    'new': ['new_active', 'new_confirmed_mean7', 'new_deaths_mean7'],
+}
+
+# charts with a 7 days average line and the indicator drawing it
+MEAN_CHARTS = {
+    'new_confirmed': 'new_confirmed_mean7',
+    'new_deaths': 'new_deaths_mean7',
+}
+
+
+def get_indicator_sers(stores, metric_type, country=None, province=None):
+    """
+        Return series of indicators drawn by layouts of metric_type
+
+        Return
+        ------
+
+        dict
+            pandas.Series by indicator name
+    """
+
+    indicator_store = stores[indicators.STORE_NAME]
+    return {
+        name: indicator_store.get_series(name, country, province)
+        for name in INDICATOR_CHARTS[metric_type]
+    }
+
+
+def get_metric_series(stores, name, metric_type, country=None, province=None):
+    """
+        Return series of a metric on the dates of confirmed cases. Regions
+        a source does not report, e.g. provinces of Canada in recovered
+        cases, are NaN on every date, so all metrics of a region confirmed
+        cases are reported for can be drawn.
+    """
+
+    ser = stores[name].get_series(metric_type, country, province)
+    if name == 'confirmed':
+        return ser
+    dates = stores['confirmed'].get_series(metric_type, country, province).index
+    if ser.index.equals(dates):
+        return ser
+    return ser.reindex(dates)
+
+
+def get_chart_series(stores, chart, country=None, province=None):
+    """
+        Return series of every trace of a chart
+
+        Parameters
+        ----------
+
+        stores : dict
+            store.MetricStore of every processed frame and of indicators
+
+        chart : str
+            One of ['confirmed', 'recovered', 'active', 'deaths', 'cfr'],
+            prefixed with 'new_' for new cases except 'cfr'
+
+        country : str
+            If None global stats is provided
+
+        province : str
+            If provided stats of the province of the country
+
+
+        Return
+        ------
+
+        list
+            pandas.Series of the chart and of its average line if it has one
+    """
+
+    metric_type = 'new' if chart.startswith('new_') else 'cumulative'
+    name = chart[len('new_'):] if metric_type == 'new' else chart
+
+    if name in stores:
+        ser = get_metric_series(stores, name, metric_type, country, province)
+    else:
+        ser = stores[indicators.STORE_NAME].get_series(chart, country, province)
+    if chart in MEAN_CHARTS:
+        return [ser, stores[indicators.STORE_NAME].get_series(
+            MEAN_CHARTS[chart], country, province)]
+    return [ser]
+
+
+def get_key_metric_value(ser):
+    """
+        Return last value of a key metric, None if it is not reported
+    """
+
+    value = ser.values[-1]
+    return None if pd.isna(value) else value
+
+
+def get_key_metric_title(title, value):
+    """
+        Return title of a key metric indicator, marked for missing values
+    """
+
+    if value is None:
+        return '{}<br><span style="font-size:0.5em">no data</span>'.format(title)
+    return title
 
 
 def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
@@ -199,6 +562,9 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
             One of ['cumulative', 'new]
     """
 
+    # deferred, plotly is slow to import and not needed to boot from snapshot
+    import plotly.graph_objs as go
+
     fig = go.Figure()
 
     if metric_type == 'cumulative':
@@ -236,9 +602,21 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
         delta_recovered = None
         delta_deaths = None
 
+    # metrics a source does not report for the region are NaN, e.g.
+    # recovered cases of provinces of Canada, and shown as no data
+    confirmed_value = get_key_metric_value(confirmed_ser)
+    recovered_value = get_key_metric_value(recovered_ser)
+    deaths_value = get_key_metric_value(deaths_ser)
+    if confirmed_value is None:
+        delta_confirmed = None
+    if recovered_value is None:
+        delta_recovered = None
+    if deaths_value is None:
+        delta_deaths = None
+
     fig.add_trace(go.Indicator(
         mode=mode,
-        value=confirmed_ser.values[-1],
+        value=confirmed_value,
         number={
             "valueformat": ">,d",
             'font': {
@@ -248,7 +626,7 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
         },
         domain={'row': 0, 'column': 0},
         title={
-            'text': 'Confirmed',
+            'text': get_key_metric_title('Confirmed', confirmed_value),
             'font': {
                 'size': 24,
                 'color': 'blue',
@@ -258,7 +636,7 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
 
     fig.add_trace(go.Indicator(
         mode=mode,
-        value=recovered_ser.values[-1],
+        value=recovered_value,
         number={
             "valueformat": ">,d",
             'font': {
@@ -268,7 +646,7 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
         },
         domain={'row': 0, 'column': 1},
         title={
-            'text': 'Recovered',
+            'text': get_key_metric_title('Recovered', recovered_value),
             'font': {
                 'size': 24,
                 'color': 'green',
@@ -278,7 +656,7 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
 
     fig.add_trace(go.Indicator(
         mode=mode,
-        value=deaths_ser.values[-1],
+        value=deaths_value,
         number={
             "valueformat": ">,d",
             'font': {
@@ -288,7 +666,7 @@ def get_key_metrics_fig(confirmed_ser, recovered_ser, deaths_ser, metric_type):
         },
         domain={'row': 0, 'column': 2},
         title={
-            'text': 'Deaths',
+            'text': get_key_metric_title('Deaths', deaths_value),
             'font': {
                 'size': 24,
                 'color': 'red',
@@ -312,6 +690,10 @@ def render_map_chart(confirmed_df):
         Return map figure object
     """
 
+    # deferred, plotly express is slow to import
+    import plotly.express as px
+
+    confirmed_df = expand_processed_df(confirmed_df)
     confirmed_df['Norm'] = (confirmed_df.value ** 0.5 / confirmed_df.value.max() ** 0.5) * 50
 
     confirmed_df.rename(columns={'value': 'Confirmed Cases'}, inplace=True)
@@ -372,156 +754,156 @@ def render_map_chart(confirmed_df):
     return fig_map
 
 
-def render_rus_cumulative_content(rus_confirmed_cum_ser, rus_recovered_cum_ser,
-                                  rus_deaths_cum_ser):
+def render_country_cumulative_content(country_confirmed_cum_ser,
+                                      country_recovered_cum_ser,
+                                      country_deaths_cum_ser,
+                                      indicator_sers,
+                                      country=None, province=None):
     """
-        Render Russian cumulative stats
+        Render country cumulative stats. indicator_sers are series returned
+        by get_indicator_sers()
     """
 
     fig = get_key_metrics_fig(
-        rus_confirmed_cum_ser, rus_recovered_cum_ser,
-        rus_deaths_cum_ser, 'cumulative'
+        country_confirmed_cum_ser, country_recovered_cum_ser,
+        country_deaths_cum_ser, 'cumulative'
     )
 
-    rus_active_cum_ser = rus_confirmed_cum_ser - rus_recovered_cum_ser
+    country_active_cum_ser = indicator_sers['active']
 
-    rus_cfr = rus_deaths_cum_ser / (rus_deaths_cum_ser + rus_recovered_cum_ser)
+    country_cfr = indicator_sers['cfr']
 
     return html.Div(children=[
         dcc.Graph(figure=fig),
         generate_plot(
-            x=rus_confirmed_cum_ser.index,
-            y=rus_confirmed_cum_ser.values,
+            x=country_confirmed_cum_ser.index,
+            y=country_confirmed_cum_ser.values,
             type='bar',
             title='Confirmed Cases',
-            color='blue'
+            color='blue',
+            graph_id=downsample.graph_id('confirmed', country, province)
         ),
         generate_plot(
-            x=rus_recovered_cum_ser.index,
-            y=rus_recovered_cum_ser.values,
+            x=country_recovered_cum_ser.index,
+            y=country_recovered_cum_ser.values,
             type='bar',
             title='Recovered',
-            color='green'
+            color='green',
+            graph_id=downsample.graph_id('recovered', country, province)
         ),
         generate_plot(
-            x=rus_active_cum_ser.index,
-            y=rus_active_cum_ser.values,
+            x=country_active_cum_ser.index,
+            y=country_active_cum_ser.values,
             type='bar',
             title='Active',
-            color='orange'
+            color='orange',
+            graph_id=downsample.graph_id('active', country, province)
         ),
         generate_plot(
-            x=rus_deaths_cum_ser.index,
-            y=rus_deaths_cum_ser.values,
+            x=country_deaths_cum_ser.index,
+            y=country_deaths_cum_ser.values,
             type='bar',
             title='Deaths',
-            color='red'
+            color='red',
+            graph_id=downsample.graph_id('deaths', country, province)
+        ),
+        generate_cfr_plot(
+            country_cfr, '2020-04-01',
+            graph_id=downsample.graph_id('cfr', country, province)
         ),
-        dcc.Graph(figure={
-            'data': [
-                {
-                    'x': rus_cfr.index,
-                    'y': rus_cfr.values,
-                    'type': 'line',
-                    'name': 'Case Fatality Rate',
-                    'marker': {'color': 'purple'},
-                }
-            ],
-            'layout': {
-                'plot_bgcolor': '#FFFFFF',
-                'paper_bgcolor': '#FFFFFF',
-                'font': {'color': 'purple'},
-                'legend': {
-                    'orientation': 'h',
-                    'x': 0.5,
-                    'xanchor': 'center',
-                },
-                'color': 'purple',
-                'title': {
-                    'text': 'Case Fatality Rate',
-                    'font': {
-                        'color': 'purple',
-                        'size': 24,
-                    }
-                },
-                'xaxis': {
-                    # initial date range of xaxis
-                    'range': ['2020-04-01', (rus_cfr.index.max() + pd.DateOffset(days=1)).strftime('%Y-%m-%d')]
-                },
-                'yaxis': {
-                    'tickformat': ',.1%',
-                },
-                # 'autosize': False,
-                # 'width': 600,
-                # 'height': 500,
-            }
-        }),
     ])
 
 
-def render_rus_new_content(rus_new_cases_ser, rus_new_recovered_ser,
-                           rus_new_deaths_ser):
+def render_country_new_content(country_new_cases_ser,
+                               country_new_recovered_ser,
+                               country_new_deaths_ser,
+                               indicator_sers,
+                               country=None, province=None):
     """
-        Render Russian new stats
+        Render country new stats. indicator_sers are series returned by
+        get_indicator_sers()
     """
 
     fig = get_key_metrics_fig(
-        rus_new_cases_ser, rus_new_recovered_ser, rus_new_deaths_ser, 'new'
+        country_new_cases_ser, country_new_recovered_ser, country_new_deaths_ser, 'new'
     )
 
-    rus_active_new_ser = rus_new_cases_ser - rus_new_recovered_ser
+    country_active_new_ser = indicator_sers['new_active']
 
     return html.Div(children=[
         dcc.Graph(figure=fig),
         generate_plot(
-            x=rus_new_cases_ser.index,
-            y=rus_new_cases_ser.values,
+            x=country_new_cases_ser.index,
+            y=country_new_cases_ser.values,
             type='bar',
             title='New Cases',
             color='blue',
             mean_legend=True,
-            mean_y=rus_new_cases_ser.rolling(window=7).mean().round().values
+            mean_y=indicator_sers['new_confirmed_mean7'].values,
+            graph_id=downsample.graph_id('new_confirmed', country, province)
         ),
         generate_plot(
-            x=rus_new_recovered_ser.index,
-            y=rus_new_recovered_ser.values,
+            x=country_new_recovered_ser.index,
+            y=country_new_recovered_ser.values,
             type='bar',
             title='New Recovered',
-            color='green'
+            color='green',
+            graph_id=downsample.graph_id('new_recovered', country, province)
         ),
         generate_plot(
-            x=rus_active_new_ser.index,
-            y=rus_active_new_ser.values,
+            x=country_active_new_ser.index,
+            y=country_active_new_ser.values,
             type='bar',
             title='New active',
             color='orange',
+            graph_id=downsample.graph_id('new_active', country, province)
         ),
         generate_plot(
-            x=rus_new_deaths_ser.index,
-            y=rus_new_deaths_ser.values,
+            x=country_new_deaths_ser.index,
+            y=country_new_deaths_ser.values,
             type='bar',
             title='New Deaths',
             color='red',
             mean_legend=True,
-            mean_y=rus_new_deaths_ser.rolling(window=7).mean().round().values
+            mean_y=indicator_sers['new_deaths_mean7'].values,
+            graph_id=downsample.graph_id('new_deaths', country, province)
         ),
     ])
 
 
+def render_map_title():
+    """
+        Render title of the world map
+    """
+
+    return html.Div(
+        'Spread of the COVID-19 around the world. Confirmed cases',
+        style={
+            # 'color': 'blue',
+            'fontSize': 24,
+            'marginBottom': 0,
+            'paddingBottom': 0,
+            'textAlign': 'center'
+        }
+    )
+
+
 def render_global_cumulative_content(
     global_confirmed_cum_ser, global_recovered_cum_ser,
-    global_deaths_cum_ser, map_fig
+    global_deaths_cum_ser, indicator_sers, map_content
 ):
     """
-        Render worldwide cumulative stats
+        Render worldwide cumulative stats. indicator_sers are series
+        returned by get_indicator_sers(), map_content is the component tree
+        of the world map
     """
 
     fig = get_key_metrics_fig(global_confirmed_cum_ser, global_recovered_cum_ser,
                               global_deaths_cum_ser, 'cumulative')
 
-    global_active_cum_ser = global_confirmed_cum_ser - global_recovered_cum_ser
+    global_active_cum_ser = indicator_sers['active']
 
-    global_cfr = global_deaths_cum_ser / (global_deaths_cum_ser + global_recovered_cum_ser)
+    global_cfr = indicator_sers['cfr']
 
     return html.Div(children=[
         dcc.Graph(figure=fig),
@@ -530,95 +912,52 @@ def render_global_cumulative_content(
             y=global_confirmed_cum_ser.values,
             type='bar',
             title='Confirmed Cases',
-            color='blue'
-        ),
-        html.Div(
-            'Spread of the COVID-19 around the world. Confirmed cases',
-            style={
-                # 'color': 'blue',
-                'fontSize': 24,
-                'marginBottom': 0,
-                'paddingBottom': 0,
-                'textAlign': 'center'
-            }
-        ),
-        dcc.Graph(
-            figure=map_fig
+            color='blue',
+            graph_id=downsample.graph_id('confirmed')
         ),
+        render_map_title(),
+        map_content,
         generate_plot(
             x=global_recovered_cum_ser.index,
             y=global_recovered_cum_ser.values,
             type='bar',
             title='Recovered',
-            color='green'
+            color='green',
+            graph_id=downsample.graph_id('recovered')
         ),
         generate_plot(
             x=global_active_cum_ser.index,
             y=global_active_cum_ser.values,
             type='bar',
             title='Active',
-            color='orange'
+            color='orange',
+            graph_id=downsample.graph_id('active')
         ),
         generate_plot(
             x=global_deaths_cum_ser.index,
             y=global_deaths_cum_ser.values,
             type='bar',
             title='Deaths',
-            color='red'
+            color='red',
+            graph_id=downsample.graph_id('deaths')
         ),
-        dcc.Graph(figure={
-            'data': [
-                {
-                    'x': global_cfr.index,
-                    'y': global_cfr.values,
-                    'type': 'line',
-                    'name': 'Case Fatality Rate',
-                    'marker': {'color': 'purple'},
-                }
-            ],
-            'layout': {
-                'plot_bgcolor': '#FFFFFF',
-                'paper_bgcolor': '#FFFFFF',
-                'font': {'color': 'purple'},
-                'legend': {
-                    'orientation': 'h',
-                    'x': 0.5,
-                    'xanchor': 'center',
-                },
-                'color': 'purple',
-                'title': {
-                    'text': 'Case Fatality Rate',
-                    'font': {
-                        'color': 'purple',
-                        'size': 24,
-                    }
-                },
-                'xaxis': {
-                    # initial date range of xaxis
-                    'range': ['2020-02-01', (global_cfr.index.max() + pd.DateOffset(days=1)).strftime('%Y-%m-%d')]
-                },
-                'yaxis': {
-                    'tickformat': ',.1%',
-                },
-                # 'autosize': False,
-                # 'width': 600,
-                # 'height': 500,
-            }
-        }),
+        generate_cfr_plot(global_cfr, '2020-02-01', graph_id=downsample.graph_id('cfr')),
     ])
 
 
 def render_global_new_content(
-    global_confirmed_new_ser, global_new_recovered_ser, global_new_deaths_ser
+    global_confirmed_new_ser, global_new_recovered_ser, global_new_deaths_ser,
+    indicator_sers
 ):
     """
-        Render worldwide new cases stats
+        Render worldwide new cases stats. indicator_sers are series returned
+        by get_indicator_sers()
     """
 
     fig = get_key_metrics_fig(global_confirmed_new_ser, global_new_recovered_ser,
                               global_new_deaths_ser, 'new')
 
-    global_active_new_ser = global_confirmed_new_ser - global_new_recovered_ser
+    global_active_new_ser = indicator_sers['new_active']
 
     return html.Div(children=[
         dcc.Graph(figure=fig),
@@ -629,14 +968,16 @@ def render_global_new_content(
             title='New Cases',
             color='blue',
             mean_legend=True,
-            mean_y=global_confirmed_new_ser.rolling(window=7).mean().round().values
+            mean_y=indicator_sers['new_confirmed_mean7'].values,
+            graph_id=downsample.graph_id('new_confirmed')
         ),
         generate_plot(
             x=global_new_recovered_ser.index,
             y=global_new_recovered_ser.values,
             type='bar',
             title='New Recovered',
-            color='green'
+            color='green',
+            graph_id=downsample.graph_id('new_recovered')
         ),
         generate_plot(
             x=global_active_new_ser.index,
@@ -644,6 +985,7 @@ def render_global_new_content(
             type='bar',
             title='New active',
             color='orange',
+            graph_id=downsample.graph_id('new_active')
         ),
         generate_plot(
             x=global_new_deaths_ser.index,
@@ -652,44 +994,268 @@ def render_global_new_content(
             title='New Deaths',
             color='red',
             mean_legend=True,
-            mean_y=global_new_deaths_ser.rolling(window=7).mean().round().values
+            mean_y=indicator_sers['new_deaths_mean7'].values,
+            graph_id=downsample.graph_id('new_deaths')
         ),
     ])
 
 
-confirmed_df = get_processed_df(CONFIRMED_CSV)
-recovered_df = get_processed_df(RECOVERED_CSV)
-deaths_df = get_processed_df(DEATHS_CSV)
-
-# confirmed
-global_confirmed_cum = get_metric_ser(confirmed_df, 'cumulative')
-global_confirmed_new = get_metric_ser(confirmed_df, 'new')
-rus_confirmed_cum = get_metric_ser(confirmed_df, 'cumulative', 'Russia')
-rus_new_cases = get_metric_ser(confirmed_df, 'new', 'Russia')
-
-# recovered
-global_recovered_cum = get_metric_ser(recovered_df, 'cumulative')
-global_new_recovered = get_metric_ser(recovered_df, 'new')
-rus_recovered_cum = get_metric_ser(recovered_df, 'cumulative', 'Russia')
-rus_new_recovered = get_metric_ser(recovered_df, 'new', 'Russia')
-
-# deaths
-global_deaths_cum = get_metric_ser(deaths_df, 'cumulative')
-global_new_deaths = get_metric_ser(deaths_df, 'new')
-rus_deaths_cum = get_metric_ser(deaths_df, 'cumulative', 'Russia')
-rus_new_deaths = get_metric_ser(deaths_df, 'new', 'Russia')
-
-map_fig = render_map_chart(confirmed_df)
-
-global_cum_layout = render_global_cumulative_content(
-    global_confirmed_cum, global_recovered_cum, global_deaths_cum, map_fig
-)
-global_new_layout = render_global_new_content(
-    global_confirmed_new, global_new_recovered, global_new_deaths
-)
-rus_cum_layout = render_rus_cumulative_content(
-    rus_confirmed_cum, rus_recovered_cum, rus_deaths_cum
-)
-rus_new_layout = render_rus_new_content(
-    rus_new_cases, rus_new_recovered, rus_new_deaths
-)
+def load_processed_df(metric_csv, timings=None):
+    """
+        Return processed DataFrame for the source csv file. Processed frames
+        are cached on disk and the source is only processed again when its
+        content changes.
+
+        Parameters
+        ----------
+
+        metric_csv : str
+            Full url or local path to target csv file
+
+        timings : dict
+            If provided, filled with seconds spent in stages
+            ['fetch', 'cache', 'process'], flag 'cached', in
+            incremental mode with 'mode' and 'changed_columns' and in
+            streaming mode with the report of streaming.get_processed_df()
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Same frame as returned by get_processed_df()
+    """
+
+    if timings is None:
+        timings = {}
+    timings.update(fetch=0.0, cache=0.0, process=0.0, cached=False)
+
+    started = time.perf_counter()
+    source = sources.fetch(metric_csv)
+    timings['fetch'] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    cache_key = '{}-v{}'.format(source.digest, PROCESSED_DF_VERSION)
+    processed_df = frame_cache.load(source.name, cache_key)
+    timings['cache'] += time.perf_counter() - started
+    if processed_df is not None:
+        timings['cached'] = True
+        return processed_df
+
+    if source.content is None:
+        # unchanged source whose processed frame is not cached anymore
+        started = time.perf_counter()
+        source = sources.fetch(metric_csv, force=True)
+        timings['fetch'] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    if INGEST_MODE == 'incremental':
+        processed_df = incremental.get_processed_df(
+            source.name, sources.open_content(source), timings)
+    elif INGEST_MODE == 'streaming':
+        processed_df = streaming.get_processed_df(
+            sources.open_content(source), timings)
+    else:
+        processed_df = get_processed_df(sources.open_content(source))
+    timings['process'] += time.perf_counter() - started
+
+    started = time.perf_counter()
+    frame_cache.save(source.name, cache_key, processed_df)
+    timings['cache'] += time.perf_counter() - started
+    return processed_df
+
+
+def _load_timed(metric_csv):
+    # module level function, so it can run in a process pool
+    timings = {}
+    started = time.perf_counter()
+    processed_df = load_processed_df(metric_csv, timings)
+    timings['total'] = time.perf_counter() - started
+    return processed_df, timings
+
+
+def load_frames(timings=None):
+    """
+        Download and process all source csv files concurrently with
+        INGEST_WORKERS workers of INGEST_EXECUTOR type
+
+        Parameter
+        ---------
+
+        timings : dict
+            If provided, filled with timings of every source as returned
+            in timings of load_processed_df() plus 'total'
+
+
+        Return
+        ------
+
+        dict
+            Processed pandas DataFrames with keys
+            ['confirmed', 'recovered', 'deaths']
+    """
+
+    metric_csvs = {
+        'confirmed': CONFIRMED_CSV,
+        'recovered': RECOVERED_CSV,
+        'deaths': DEATHS_CSV,
+    }
+
+    if INGEST_WORKERS <= 1:
+        results = {
+            name: _load_timed(metric_csv)
+            for name, metric_csv in metric_csvs.items()
+        }
+    else:
+        if INGEST_EXECUTOR == 'process':
+            executor = concurrent.futures.ProcessPoolExecutor(INGEST_WORKERS)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(INGEST_WORKERS)
+        with executor:
+            futures = {
+                name: executor.submit(_load_timed, metric_csv)
+                for name, metric_csv in metric_csvs.items()
+            }
+            results = {name: future.result() for name, future in futures.items()}
+
+    frames = {}
+    for name, (processed_df, source_timings) in results.items():
+        frames[name] = processed_df
+        for stage in ('fetch', 'cache', 'process'):
+            instrumentation.observe_stage(stage, source_timings[stage], source=name)
+        logger.info(
+            '%s: %.2fs total, fetch %.2fs, process %.2fs, cache %.2fs%s',
+            name, source_timings['total'], source_timings['fetch'],
+            source_timings['process'], source_timings['cache'],
+            ' (cached)' if source_timings['cached'] else ''
+        )
+        memory = get_memory_report(processed_df)
+        logger.info('%s: %d rows, %.1f KiB in memory',
+                    name, memory['rows'], memory['total'] / 1024)
+        if 'peak_bytes' in source_timings:
+            logger.info('%s: streamed in %d chunks, peak %.1f KiB',
+                        name, source_timings['chunks'],
+                        source_timings['peak_bytes'] / 1024)
+        elif 'estimated_peak_bytes' in source_timings:
+            logger.info('%s: streamed in %d chunks, estimated peak %.1f KiB',
+                        name, source_timings['chunks'],
+                        source_timings['estimated_peak_bytes'] / 1024)
+        if timings is not None:
+            timings[name] = source_timings
+    return frames
+
+
+@instrumentation.timed_stage('render_country_layout')
+def render_country_layout(stores, country, metric_type, province=None):
+    """
+        Render stats of a single country or of one of its provinces
+
+        Parameters
+        ----------
+
+        stores : dict
+            store.MetricStore of every processed frame and of indicators
+
+        country : str
+            Country name as in the source files
+
+        metric_type : str
+            One of ['cumulative', 'new']
+
+        province : str
+            Province name as in the source files, None for the whole country
+
+
+        Return
+        ------
+
+        dash_html_components.Div
+            Country layout
+    """
+
+    confirmed_ser = get_metric_series(stores, 'confirmed', metric_type, country, province)
+    recovered_ser = get_metric_series(stores, 'recovered', metric_type, country, province)
+    deaths_ser = get_metric_series(stores, 'deaths', metric_type, country, province)
+
+    if confirmed_ser.empty:
+        name = country if not province else '{}, {}'.format(province, country)
+        return html.Div('No data for {}'.format(name),
+                        style={'textAlign': 'center'})
+    indicator_sers = get_indicator_sers(stores, metric_type, country, province)
+    if metric_type == 'cumulative':
+        return render_country_cumulative_content(
+            confirmed_ser, recovered_ser, deaths_ser, indicator_sers,
+            country, province)
+    if metric_type == 'new':
+        return render_country_new_content(
+            confirmed_ser, recovered_ser, deaths_ser, indicator_sers,
+            country, province)
+
+
+def get_countries(stores):
+    """
+        Return sorted list of countries present in the metric stores
+    """
+
+    return list(stores['confirmed'].countries)
+
+
+def get_provinces(stores, country):
+    """
+        Return sorted list of provinces of a country split into provinces
+    """
+
+    return stores['confirmed'].get_provinces(country)
+
+
+@instrumentation.timed_stage('build_layouts')
+def build_layouts(frames, stores, map_frames=None):
+    """
+        Render worldwide layouts. Country layouts are rendered on demand
+        with render_country_layout()
+
+        Parameters
+        ----------
+
+        frames : dict
+            Processed DataFrames returned by load_frames()
+
+        stores : dict
+            store.MetricStore of every processed frame and of indicators
+
+        map_frames : mapframes.MapFrames
+            Precomputed map frames for the lazy map. If None the animated
+            map with all frames is rendered
+
+
+        Return
+        ------
+
+        dict
+            Dash component trees with keys ['global_cum', 'global_new'] and
+            the titled world map alone with key 'map'
+    """
+
+    def get_global_sers(metric_type):
+        return [
+            stores[metric].get_series(metric_type)
+            for metric in ('confirmed', 'recovered', 'deaths')
+        ]
+
+    if map_frames is not None:
+        map_content = mapframes.render_map_content(map_frames)
+    else:
+        map_content = dcc.Graph(figure=render_map_chart(frames['confirmed']))
+
+    return {
+        'global_cum': render_global_cumulative_content(
+            *get_global_sers('cumulative'),
+            get_indicator_sers(stores, 'cumulative'),
+            map_content
+        ),
+        'global_new': render_global_new_content(
+            *get_global_sers('new'),
+            get_indicator_sers(stores, 'new')
+        ),
+        'map': html.Div([render_map_title(), map_content]),
+    }
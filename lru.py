@@ -0,0 +1,90 @@
+"""
+    Bounded least recently used cache with hit, miss and eviction counters.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+        Thread-safe LRU cache
+
+        Parameter
+        ---------
+
+        maxsize : int
+            Maximum number of entries kept in the cache
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+            Return cached value and mark it as recently used
+        """
+
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+            Store value evicting least recently used entries over maxsize
+        """
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key, create):
+        """
+            Return cached value or store and return result of create().
+            create() runs outside of the lock, so slow renders do not block
+            lookups of other keys.
+        """
+
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = create()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """
+            Remove all entries
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+            Return dict with cache counters
+        """
+
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
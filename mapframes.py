@@ -0,0 +1,155 @@
+"""
+    Lazily delivered world map.
+
+    Instead of serializing every animation frame into the World tab, the map
+    is sent with the latest frame only. Moving the date slider fetches the
+    requested frame together with its neighbours from frames precomputed on
+    the server, and a clientside callback draws them from a dcc.Store.
+"""
+import os
+from collections import namedtuple
+
+import dash_core_components as dcc
+import dash_html_components as html
+import pandas as pd
+
+import instrumentation
+import layouts
+
+# 'lazy' sends one frame at a time, 'animated' embeds all frames
+MAP_MODE = os.environ.get('MAP_MODE', 'lazy')
+
+# number of frames prefetched on both sides of the requested one
+MAP_PREFETCH_FRAMES = int(os.environ.get('MAP_PREFETCH_FRAMES', 3))
+
+# same frame speed as the animated map
+MAP_FRAME_DURATION = 225
+
+MAP_SIZE_MAX = 50
+
+MapFrames = namedtuple('MapFrames', ['dates', 'traces', 'layout'])
+
+
+@instrumentation.timed_stage('build_map_frames')
+def build_map_frames(confirmed_df):
+    """
+        Precompute map traces for every 2-day bucket
+
+        Parameter
+        ---------
+
+        confirmed_df : pandas.DataFrame
+            Processed DataFrame of confirmed cases
+
+
+        Return
+        ------
+
+        MapFrames
+            Bucket dates, scattermapbox trace of every bucket and shared
+            figure layout
+    """
+
+    map_df = layouts.expand_processed_df(confirmed_df)[['country', 'date', 'value', 'Lat', 'Long']]
+    map_df['Norm'] = (map_df.value ** 0.5 / map_df.value.max() ** 0.5) * MAP_SIZE_MAX
+    map_df = map_df.groupby([
+        pd.Grouper(key='date', freq='2D'),
+        'country',
+        'Lat',
+        'Long'
+    ])[['value', 'Norm']].max().reset_index()
+
+    cmax = float(map_df.value.max())
+    dates = []
+    traces = []
+    for date, frame_df in map_df.groupby('date'):
+        dates.append(date.strftime('%Y-%m-%d'))
+        traces.append({
+            'type': 'scattermapbox',
+            'mode': 'markers',
+            'lat': frame_df.Lat.round(3).tolist(),
+            'lon': frame_df.Long.round(3).tolist(),
+            'text': frame_df.country.tolist(),
+            'marker': {
+                'size': frame_df.Norm.round(2).tolist(),
+                'sizemode': 'area',
+                # plotly express sizeref for max(Norm) == MAP_SIZE_MAX
+                'sizeref': 2.0 * MAP_SIZE_MAX / MAP_SIZE_MAX ** 2,
+                'color': frame_df.value.tolist(),
+                'colorscale': 'Portland',
+                'cmin': 0,
+                'cmax': cmax,
+                'colorbar': {'title': {'text': 'Confirmed Cases'}},
+            },
+            'hovertemplate': (
+                '<b>%{text}</b><br>Confirmed Cases: %{marker.color:,}<extra></extra>'),
+        })
+
+    layout = {
+        'mapbox': {
+            'style': 'carto-positron',
+            'center': {'lat': 32, 'lon': 4},
+            'zoom': 1,
+        },
+        'width': 1250,
+        'height': 630,
+        'margin': {'r': 0, 't': 0, 'l': 50, 'b': 0},
+    }
+
+    return MapFrames(dates=dates, traces=traces, layout=layout)
+
+
+def get_prefetched_traces(map_frames, index, prefetch=MAP_PREFETCH_FRAMES):
+    """
+        Return traces of the requested frame and its neighbours
+
+        Return
+        ------
+
+        dict
+            Traces by frame index, keys are strings as in JSON
+    """
+
+    start = max(index - prefetch, 0)
+    stop = min(index + prefetch + 1, len(map_frames.traces))
+    return {str(i): map_frames.traces[i] for i in range(start, stop)}
+
+
+def render_map_content(map_frames):
+    """
+        Return lazy map component tree with the latest frame
+    """
+
+    last = len(map_frames.dates) - 1
+    # around a dozen slider marks regardless of the number of frames
+    step = max(len(map_frames.dates) // 12, 1)
+    marks = {
+        i: {'label': map_frames.dates[i][5:]}
+        for i in range(last, -1, -step)
+    }
+
+    return html.Div([
+        html.Div([
+            html.Button('Play', id='map-play-button', n_clicks=0, className='btn'),
+            html.Span(
+                map_frames.dates[last], id='map-date-label',
+                style={'color': 'indianred', 'fontSize': 20, 'marginLeft': 20}
+            ),
+        ], style={'marginLeft': 50}),
+        dcc.Slider(
+            id='map-date-slider', min=0, max=last, value=last, step=1,
+            marks=marks
+        ),
+        dcc.Interval(
+            id='map-interval', interval=MAP_FRAME_DURATION, disabled=True
+        ),
+        dcc.Store(id='map-frame-dates', data=map_frames.dates),
+        dcc.Store(
+            id='map-frame-store',
+            data=get_prefetched_traces(map_frames, last, 0)
+        ),
+        dcc.Graph(
+            id='map-graph',
+            figure={'data': [map_frames.traces[last]], 'layout': map_frames.layout}
+        ),
+    ])
@@ -0,0 +1,154 @@
+"""
+    Pre-encoded callback responses.
+
+    Responses of registered callback outputs are serialized by Dash once per
+    data version, compressed with gzip and brotli and kept in the result
+    cache, which is shared by all workers with a shared backend. Repeated
+    requests with the same inputs are answered from these bytes with ETag
+    and If-None-Match support, without running the callback or encoding its
+    result.
+"""
+import gzip
+import hashlib
+import os
+from collections import namedtuple
+
+import brotli
+import flask
+
+import instrumentation
+import refresh
+from result_cache import ResultCache
+
+PAYLOAD_CACHE_SIZE = int(os.environ.get('PAYLOAD_CACHE_SIZE', 256))
+
+# payloads are encoded inside the first request of every key and data
+# version, higher levels cost far more time than they save bytes
+PAYLOAD_BROTLI_QUALITY = int(os.environ.get('PAYLOAD_BROTLI_QUALITY', 5))
+PAYLOAD_GZIP_LEVEL = int(os.environ.get('PAYLOAD_GZIP_LEVEL', 6))
+
+DASH_UPDATE_PATH = '_dash-update-component'
+
+Payload = namedtuple('Payload', ['etag', 'encodings'])
+
+payload_cache = ResultCache('payloads', PAYLOAD_CACHE_SIZE)
+instrumentation.register_cache('payloads', payload_cache)
+
+# callback key functions by output, e.g. 'tabs-content.children'
+_key_funcs = {}
+
+
+def encode_payload(data):
+    """
+        Return Payload with identity, gzip and brotli encoded data
+    """
+
+    return Payload(
+        etag=hashlib.sha1(data).hexdigest()[:20],
+        encodings={
+            'identity': data,
+            'gzip': gzip.compress(data, compresslevel=PAYLOAD_GZIP_LEVEL),
+            'br': brotli.compress(data, quality=PAYLOAD_BROTLI_QUALITY),
+        }
+    )
+
+
+def _accepted_encoding():
+    accepted = flask.request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if accepted[encoding]:
+            return encoding
+    return 'identity'
+
+
+def _get_request_key():
+    if not flask.request.path.endswith(DASH_UPDATE_PATH):
+        return None
+    body = flask.request.get_json(silent=True)
+    if not body:
+        return None
+    key_func = _key_funcs.get(body.get('output'))
+    if key_func is None:
+        return None
+
+    inputs = {}
+    for item in body.get('inputs', []):
+        # pattern-matching inputs are lists and never part of a key
+        if isinstance(item, dict) and isinstance(item.get('id'), str):
+            inputs['{}.{}'.format(item['id'], item['property'])] = item.get('value')
+    try:
+        key = key_func(inputs)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (body['output'], key, refresh.get_snapshot().version)
+
+
+def make_response(payload):
+    """
+        Return response with the best accepted encoding of payload, or 304
+        if the client has it already
+    """
+
+    if flask.request.if_none_match.contains(payload.etag):
+        response = flask.Response(status=304)
+    else:
+        encoding = _accepted_encoding()
+        response = flask.Response(
+            payload.encodings[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(payload.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _serve_cached():
+    key = _get_request_key()
+    if key is None:
+        return None
+    # the data version is the last item of the key
+    payload = payload_cache.get(key[:2], key[2])
+    if payload is None:
+        flask.g.payload_key = key
+        return None
+    return make_response(payload)
+
+
+def _store_response(response):
+    key = flask.g.pop('payload_key', None)
+    if key is None or response.status_code != 200:
+        return response
+    # do not store content rendered from a snapshot published meanwhile
+    if key[2] != refresh.get_snapshot().version:
+        return response
+    payload = encode_payload(response.get_data())
+    payload_cache.set(key[:2], key[2], payload)
+    return make_response(payload)
+
+
+def register(output, key_func):
+    """
+        Serve responses of callback output from pre-encoded payloads
+
+        Parameters
+        ----------
+
+        output : str
+            Callback output as sent by dash-renderer, e.g. 'tabs-content.children'
+
+        key_func : function
+            Receives dict of input values by 'id.property' and returns
+            hashable key, equal for inputs that render equal output
+    """
+
+    _key_funcs[output] = key_func
+
+
+def init_app(server):
+    """
+        Install request hooks on the Flask server
+    """
+
+    server.before_request(_serve_cached)
+    # registered after Dash compression, so it runs before it
+    server.after_request(_store_response)
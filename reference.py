@@ -0,0 +1,162 @@
+"""
+    Reference data of countries.
+
+    The centroid file is parsed once per process into arrays of ISO codes,
+    names, coordinates, population and UN region. Countries are resolved
+    by admin name, ISO code or JHU alias in one vectorized lookup, so JHU
+    names like 'US' or 'Korea, South' find their centroid and population.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+COUNTRIES_COORDINATES_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'country_centroids.csv')
+
+# JHU country names which differ from admin names of the centroid file
+ALIASES = {
+    'Bahamas': 'BHS',
+    'Burma': 'MMR',
+    'Cabo Verde': 'CPV',
+    'Congo (Brazzaville)': 'COG',
+    'Congo (Kinshasa)': 'COD',
+    "Cote d'Ivoire": 'CIV',
+    'Czechia': 'CZE',
+    'Eswatini': 'SWZ',
+    'Guinea-Bissau': 'GNB',
+    'Holy See': 'VAT',
+    'Korea, North': 'PRK',
+    'Korea, South': 'KOR',
+    'Micronesia': 'FSM',
+    'North Macedonia': 'MKD',
+    'Serbia': 'SRB',
+    'Taiwan*': 'TWN',
+    'Tanzania': 'TZA',
+    'Timor-Leste': 'TLS',
+    'US': 'USA',
+    'West Bank and Gaza': 'PSE',
+}
+
+_reference = None
+
+
+class ReferenceData:
+    """
+        Arrays of country attributes with a lookup of country keys
+
+        Parameter
+        ---------
+
+        centroid_df : pandas.DataFrame
+            Columns ['admin', 'iso_a3', 'adm0_a3', 'pop_est', 'region_un',
+            'Longitude', 'Latitude'] of the centroid file
+    """
+
+    def __init__(self, centroid_df):
+        # territories without ISO code keep the Natural Earth code
+        codes = centroid_df['iso_a3'].where(
+            centroid_df['iso_a3'] != '-99', centroid_df['adm0_a3'])
+        self.codes = codes.to_numpy(dtype=object)
+        self.names = centroid_df['admin'].to_numpy(dtype=object)
+        self.lat = centroid_df['Latitude'].to_numpy(dtype='float32')
+        self.long = centroid_df['Longitude'].to_numpy(dtype='float32')
+        population = centroid_df['pop_est'].to_numpy(dtype='float64')
+        population[population <= 0] = np.nan
+        self.population = population
+        self.regions = pd.Categorical(centroid_df['region_un'])
+
+        positions = np.arange(len(centroid_df))
+        code_pos = pd.Series(positions, index=self.codes)
+        aliases = pd.Series(ALIASES)
+        alias_pos = code_pos.reindex(aliases.to_numpy()).to_numpy()
+        keys = pd.concat([
+            pd.Series(positions, index=self.names),
+            code_pos,
+            pd.Series(alias_pos, index=aliases.index).dropna().astype('int64'),
+        ])
+        keys = keys[~keys.index.duplicated()]
+        self._keys = keys.index
+        self._key_pos = keys.to_numpy()
+
+    @classmethod
+    def from_csv(cls, path=COUNTRIES_COORDINATES_CSV):
+        centroid_df = pd.read_csv(
+            path,
+            usecols=['admin', 'iso_a3', 'adm0_a3', 'pop_est', 'region_un',
+                     'Longitude', 'Latitude'],
+            keep_default_na=False
+        )
+        return cls(centroid_df)
+
+    def lookup(self, countries):
+        """
+            Return positions of countries in the reference arrays, -1 for
+            unknown countries
+
+            Parameter
+            ---------
+
+            countries : array-like
+                Country names, JHU aliases or ISO codes
+        """
+
+        indexer = self._keys.get_indexer(pd.Index(countries, dtype=object))
+        return np.where(indexer >= 0, self._key_pos[indexer], -1)
+
+    def take(self, values, countries, fill):
+        """
+            Return reference values of countries, fill for unknown ones
+        """
+
+        positions = self.lookup(countries)
+        result = values[positions]
+        result[positions < 0] = fill
+        return result
+
+    def get_codes(self, countries):
+        """
+            Return ISO codes of countries, None for unknown ones
+        """
+
+        return self.take(self.codes, countries, None)
+
+    def get_coords(self, countries):
+        """
+            Return latitude and longitude arrays of centroids, NaN for
+            unknown countries
+        """
+
+        return (self.take(self.lat, countries, np.nan),
+                self.take(self.long, countries, np.nan))
+
+    def get_population(self, countries):
+        """
+            Return population of countries, NaN where it is unknown
+        """
+
+        return self.take(self.population, countries, np.nan)
+
+    def get_regions(self, countries):
+        """
+            Return UN regions of countries as pandas.Categorical, NaN for
+            unknown countries
+        """
+
+        positions = self.lookup(countries)
+        return pd.Categorical.from_codes(
+            np.where(positions >= 0, self.regions.codes[positions], -1),
+            self.regions.categories
+        )
+
+
+def get_reference():
+    """
+        Return ReferenceData of the centroid file. The file is parsed only
+        once per process.
+    """
+
+    global _reference
+
+    if _reference is None:
+        _reference = ReferenceData.from_csv()
+    return _reference
@@ -0,0 +1,461 @@
+"""
+    Background refresh of the dashboard data.
+
+    Processed frames and rendered layouts are published as an immutable
+    Snapshot. Readers take the current snapshot with get_snapshot() and use
+    it for the whole request, so a refresh running in the background never
+    exposes half-built data. Published snapshots are written to disk and the
+    next boot starts from there, refreshing the data in background.
+
+    With SHARED_DATA=1 processes never hold processed frames. One process at
+    a time builds a new snapshot on disk in a child process and every
+    process, e.g. each gunicorn worker, attaches to the current snapshot
+    read-only and switches when a new one is published.
+
+    Shared results of other data versions are dropped on every publish.
+
+    Background threads are started by the first request a process serves,
+    so a gunicorn --preload master never runs them and never forks in the
+    middle of a refresh.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import pandas as pd
+
+import indicators
+import instrumentation
+import layouts
+import mapframes
+import result_cache
+import startup_snapshot
+import store
+
+# seconds between two refreshes, 0 disables the background scheduler
+REFRESH_INTERVAL = int(os.environ.get('REFRESH_INTERVAL', 6 * 60 * 60))
+
+# boot from the startup snapshot on disk and write published snapshots there
+USE_STARTUP_SNAPSHOT = os.environ.get('USE_STARTUP_SNAPSHOT', '1') == '1'
+
+# attach to snapshots on disk instead of loading data in every process
+SHARED_DATA = os.environ.get('SHARED_DATA', '0') == '1'
+
+# seconds between checks for a new snapshot on disk in shared mode
+SHARED_DATA_POLL_INTERVAL = int(os.environ.get('SHARED_DATA_POLL_INTERVAL', 10))
+
+SNAPSHOT_BUILDER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'startup_snapshot.py')
+
+logger = logging.getLogger(__name__)
+
+# frames is None for a snapshot loaded from disk until the first refresh
+Snapshot = namedtuple(
+    'Snapshot',
+    ['version', 'created_at', 'frames', 'stores', 'map_frames', 'layouts']
+)
+
+_snapshot = None
+# serializes rebuilds, readers never take it
+_refresh_lock = threading.Lock()
+_stop_event = threading.Event()
+_scheduler = None
+_scheduler_interval = REFRESH_INTERVAL
+_poller = None
+# data of a snapshot loaded from disk may be outdated
+_initial_refresh = False
+# process running the background threads, not copied by fork
+_threads_pid = None
+_threads_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+        Return currently published Snapshot
+    """
+
+    return _snapshot
+
+
+def get_data_version(frames):
+    """
+        Return content hash of processed frames. It is identical across
+        workers for identical data, so it can be used in cache keys and ETags.
+
+        Parameter
+        ---------
+
+        frames : dict
+            Processed DataFrames returned by layouts.load_frames()
+
+
+        Return
+        ------
+
+        str
+            Short hex digest
+    """
+
+    digest = hashlib.sha1()
+    for name in sorted(frames):
+        df = frames[name]
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        # day offsets and country codes only mean something with these
+        digest.update(str(df.attrs['start_date']).encode())
+        digest.update(
+            pd.util.hash_pandas_object(df.attrs['coords'], index=True).values.tobytes()
+        )
+    return digest.hexdigest()[:12]
+
+
+def refresh(write_startup_snapshot=USE_STARTUP_SNAPSHOT):
+    """
+        Rebuild frames and layouts and atomically publish a new Snapshot.
+        Layouts are not rebuilt when the data did not change.
+
+        Parameter
+        ---------
+
+        write_startup_snapshot : bool
+            Write a newly published snapshot to disk
+
+
+        Return
+        ------
+
+        Snapshot
+            Currently published snapshot
+    """
+
+    global _snapshot
+
+    with _refresh_lock:
+        started = time.time()
+        with instrumentation.stage('load_frames'):
+            frames = layouts.load_frames()
+        version = get_data_version(frames)
+        if _snapshot is not None and _snapshot.version == version:
+            logger.info('data version %s is unchanged', version)
+            if _snapshot.frames is None:
+                _snapshot = _snapshot._replace(frames=MappingProxyType(frames))
+            instrumentation.refresh_seconds.observe(
+                time.time() - started, outcome='unchanged')
+            return _snapshot
+        map_frames = None
+        if mapframes.MAP_MODE == 'lazy':
+            map_frames = mapframes.build_map_frames(frames['confirmed'])
+        stores = {name: store.get_store(df) for name, df in frames.items()}
+        with instrumentation.stage('build_indicators'):
+            stores[indicators.STORE_NAME] = indicators.build_store(stores)
+        snapshot = Snapshot(
+            version=version,
+            created_at=time.time(),
+            frames=MappingProxyType(frames),
+            stores=MappingProxyType(stores),
+            map_frames=map_frames,
+            layouts=MappingProxyType(
+                layouts.build_layouts(frames, stores, map_frames)),
+        )
+        # single reference assignment, readers see either old or new snapshot
+        _snapshot = snapshot
+        result_cache.invalidate(version)
+        logger.info(
+            'published data version %s in %.1fs', version, time.time() - started)
+        instrumentation.refresh_seconds.observe(
+            time.time() - started, outcome='published')
+
+        if write_startup_snapshot:
+            try:
+                startup_snapshot.write(snapshot)
+            except OSError:
+                logger.exception('writing startup snapshot failed')
+        return snapshot
+
+
+def load_startup_snapshot(shared=SHARED_DATA):
+    """
+        Publish snapshot from disk, returns False if there is none
+
+        Parameter
+        ---------
+
+        shared : bool
+            Decode layouts and map traces from disk on access, see
+            startup_snapshot.read()
+    """
+
+    global _snapshot
+
+    fields = startup_snapshot.read(shared=shared)
+    if fields is None:
+        return False
+    _snapshot = Snapshot(
+        version=fields['version'],
+        created_at=fields['created_at'],
+        frames=None,
+        stores=MappingProxyType(fields['stores']),
+        map_frames=fields['map_frames'],
+        layouts=MappingProxyType(fields['layouts']),
+    )
+    result_cache.invalidate(_snapshot.version)
+    logger.info('loaded startup snapshot %s', _snapshot.version)
+    return True
+
+
+def attach_current():
+    """
+        Publish the current snapshot on disk if it differs from the
+        published one
+
+        Return
+        ------
+
+        Snapshot
+            Currently published snapshot
+    """
+
+    version = startup_snapshot.current_version()
+    if version is not None and (_snapshot is None or _snapshot.version != version):
+        load_startup_snapshot()
+    return _snapshot
+
+
+def refresh_shared(blocking=False, min_age=0):
+    """
+        Build a new snapshot on disk in a child process and attach to it.
+        Only one process builds at a time, the child process keeps memory
+        used by processing out of the caller.
+
+        Parameters
+        ----------
+
+        blocking : bool
+            Wait for a build running in another process, otherwise only
+            attach to the current snapshot
+
+        min_age : float
+            Skip the build if the last one finished less than min_age
+            seconds ago
+
+
+        Return
+        ------
+
+        Snapshot
+            Currently published snapshot
+    """
+
+    root = startup_snapshot.STARTUP_SNAPSHOT_DIR
+    os.makedirs(root, exist_ok=True)
+    # the lock file holds the time of the last finished build
+    with open(os.path.join(root, 'refresh.lock'), 'a+') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return attach_current()
+        lock_file.seek(0)
+        last_build = float(lock_file.read() or 0)
+        if time.time() - last_build < min_age and attach_current() is not None:
+            return _snapshot
+
+        started = time.time()
+        subprocess.run([sys.executable, SNAPSHOT_BUILDER], check=True)
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(time.time()))
+        instrumentation.refresh_seconds.observe(
+            time.time() - started, outcome='shared')
+    return attach_current()
+
+
+def _refresh_logged():
+    started = time.time()
+    try:
+        if SHARED_DATA:
+            refresh_shared(min_age=_scheduler_interval / 2)
+        else:
+            refresh()
+    except Exception:
+        # keep serving the last good snapshot
+        logger.exception('data refresh failed')
+        instrumentation.refresh_seconds.observe(
+            time.time() - started, outcome='failed')
+
+
+def _collect_snapshot_metrics():
+    if _snapshot is None:
+        return []
+    metrics = [
+        ('dashboard_data_info', 'gauge', 'Version of the published data.',
+         {(('version', _snapshot.version),): 1}),
+        ('dashboard_data_created_timestamp_seconds', 'gauge',
+         'Time the published data was built.', {(): _snapshot.created_at}),
+        ('dashboard_store_bytes', 'gauge', 'Size of metric store matrices.',
+         {(('frame', name),): sum(matrix.nbytes for matrix in metric_store.arrays.values())
+          for name, metric_store in _snapshot.stores.items()}),
+    ]
+    if _snapshot.frames is not None:
+        metrics.append((
+            'dashboard_frame_bytes', 'gauge', 'Memory used by processed frames.',
+            {(('frame', name),): layouts.get_memory_report(df)['total']
+             for name, df in _snapshot.frames.items()}
+        ))
+    return metrics
+
+
+instrumentation.register_collector(_collect_snapshot_metrics)
+
+
+def _start_initial_refresh():
+    threading.Thread(
+        target=_refresh_logged, name='initial-data-refresh', daemon=True
+    ).start()
+
+
+def _run_scheduler(interval):
+    while not _stop_event.wait(interval):
+        _refresh_logged()
+
+
+def start_scheduler(interval=REFRESH_INTERVAL):
+    """
+        Start background thread refreshing data every interval seconds
+
+        Parameter
+        ---------
+
+        interval : int
+            Seconds between refreshes, 0 disables the scheduler
+    """
+
+    global _scheduler, _scheduler_interval
+
+    if interval <= 0 or (_scheduler is not None and _scheduler.is_alive()):
+        return
+    _stop_event.clear()
+    _scheduler_interval = interval
+    _scheduler = threading.Thread(
+        target=_run_scheduler, args=(interval,),
+        name='data-refresh', daemon=True
+    )
+    _scheduler.start()
+
+
+def _attach_logged():
+    try:
+        attach_current()
+    except Exception:
+        logger.exception('attaching to snapshot failed')
+
+
+def _run_poller(interval):
+    while not _stop_event.wait(interval):
+        _attach_logged()
+
+
+def start_poller(interval=SHARED_DATA_POLL_INTERVAL):
+    """
+        Start background thread switching to a new snapshot on disk
+
+        Parameter
+        ---------
+
+        interval : int
+            Seconds between checks, 0 disables the poller
+    """
+
+    global _poller
+
+    if interval <= 0 or (_poller is not None and _poller.is_alive()):
+        return
+    _stop_event.clear()
+    _poller = threading.Thread(
+        target=_run_poller, args=(interval,),
+        name='snapshot-poller', daemon=True
+    )
+    _poller.start()
+
+
+def stop_scheduler():
+    """
+        Stop background refresh and poller threads
+    """
+
+    _stop_event.set()
+
+
+def start(interval=REFRESH_INTERVAL):
+    """
+        Publish the first snapshot. The startup snapshot on disk is used if
+        there is one and refreshed in background, otherwise data is loaded
+        synchronously. In shared mode the snapshot on disk is built if
+        missing. Background threads are started by start_background().
+    """
+
+    global _initial_refresh, _scheduler_interval
+
+    _scheduler_interval = interval
+    if SHARED_DATA:
+        if _snapshot is None and not load_startup_snapshot():
+            # another process may be building it already
+            refresh_shared(blocking=True, min_age=float('inf'))
+        return
+
+    if _snapshot is None:
+        if USE_STARTUP_SNAPSHOT and load_startup_snapshot():
+            _initial_refresh = True
+        else:
+            refresh()
+
+
+def start_background():
+    """
+        Start the initial refresh, the scheduler and in shared mode the
+        poller, once per process. Called on every request, so only
+        processes serving requests run them, e.g. gunicorn workers but
+        neither a --preload master nor process pool workers.
+    """
+
+    global _threads_pid
+
+    if _threads_pid == os.getpid():
+        return
+    with _threads_lock:
+        if _threads_pid == os.getpid():
+            return
+        _threads_pid = os.getpid()
+        if not SHARED_DATA and _initial_refresh and _snapshot.frames is None:
+            _start_initial_refresh()
+        start_scheduler(_scheduler_interval)
+        if SHARED_DATA:
+            start_poller()
+
+
+def init_app(server):
+    """
+        Start background threads with the first request of the process
+    """
+
+    server.before_request(start_background)
+
+
+def _after_fork_in_child():
+    # threads are not copied by fork, a lock held by one of them would
+    # never be released
+    global _refresh_lock, _threads_lock, _scheduler, _poller
+
+    _refresh_lock = threading.Lock()
+    _threads_lock = threading.Lock()
+    _scheduler = None
+    _poller = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,324 @@
+"""
+    Memoization of callback and view results shared by all workers.
+
+    Every ResultCache keeps recently used results in an LRU cache of the
+    process in front of a backend shared by all processes on the host,
+    chosen with RESULT_CACHE_BACKEND:
+
+        memory      results stay in the process, nothing is shared
+        filesystem  pickled results in RESULT_CACHE_DIR
+        redis       pickled results on a Redis-compatible server
+
+    Results are keyed by cache name, arguments and data version, so a
+    result computed by one worker is reused by all others for the same data.
+    Shared entries expire after RESULT_CACHE_TTL seconds, the filesystem
+    backend keeps about RESULT_CACHE_SIZE of them and entries of other
+    data versions are dropped when a version is published.
+
+    Shared entries are unpickled, so anyone who can write to
+    RESULT_CACHE_DIR or to the Redis server can run code in the workers.
+    The filesystem backend creates its directories for the owner only.
+"""
+import hashlib
+import itertools
+import logging
+import os
+import pickle
+import shutil
+import struct
+import threading
+import time
+
+from lru import LRUCache
+from sources import CACHE_DIR
+
+# 'memory', 'filesystem' or 'redis'
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')
+
+RESULT_CACHE_DIR = os.environ.get(
+    'RESULT_CACHE_DIR', os.path.join(CACHE_DIR, 'results'))
+
+RESULT_CACHE_URL = os.environ.get('RESULT_CACHE_URL', 'redis://localhost:6379/0')
+
+# seconds a shared entry is kept, 0 keeps it until its version is dropped
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 24 * 60 * 60))
+
+# maximum number of entries of the filesystem backend
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 4096))
+
+# prefix of keys on the Redis server
+REDIS_PREFIX = 'dashboard-results'
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class FilesystemBackend:
+    """
+        Entries as files in a directory per data version, written
+        atomically, so any number of processes can share the directory
+
+        Parameters
+        ----------
+
+        directory : str
+            Root directory of the entries
+
+        maxsize : int
+            Maximum number of entries, least recently used ones are removed
+            every EVICT_EVERY writes of a process, so the directory may
+            briefly hold more
+
+        ttl : int
+            Seconds an entry is kept, 0 for no expiry
+    """
+
+    # expiry timestamp in front of the pickled value
+    HEADER = struct.Struct('<d')
+
+    # writes between two scans of a version directory
+    EVICT_EVERY = 64
+
+    def __init__(self, directory=RESULT_CACHE_DIR, maxsize=RESULT_CACHE_SIZE,
+                 ttl=RESULT_CACHE_TTL):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._writes = itertools.count(1)
+
+    def _path(self, version, key):
+        return os.path.join(self.directory, version, key)
+
+    def get(self, version, key):
+        path = self._path(version, key)
+        try:
+            with open(path, 'rb') as entry_file:
+                data = entry_file.read()
+            expires, = self.HEADER.unpack_from(data)
+            if expires and expires < time.time():
+                os.remove(path)
+                return None
+            # access time of the entry for least recently used eviction
+            os.utime(path)
+        except (OSError, struct.error):
+            return None
+        return data[self.HEADER.size:]
+
+    def set(self, version, key, data):
+        path = self._path(version, key)
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        expires = time.time() + self.ttl if self.ttl else 0
+        try:
+            # entries are unpickled, nobody else may write them
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            with open(tmp_path, 'wb') as entry_file:
+                entry_file.write(self.HEADER.pack(expires))
+                entry_file.write(data)
+            os.replace(tmp_path, path)
+            if next(self._writes) % self.EVICT_EVERY == 0:
+                self._evict(os.path.dirname(path))
+        except OSError:
+            logger.exception('writing result cache entry failed')
+
+    def _evict(self, version_dir):
+        entries = [
+            entry for entry in os.scandir(version_dir)
+            if not entry.name.endswith('.tmp')
+        ]
+        if len(entries) <= self.maxsize:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.maxsize]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, version):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name != version:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+class RedisBackend:
+    """
+        Entries on a Redis-compatible server. Their number is bounded by
+        the maxmemory policy of the server.
+
+        Parameters
+        ----------
+
+        url : str
+            Server url, e.g. 'redis://localhost:6379/0'
+
+        ttl : int
+            Seconds an entry is kept, 0 for no expiry
+    """
+
+    def __init__(self, url=RESULT_CACHE_URL, ttl=RESULT_CACHE_TTL):
+        # optional dependency, only needed with the redis backend
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.errors = (redis.RedisError,)
+        self.ttl = ttl
+
+    def _key(self, version, key):
+        return '{}:{}:{}'.format(REDIS_PREFIX, version, key)
+
+    def get(self, version, key):
+        try:
+            return self.client.get(self._key(version, key))
+        except self.errors:
+            logger.exception('reading result cache entry failed')
+            return None
+
+    def set(self, version, key, data):
+        try:
+            self.client.set(self._key(version, key), data, ex=self.ttl or None)
+        except self.errors:
+            logger.exception('writing result cache entry failed')
+
+    def invalidate(self, version):
+        keep = self._key(version, '')
+        try:
+            stale = [
+                key for key in self.client.scan_iter(match=REDIS_PREFIX + ':*', count=1000)
+                if not key.decode().startswith(keep)
+            ]
+            if stale:
+                self.client.delete(*stale)
+        except self.errors:
+            logger.exception('dropping result cache entries failed')
+
+
+def get_backend():
+    """
+        Return shared backend configured with RESULT_CACHE_BACKEND, None for
+        the memory backend. The backend is created once per process.
+    """
+
+    global _backend
+
+    if RESULT_CACHE_BACKEND == 'memory':
+        return None
+    with _backend_lock:
+        if _backend is None:
+            if RESULT_CACHE_BACKEND == 'filesystem':
+                _backend = FilesystemBackend()
+            elif RESULT_CACHE_BACKEND == 'redis':
+                _backend = RedisBackend()
+            else:
+                raise ValueError(
+                    'unknown RESULT_CACHE_BACKEND {!r}'.format(RESULT_CACHE_BACKEND))
+        return _backend
+
+
+def invalidate(version):
+    """
+        Drop shared entries of all data versions except version
+    """
+
+    backend = get_backend()
+    if backend is not None:
+        backend.invalidate(version)
+
+
+class ResultCache:
+    """
+        LRU cache of the process in front of the shared backend
+
+        Parameters
+        ----------
+
+        name : str
+            Name of the cache, keys of different caches never collide
+
+        maxsize : int
+            Maximum number of entries kept in the process
+    """
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.local = LRUCache(maxsize)
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def _shared_key(self, key):
+        # repr of tuples of strings and numbers is the same in all processes
+        return '{}-{}'.format(self.name, hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def get(self, key, version, default=None):
+        """
+            Return cached result of key for a data version
+        """
+
+        missing = object()
+        value = self.local.get((key, version), missing)
+        if value is not missing:
+            return value
+        backend = get_backend()
+        if backend is None:
+            return default
+
+        data = backend.get(version, self._shared_key(key))
+        if data is None:
+            self.shared_misses += 1
+            return default
+        self.shared_hits += 1
+        value = pickle.loads(data)
+        self.local.set((key, version), value)
+        return value
+
+    def set(self, key, version, value):
+        """
+            Store result of key for a data version in the process and in
+            the shared backend
+        """
+
+        self.local.set((key, version), value)
+        backend = get_backend()
+        if backend is not None:
+            backend.set(
+                version, self._shared_key(key),
+                pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def get_or_create(self, key, version, create):
+        """
+            Return cached result or store and return result of create()
+        """
+
+        missing = object()
+        value = self.get(key, version, missing)
+        if value is missing:
+            value = create()
+            self.set(key, version, value)
+        return value
+
+    def clear(self):
+        """
+            Remove all entries of the process
+        """
+
+        self.local.clear()
+
+    def stats(self):
+        """
+            Return dict with counters of the process, hits and misses of
+            both tiers
+        """
+
+        stats = self.local.stats()
+        stats['shared_hits'] = self.shared_hits
+        stats['hits'] += self.shared_hits
+        if get_backend() is not None:
+            # local misses are counted again as shared hits or misses
+            stats['misses'] = self.shared_misses
+        return stats
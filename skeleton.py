@@ -0,0 +1,220 @@
+"""
+    Stable content skeleton of the tabs.
+
+    Instead of a tab layout rendered on every interaction, the page carries
+    a fixed set of components with fixed ids: the key metrics graph,
+    SLOT_COUNT series graph slots, the world map section and the comparison
+    section. Layout and styling of every series chart and of the key
+    metrics are shipped once with the page as figure templates. Callbacks
+    of the slots send only the points of the chart a slot shows and the
+    browser merges them into its template, so a click sends the traces of
+    the graphs which change and nothing else. Slots whose chart did not
+    change are not updated at all.
+"""
+import json
+
+import dash_core_components as dcc
+import dash_html_components as html
+import pandas as pd
+
+import downsample
+import layouts
+import store
+import views
+
+# types of pattern-matching ids of slot graphs and of their data stores
+SLOT_TYPE = 'slot-graph'
+SLOT_DATA_TYPE = 'slot-data'
+
+# charts of the slots by metric type, the same on the Country and World tabs
+SLOT_CHARTS = {
+    'cumulative': ['confirmed', 'recovered', 'active', 'deaths', 'cfr'],
+    'new': ['new_confirmed', 'new_recovered', 'new_active', 'new_deaths'],
+}
+
+SLOT_COUNT = max(len(charts) for charts in SLOT_CHARTS.values())
+
+# title, color and average line of every series chart, cfr has its own figure
+CHART_STYLES = {
+    'confirmed': ('Confirmed Cases', 'blue', False),
+    'recovered': ('Recovered', 'green', False),
+    'active': ('Active', 'orange', False),
+    'deaths': ('Deaths', 'red', False),
+    'new_confirmed': ('New Cases', 'blue', True),
+    'new_recovered': ('New Recovered', 'green', False),
+    'new_active': ('New active', 'orange', False),
+    'new_deaths': ('New Deaths', 'red', True),
+}
+
+_templates = None
+
+
+def slot_id(slot):
+    """
+        Return pattern-matching id of the graph of a slot
+    """
+
+    return {'type': SLOT_TYPE, 'slot': slot}
+
+
+def slot_data_id(slot):
+    """
+        Return pattern-matching id of the data store of a slot
+    """
+
+    return {'type': SLOT_DATA_TYPE, 'slot': slot}
+
+
+def get_metric_type(btn1, btn2):
+    """
+        Return metric type selected with the cumulative and new cases
+        buttons, None while none of them is ahead
+    """
+
+    if int(btn1) > int(btn2):
+        return 'cumulative'
+    elif int(btn1) < int(btn2):
+        return 'new'
+
+
+def get_slot_chart(tab, metric_type, slot):
+    """
+        Return name of the chart shown in a slot, None for empty slots
+    """
+
+    if tab not in ('country_tab', 'global_tab') or metric_type is None:
+        return None
+    charts = SLOT_CHARTS[metric_type]
+    return charts[slot] if slot < len(charts) else None
+
+
+def get_templates():
+    """
+        Return figure of every series chart without points and date range.
+        Templates are built only once per process.
+
+        Return
+        ------
+
+        dict
+            Figures by chart name and of the key metrics
+    """
+
+    global _templates
+
+    if _templates is None:
+        no_dates = pd.DatetimeIndex([])
+        _templates = {
+            chart: layouts.get_plot_figure(
+                no_dates, [], 'bar', title, color, mean_legend, [])
+            for chart, (title, color, mean_legend) in CHART_STYLES.items()
+        }
+        _templates['cfr'] = layouts.get_cfr_figure(no_dates, [], None)
+        # layout of indicators only, with the plotly theme it is most of the figure
+        zeros = pd.Series([0, 0])
+        key_metrics_fig = layouts.get_key_metrics_fig(zeros, zeros, zeros, 'new')
+        _templates['key_metrics'] = {
+            'data': [], 'layout': json.loads(key_metrics_fig.to_json())['layout']}
+    return _templates
+
+
+def get_range_start(chart, country=None):
+    """
+        Return start of the initial date range of a chart as in the
+        rendered layouts
+    """
+
+    if chart == 'cfr':
+        return '2020-04-01' if country else '2020-02-01'
+    return '2020-03-01'
+
+
+def get_slot_key(snapshot, chart, country=None, province=None):
+    """
+        Return key of the points of a chart, equal keys mean equal points
+        of the whole chart
+    """
+
+    return [chart, country or '', province or '', snapshot.version]
+
+
+def get_slot_data(snapshot, chart, country=None, province=None, window=None):
+    """
+        Return points of a chart merged into its template in the browser
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Published data snapshot
+
+        chart : str
+            Chart name as in SLOT_CHARTS
+
+        country : str
+            Country name, None for worldwide charts
+
+        province : str
+            Province name, None for whole countries
+
+        window : tuple
+            (start, stop) positions of the zoomed window, None for the
+            whole chart
+
+
+        Return
+        ------
+
+        dict
+            'key' of the chart and data version, 'chart', 'x' dates, 'ys'
+            values of every trace and initial 'range' of xaxis. Charts
+            without data have no 'chart'.
+    """
+
+    key = get_slot_key(snapshot, chart, country, province)
+    series = views.get_chart(snapshot, chart, country, province)
+    if not len(series.dates):
+        return {'key': key, 'chart': None}
+
+    if window is None:
+        window = (0, len(series.dates))
+    if downsample.DOWNSAMPLE_MODE == 'adaptive':
+        positions = downsample.select(series.pyramid, *window)
+    else:
+        positions = slice(None)
+    return {
+        'key': key,
+        'chart': chart,
+        'x': series.dates[positions].strftime('%Y-%m-%d').tolist(),
+        'ys': [store.to_list(values[positions]) for values in series.values],
+        'range': [get_range_start(chart, country), layouts.get_range_end(series.dates)],
+    }
+
+
+def render_skeleton():
+    """
+        Render content components of all tabs with fixed ids, filled and
+        shown by the callbacks of the selected tab
+    """
+
+    slots = [
+        html.Div([
+            dcc.Graph(id=slot_id(slot), style={'display': 'none'}),
+            dcc.Store(id=slot_data_id(slot)),
+        ])
+        for slot in range(SLOT_COUNT)
+    ]
+    return html.Div([
+        html.Div([
+            dcc.Graph(id='key-metrics-graph'),
+            dcc.Store(id='key-metrics-data'),
+            slots[0],
+            # world map between confirmed cases and the other charts
+            html.Div(id='map-section', style={'display': 'none'}),
+        ] + slots[1:], id='series-section'),
+        html.Div(id='compare-section', style={'display': 'none'}),
+        dcc.Store(id='figure-templates', data=get_templates()),
+        # data versions the map and comparison sections are rendered from
+        dcc.Store(id='map-version'),
+        dcc.Store(id='compare-version'),
+    ])
@@ -0,0 +1,158 @@
+"""
+    Fetching of the source csv files.
+
+    Remote files are requested with If-None-Match/If-Modified-Since headers,
+    so unchanged sources are not downloaded again. With OFFLINE_DATA_DIR set
+    sources are read from a local directory instead, without network access.
+"""
+import hashlib
+import io
+import json
+import os
+import urllib.error
+import urllib.request
+from collections import namedtuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
+# directory with source csv files named like the remote ones
+OFFLINE_DATA_DIR = os.environ.get('OFFLINE_DATA_DIR')
+
+FETCH_TIMEOUT = 60
+
+# content is None when the source did not change since the last fetch
+Source = namedtuple('Source', ['name', 'digest', 'content'])
+
+
+def _meta_path(name):
+    return os.path.join(CACHE_DIR, 'sources', name + '.json')
+
+
+def _read_meta(name):
+    try:
+        with open(_meta_path(name)) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(name, meta):
+    path = _meta_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_path, path)
+
+
+def is_stale_tmp(name):
+    """
+        Return True for a temporary '<name>.<pid>.tmp' entry of a cache
+        directory left by a process which is no longer running
+    """
+
+    parts = name.split('.')
+    if len(parts) < 3 or parts[-1] != 'tmp' or not parts[-2].isdigit():
+        return False
+    try:
+        os.kill(int(parts[-2]), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def _digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def _fetch_file(path, name, force):
+    stat = os.stat(path)
+    meta = _read_meta(name)
+    unchanged = (
+        meta.get('size') == stat.st_size
+        and meta.get('mtime_ns') == stat.st_mtime_ns
+        and 'digest' in meta
+    )
+    if unchanged and not force:
+        return Source(name, meta['digest'], None)
+
+    with open(path, 'rb') as source_file:
+        content = source_file.read()
+    digest = _digest(content)
+    _write_meta(name, {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'digest': digest,
+    })
+    return Source(name, digest, content)
+
+
+def _fetch_url(url, name, force):
+    meta = _read_meta(name)
+    headers = {}
+    if not force and 'digest' in meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            content = response.read()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return Source(name, meta['digest'], None)
+        raise
+
+    digest = _digest(content)
+    _write_meta(name, {
+        'etag': etag,
+        'last_modified': last_modified,
+        'digest': digest,
+    })
+    return Source(name, digest, content)
+
+
+def fetch(location, force=False):
+    """
+        Fetch source csv file if it changed since the last fetch
+
+        Parameter
+        ---------
+
+        location : str
+            Full url or local path to source csv file
+
+        force : bool
+            Always return file content
+
+
+        Return
+        ------
+
+        Source
+            Name, sha1 digest of file content and content bytes. Content is
+            None if source is unchanged and force is False
+    """
+
+    name = os.path.basename(location)
+    if OFFLINE_DATA_DIR:
+        return _fetch_file(os.path.join(OFFLINE_DATA_DIR, name), name, force)
+    if '://' not in location:
+        return _fetch_file(location, name, force)
+    return _fetch_url(location, name, force)
+
+
+def open_content(source):
+    """
+        Return file-like object with source content for pandas.read_csv
+    """
+
+    return io.BytesIO(source.content)
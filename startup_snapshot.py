@@ -0,0 +1,317 @@
+"""
+    Startup snapshot on disk.
+
+    Metric matrices are written as .npy files and memory-mapped on boot,
+    prerendered world layouts and map frames are stored as ready-to-serve
+    JSON. Booting from a snapshot does no network I/O, no pandas processing
+    and no plotly figure construction.
+
+    Read in shared mode, map traces are decoded from the files on access
+    instead of being held as Python objects and layouts only once they are
+    served, so gunicorn workers share a snapshot through the page cache.
+
+    Build it from the root of the repo with
+
+        python startup_snapshot.py
+"""
+import json
+import mmap
+import os
+import shutil
+import time
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+import mapframes
+from sources import CACHE_DIR, is_stale_tmp
+from store import MetricStore
+
+STARTUP_SNAPSHOT_DIR = os.environ.get(
+    'STARTUP_SNAPSHOT_DIR', os.path.join(CACHE_DIR, 'startup'))
+
+# number of snapshot versions kept on disk, older ones may still be mapped
+KEEP_VERSIONS = 2
+
+# bump when the layout of snapshot files changes, older snapshots are ignored
+SNAPSHOT_FORMAT = 4
+
+
+def _current_path(root):
+    return os.path.join(root, 'CURRENT')
+
+
+def write(snapshot, root=STARTUP_SNAPSHOT_DIR):
+    """
+        Write published snapshot to disk and make it the current one
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Snapshot to write
+
+        root : str
+            Directory with snapshot versions
+    """
+
+    version_dir = os.path.join(root, snapshot.version)
+    # versions are content hashes, workers publishing the same data write
+    # the same files and a directory is never replaced while it is in use
+    if _read_format(version_dir) == SNAPSHOT_FORMAT:
+        # newest by mtime, so it is not removed as an old version
+        os.utime(version_dir)
+    else:
+        _write_version(snapshot, version_dir)
+
+    current_tmp = '{}.{}.tmp'.format(_current_path(root), os.getpid())
+    with open(current_tmp, 'w') as current_file:
+        current_file.write(snapshot.version)
+    os.replace(current_tmp, _current_path(root))
+
+    _remove_old_versions(root)
+
+
+def _read_format(version_dir):
+    try:
+        with open(os.path.join(version_dir, 'meta.json')) as meta_file:
+            return json.load(meta_file).get('format')
+    except (OSError, ValueError):
+        return None
+
+
+def _write_version(snapshot, version_dir):
+    tmp_dir = '{}.{}.tmp'.format(version_dir, os.getpid())
+    try:
+        _write_files(snapshot, tmp_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    if os.path.isdir(version_dir):
+        # directory of an older format, never read
+        shutil.rmtree(version_dir, ignore_errors=True)
+    try:
+        os.replace(tmp_dir, version_dir)
+    except OSError:
+        # published by another process meanwhile
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if _read_format(version_dir) != SNAPSHOT_FORMAT:
+            raise
+
+
+def _write_files(snapshot, tmp_dir):
+    from plotly.utils import PlotlyJSONEncoder
+
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    stores_meta = {}
+    for name, metric_store in snapshot.stores.items():
+        for metric_type, matrix in metric_store.arrays.items():
+            np.save(
+                os.path.join(tmp_dir, '{}-{}.npy'.format(name, metric_type)),
+                matrix
+            )
+        stores_meta[name] = {
+            'regions': metric_store.regions.tolist(),
+            'dates': metric_store.dates.strftime('%Y-%m-%d').tolist(),
+            'metric_types': list(metric_store.arrays),
+        }
+
+    for key, layout in snapshot.layouts.items():
+        with open(os.path.join(tmp_dir, 'layout-{}.json'.format(key)), 'w') as layout_file:
+            json.dump(layout, layout_file, cls=PlotlyJSONEncoder)
+
+    map_frames = snapshot.map_frames
+    if map_frames is not None:
+        # one JSON document per trace, located by byte offsets
+        offsets = [0]
+        with open(os.path.join(tmp_dir, 'map_traces.json'), 'wb') as traces_file:
+            for trace in map_frames.traces:
+                offsets.append(offsets[-1] + traces_file.write(json.dumps(trace).encode()))
+        np.save(os.path.join(tmp_dir, 'map_traces.npy'), np.array(offsets, dtype='int64'))
+    with open(os.path.join(tmp_dir, 'map_frames.json'), 'w') as map_file:
+        json.dump({
+            'dates': map_frames.dates,
+            'layout': map_frames.layout,
+        } if map_frames else None, map_file)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as meta_file:
+        json.dump({
+            'format': SNAPSHOT_FORMAT,
+            'version': snapshot.version,
+            'created_at': snapshot.created_at,
+            'stores': stores_meta,
+            'layouts': list(snapshot.layouts),
+        }, meta_file)
+
+
+def _remove_old_versions(root):
+    versions = []
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        if entry.name.endswith('.tmp'):
+            # left by a process which died while writing
+            if is_stale_tmp(entry.name):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            continue
+        versions.append(entry)
+    versions.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+class LayoutFiles(Mapping):
+    """
+        Layouts of a snapshot version decoded from disk on first access.
+        Files are mapped when the version is attached, so a worker still
+        serving it can decode them after the version is removed from disk.
+    """
+
+    def __init__(self, version_dir, names):
+        self.names = list(names)
+        self._data = {}
+        for name in self.names:
+            path = os.path.join(version_dir, 'layout-{}.json'.format(name))
+            with open(path, 'rb') as layout_file:
+                self._data[name] = mmap.mmap(
+                    layout_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._decoded = {}
+
+    def __getitem__(self, key):
+        if key not in self.names:
+            raise KeyError(key)
+        layout = self._decoded.get(key)
+        if layout is None:
+            layout = self._decoded[key] = json.loads(self._data[key][:])
+        return layout
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TraceFile(Sequence):
+    """
+        Map traces of a snapshot version decoded from a memory-mapped file
+        on every access
+    """
+
+    def __init__(self, version_dir):
+        self.offsets = np.load(
+            os.path.join(version_dir, 'map_traces.npy'), mmap_mode='r')
+        with open(os.path.join(version_dir, 'map_traces.json'), 'rb') as traces_file:
+            self.data = mmap.mmap(traces_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, stop = int(self.offsets[index]), int(self.offsets[index + 1])
+        return json.loads(self.data[start:stop])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def current_version(root=STARTUP_SNAPSHOT_DIR):
+    """
+        Return version of the current snapshot on disk or None
+    """
+
+    try:
+        with open(_current_path(root)) as current_file:
+            return current_file.read().strip() or None
+    except OSError:
+        return None
+
+
+def read(root=STARTUP_SNAPSHOT_DIR, shared=False):
+    """
+        Return fields of the current snapshot on disk or None if there is
+        none. Metric matrices are memory-mapped read-only.
+
+        Parameters
+        ----------
+
+        root : str
+            Directory with snapshot versions
+
+        shared : bool
+            Decode layouts and map traces from disk on access instead of
+            loading them into memory
+
+
+        Return
+        ------
+
+        dict
+            Keys ['version', 'created_at', 'stores', 'map_frames', 'layouts'],
+            layouts are component trees as plain JSON dicts
+    """
+
+    version = current_version(root)
+    if version is None:
+        return None
+    version_dir = os.path.join(root, version)
+    try:
+        with open(os.path.join(version_dir, 'meta.json')) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != SNAPSHOT_FORMAT:
+        return None
+
+    stores = {}
+    for name, store_meta in meta['stores'].items():
+        arrays = {
+            metric_type: np.load(
+                os.path.join(version_dir, '{}-{}.npy'.format(name, metric_type)),
+                mmap_mode='r'
+            )
+            for metric_type in store_meta['metric_types']
+        }
+        stores[name] = MetricStore(
+            pd.MultiIndex.from_tuples(
+                [tuple(region) for region in store_meta['regions']],
+                names=['country', 'province']),
+            pd.DatetimeIndex(store_meta['dates'], name='date'),
+            arrays
+        )
+
+    layouts = LayoutFiles(version_dir, meta['layouts'])
+    with open(os.path.join(version_dir, 'map_frames.json')) as map_file:
+        map_frames = json.load(map_file)
+    if map_frames is not None:
+        traces = TraceFile(version_dir)
+        map_frames = mapframes.MapFrames(
+            traces=traces if shared else traces[:], **map_frames)
+    if not shared:
+        layouts = dict(layouts)
+
+    return {
+        'version': meta['version'],
+        'created_at': meta['created_at'],
+        'stores': stores,
+        'map_frames': map_frames,
+        'layouts': layouts,
+    }
+
+
+if __name__ == '__main__':
+    import refresh
+
+    started = time.time()
+    snapshot = refresh.refresh(write_startup_snapshot=False)
+    current = read(shared=True)
+    if current is not None and current['version'] == snapshot.version:
+        print('snapshot {} is up to date'.format(snapshot.version))
+    else:
+        write(snapshot)
+        print('wrote snapshot {} to {} in {:.1f}s'.format(
+            snapshot.version, STARTUP_SNAPSHOT_DIR, time.time() - started))
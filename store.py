@@ -0,0 +1,223 @@
+"""
+    Dense storage of processed metrics.
+
+    Every metric is held as a rollup cube: one region x date NumPy matrix
+    with a row per country, a row per province of countries split into
+    provinces and a row for the world, all summed up once when the store is
+    built. Country, province and global series are row slices instead of
+    filtering and grouping the long DataFrame.
+"""
+import weakref
+
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = {
+    'cumulative': 'value',
+    'new': 'new_cases',
+}
+
+# region key of the world row, country rows have an empty province
+WORLD = ('', '')
+
+# stores by id of the processed frame they were built from
+_stores = {}
+
+
+class MetricStore:
+    """
+        Cumulative and new case matrices of one metric
+
+        Parameters
+        ----------
+
+        regions : pandas.MultiIndex
+            (country, province) of every matrix row, province is empty for
+            country rows and both are empty for the world row
+
+        dates : pandas.DatetimeIndex
+            Dates, one per matrix column
+
+        arrays : dict
+            Matrices with keys ['cumulative', 'new']
+    """
+
+    def __init__(self, regions, dates, arrays):
+        self.regions = regions
+        self.dates = dates
+        self.region_pos = {region: i for i, region in enumerate(regions)}
+
+        countries = regions.get_level_values('country')
+        provinces = regions.get_level_values('province')
+        is_country = (provinces == '') & (countries != '')
+        self.countries = pd.Index(countries[is_country], name='country')
+        self.provinces = {}
+        for country, province in zip(countries[~is_country], provinces[~is_country]):
+            if country:
+                self.provinces.setdefault(country, []).append(province)
+
+        world_pos = self.region_pos[WORLD]
+        self.arrays = {}
+        self.global_arrays = {}
+        for metric_type, matrix in arrays.items():
+            # series handed out are views, they must not be modified
+            matrix.setflags(write=False)
+            self.arrays[metric_type] = matrix
+            self.global_arrays[metric_type] = matrix[world_pos]
+
+    @classmethod
+    def from_leaves(cls, leaves, dates, arrays):
+        """
+            Build store from matrices of the finest regions, summing them up
+            to countries and the world in one pass
+
+            Parameters
+            ----------
+
+            leaves : pandas.MultiIndex
+                (country, province) of every row sorted by country
+
+            dates : pandas.DatetimeIndex
+                Dates, one per matrix column
+
+            arrays : dict
+                Matrices with keys ['cumulative', 'new']
+        """
+
+        countries = leaves.get_level_values('country').to_numpy()
+        provinces = leaves.get_level_values('province').to_numpy()
+        starts = np.flatnonzero(np.r_[True, countries[1:] != countries[:-1]])
+        sizes = np.diff(np.r_[starts, len(leaves)])
+        # provinces are kept for countries split into provinces only
+        split = np.repeat((sizes > 1) | (provinces[starts] != countries[starts]), sizes)
+
+        regions = pd.MultiIndex.from_arrays([
+            np.concatenate([countries[starts], countries[split], ['']]),
+            np.concatenate([[''] * len(starts), provinces[split], ['']]),
+        ], names=['country', 'province'])
+
+        cube = {}
+        for metric_type, matrix in arrays.items():
+            if len(starts):
+                country_matrix = np.add.reduceat(matrix, starts, axis=0)
+            else:
+                country_matrix = matrix
+            world = country_matrix.sum(axis=0, dtype=matrix.dtype)
+            cube[metric_type] = np.concatenate(
+                [country_matrix, matrix[split], world[np.newaxis]])
+        return cls(regions, dates, cube)
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+            Build store from DataFrame returned by get_processed_df()
+        """
+
+        # category codes and day offsets are matrix positions already
+        country_categories = df['country'].cat.categories
+        province_categories = df['province'].cat.categories
+        leaf_keys = (
+            df['country'].cat.codes.to_numpy().astype('int64') * len(province_categories)
+            + df['province'].cat.codes.to_numpy()
+        )
+        leaf_keys, leaf_pos = np.unique(leaf_keys, return_inverse=True)
+        days, day_pos = np.unique(df['day'].to_numpy(), return_inverse=True)
+        leaves = pd.MultiIndex.from_arrays([
+            country_categories[leaf_keys // len(province_categories)],
+            province_categories[leaf_keys % len(province_categories)],
+        ], names=['country', 'province'])
+        dates = pd.DatetimeIndex(
+            df.attrs['start_date'] + pd.to_timedelta(days, unit='D'), name='date')
+
+        arrays = {}
+        for metric_type, column in METRIC_COLUMNS.items():
+            matrix = np.zeros((len(leaves), len(dates)), dtype=df[column].dtype)
+            matrix[leaf_pos, day_pos] = df[column].to_numpy()
+            arrays[metric_type] = matrix
+        return cls.from_leaves(leaves, dates, arrays)
+
+    def get_values(self, metric_type, country=None, province=None):
+        """
+            Return NumPy array of metric values by date. If country or
+            province is unknown returns None.
+        """
+
+        pos = self.region_pos.get((country or '', province or ''))
+        if pos is None:
+            return None
+        return self.arrays[metric_type][pos]
+
+    def get_series(self, metric_type, country=None, province=None):
+        """
+            Return metric values by date as pandas.Series. If country or
+            province is unknown the series is empty. Series of other
+            matrices than METRIC_COLUMNS, e.g. indicators, are named by key.
+        """
+
+        name = METRIC_COLUMNS.get(metric_type, metric_type)
+        values = self.get_values(metric_type, country, province)
+        if values is None:
+            return pd.Series(
+                [], index=self.dates[:0], name=name,
+                dtype=self.arrays[metric_type].dtype
+            )
+        return pd.Series(values, index=self.dates, name=name)
+
+    def get_rows(self, metric_type, countries):
+        """
+            Return metric values of several countries as country x date
+            matrix taken from the cube in one fancy-indexing pass. Unknown
+            countries raise KeyError.
+        """
+
+        positions = [self.region_pos[(country, '')] for country in countries]
+        return self.arrays[metric_type][positions]
+
+    def get_provinces(self, country):
+        """
+            Return provinces of a country split into provinces, empty list
+            otherwise
+        """
+
+        return self.provinces.get(country, [])
+
+
+def get_store(df):
+    """
+        Return MetricStore for processed DataFrame. The store is built on
+        the first call and reused while the frame is alive, so the frame must
+        not be modified afterwards.
+
+        Parameter
+        ---------
+
+        df : pandas.DataFrame
+            Processed DataFrame with function get_processed_df()
+
+
+        Return
+        ------
+
+        MetricStore
+    """
+
+    key = id(df)
+    metric_store = _stores.get(key)
+    if metric_store is None:
+        metric_store = MetricStore.from_frame(df)
+        _stores[key] = metric_store
+        weakref.finalize(df, _stores.pop, key, None)
+    return metric_store
+
+
+def to_list(values):
+    """
+        Return values as list for JSON documents, shortest decimals of
+        float32 values and None for NaN
+    """
+
+    if values.dtype == 'float32':
+        # shortest decimals of float32 instead of float64 noise
+        values = values.astype(str).astype('float64')
+    # NaN is not valid JSON
+    return [None if value != value else value for value in values.tolist()]
@@ -0,0 +1,262 @@
+"""
+    Streaming ingestion of very wide and very tall time series files.
+
+    Instead of parsing the whole wide table and grouping it, the source is
+    read twice: once for its id columns, which give every row its region,
+    and once for the date columns in chunks of INGEST_CHUNK_ROWS rows,
+    optionally in blocks of INGEST_CHUNK_COLUMNS date columns. Every chunk is
+    summed up by region into the region x date matrix right away, so besides
+    the result only one parsed chunk is held in memory. The US county files
+    of JHU are aggregated to their states the same way.
+
+    With INGEST_TRACE_MEMORY=1 the peak memory of every parse is measured
+    with tracemalloc, which makes parsing about three times slower.
+"""
+import io
+import os
+import threading
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import layouts
+
+# smaller chunks spend most of the time in per-chunk overhead of read_csv,
+# e.g. chunks of 7 rows parse a small file 25 times slower than one chunk
+MIN_CHUNK_ROWS = 100
+
+# rows of the source parsed at once
+INGEST_CHUNK_ROWS = max(int(os.environ.get('INGEST_CHUNK_ROWS', 2000)), MIN_CHUNK_ROWS)
+
+# date columns parsed at once, 0 parses all of them in one pass over rows
+INGEST_CHUNK_COLUMNS = int(os.environ.get('INGEST_CHUNK_COLUMNS', 0))
+
+# measure peak memory of parses, slows them down
+INGEST_TRACE_MEMORY = os.environ.get('INGEST_TRACE_MEMORY', '0') == '1'
+
+_trace_lock = threading.Lock()
+
+# id columns of the global and of the US county files, all others are dates
+ID_COLUMNS = [
+    'Province/State', 'Country/Region', 'Lat', 'Long',
+    'UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Admin2', 'Province_State',
+    'Country_Region', 'Long_', 'Combined_Key', 'Population',
+]
+
+# column names of the US county files as in the global files
+US_COLUMNS = {
+    'Province_State': 'Province/State',
+    'Country_Region': 'Country/Region',
+    'Long_': 'Long',
+}
+
+
+def _rewind(metric_csv):
+    # file-like sources are read once per pass
+    if hasattr(metric_csv, 'seek'):
+        metric_csv.seek(0)
+    return metric_csv
+
+
+def read_regions(metric_csv, chunk_rows=INGEST_CHUNK_ROWS):
+    """
+        Return region of every source row
+
+        Return
+        ------
+
+        tuple
+            (ids_df, regions, region_ids, date_columns): prepared id columns
+            ['country', 'province', 'Lat', 'Long'] of every row, sorted
+            (country, province) MultiIndex, position of the region of every
+            row or -1 and names of date columns in file order
+    """
+
+    columns = pd.read_csv(_rewind(metric_csv), nrows=0).columns
+    date_columns = [column for column in columns if column not in ID_COLUMNS]
+    id_columns = [
+        column for column in columns
+        if US_COLUMNS.get(column, column) in ('Province/State', 'Country/Region', 'Lat', 'Long')
+    ]
+
+    chunks = pd.read_csv(
+        _rewind(metric_csv), usecols=id_columns, chunksize=chunk_rows,
+        dtype={'Province/State': object, 'Country/Region': object,
+               'Province_State': object, 'Country_Region': object}
+    )
+    ids_df = pd.concat(list(chunks), ignore_index=True).rename(columns=US_COLUMNS)
+    ids_df = layouts.prepare_source_df(ids_df)
+
+    grouped = ids_df.groupby(['country', 'province'])
+    # rows without country are left out like in grouped sums
+    region_ids = grouped.ngroup().fillna(-1).to_numpy(dtype='int64')
+    regions = grouped.size().index
+    return ids_df, regions, region_ids, date_columns
+
+
+def _column_blocks(n_columns, chunk_columns):
+    if chunk_columns <= 0:
+        chunk_columns = max(n_columns, 1)
+    return [
+        slice(start, min(start + chunk_columns, n_columns))
+        for start in range(0, n_columns, chunk_columns)
+    ]
+
+
+def aggregate_chunks(metric_csv, region_ids, n_regions, date_columns,
+                     chunk_rows=INGEST_CHUNK_ROWS, chunk_columns=INGEST_CHUNK_COLUMNS,
+                     report=None):
+    """
+        Return region x date matrix of summed up source rows in file order
+        of date columns, parsing the source chunk by chunk
+
+        Parameters
+        ----------
+
+        metric_csv : str or file-like object
+            Local path or seekable file, it is read once per column block
+
+        region_ids : numpy.ndarray
+            Region position of every source row, -1 for rows to skip
+
+        n_regions : int
+            Number of regions
+
+        date_columns : list
+            Names of date columns in file order
+
+        report : dict
+            If provided, filled with number of 'chunks' and size of the
+            largest parsed chunk in 'chunk_bytes'
+    """
+
+    matrix = np.zeros((n_regions, len(date_columns)), dtype='float64')
+    n_chunks = 0
+    chunk_bytes = 0
+    for block in _column_blocks(len(date_columns), chunk_columns):
+        block_columns = date_columns[block]
+        chunks = pd.read_csv(
+            _rewind(metric_csv), usecols=block_columns, chunksize=chunk_rows,
+            dtype={column: 'float64' for column in block_columns}
+        )
+        start = 0
+        for chunk in chunks:
+            ids = region_ids[start:start + len(chunk)]
+            start += len(chunk)
+            n_chunks += 1
+            chunk_bytes = max(chunk_bytes, int(chunk.memory_usage(index=True).sum()))
+            keep = ids >= 0
+            # NaN counts as 0 like in grouped sums of the whole table
+            sums = chunk[block_columns][keep].groupby(ids[keep], sort=False).sum()
+            matrix[sums.index.to_numpy(), block] += sums.to_numpy()
+
+    if report is not None:
+        report['chunks'] = n_chunks
+        report['chunk_bytes'] = chunk_bytes
+    return matrix
+
+
+def get_processed_df(metric_csv, report=None, chunk_rows=INGEST_CHUNK_ROWS,
+                     chunk_columns=INGEST_CHUNK_COLUMNS):
+    """
+        Return the same DataFrame as layouts.get_processed_df() parsing the
+        source in chunks
+
+        Parameters
+        ----------
+
+        metric_csv : str or file-like object
+            Local path or seekable file, urls are downloaded once per pass
+
+        report : dict
+            If provided, filled with 'rows', 'regions', 'dates', 'chunks',
+            'chunk_bytes' and 'estimated_peak_bytes', see
+            estimate_peak_bytes(). With INGEST_TRACE_MEMORY also with
+            'peak_bytes', the size of an in-memory source plus the peak of
+            memory allocated by the process while parsing, unless another
+            parse is measured at the same time
+
+
+        Return
+        ------
+
+        pandas.DataFrame
+            Processed DataFrame
+    """
+
+    if report is None:
+        report = {}
+    # an in-memory source, e.g. a whole download, is alive for the whole
+    # call, getbuffer() would copy a BytesIO sharing the downloaded bytes
+    source_bytes = 0
+    if hasattr(metric_csv, 'getbuffer'):
+        source_bytes = metric_csv.seek(0, io.SEEK_END)
+
+    # tracing is process wide, only one parse at a time is measured
+    traced = (INGEST_TRACE_MEMORY and not tracemalloc.is_tracing()
+              and _trace_lock.acquire(blocking=False))
+    if not traced:
+        processed_df = _get_processed_df(metric_csv, report, chunk_rows, chunk_columns)
+    else:
+        tracemalloc.start()
+        try:
+            processed_df = _get_processed_df(metric_csv, report, chunk_rows, chunk_columns)
+            report['peak_bytes'] = source_bytes + tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            _trace_lock.release()
+    report['estimated_peak_bytes'] = source_bytes + report['estimated_peak_bytes']
+    return processed_df
+
+
+def estimate_peak_bytes(ids_df, region_ids, chunk_bytes, float_bytes, values,
+                        new_cases, processed_df):
+    """
+        Return sum of the id columns and of the largest set of region x date
+        matrices alive at once: the float matrices next to the largest
+        parsed chunk or to the compacted values, or the compacted matrices
+        next to the long frame. Buffers of the csv parser and temporaries of
+        pandas, e.g. in layouts.build_processed_df(), are left out, so the
+        measured peak is 30-40% higher on large sources and more on
+        small ones.
+    """
+
+    return int(
+        ids_df.memory_usage(index=True, deep=True).sum() + region_ids.nbytes
+        + max(float_bytes + chunk_bytes, float_bytes + values.nbytes,
+              values.nbytes + new_cases.nbytes
+              + processed_df.memory_usage(index=True, deep=True).sum())
+    )
+
+
+def _get_processed_df(metric_csv, report, chunk_rows, chunk_columns):
+    ids_df, regions, region_ids, date_columns = read_regions(metric_csv, chunk_rows)
+    values = aggregate_chunks(
+        metric_csv, region_ids, len(regions), date_columns,
+        chunk_rows, chunk_columns, report)
+
+    dates = pd.to_datetime(date_columns)
+    if not dates.is_monotonic_increasing:
+        order = np.argsort(dates, kind='stable')
+        values = values[:, order]
+        dates = dates[order]
+    new_cases = layouts.get_new_cases(values)
+    float_bytes = values.nbytes + new_cases.nbytes
+
+    # matrices are compacted before the long frame is built next to them
+    count_dtype = layouts.get_count_dtype(
+        values, new_cases, values.sum(axis=0), new_cases.sum(axis=0))
+    values = values.astype(count_dtype)
+    new_cases = new_cases.astype(count_dtype)
+    wide_df = pd.DataFrame(values, index=regions, columns=dates, copy=False)
+
+    lat, long = layouts.get_country_coords(
+        ids_df, layouts.get_region_countries(regions))
+    processed_df = layouts.build_processed_df(wide_df, new_cases, lat, long)
+
+    report.update(rows=len(ids_df), regions=len(regions), dates=len(date_columns))
+    report['estimated_peak_bytes'] = estimate_peak_bytes(
+        ids_df, region_ids, report['chunk_bytes'], float_bytes, values,
+        new_cases, processed_df)
+    return processed_df
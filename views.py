@@ -0,0 +1,210 @@
+"""
+    On-demand country views.
+
+    Country and province layouts are rendered on the first request and kept
+    in a result_cache.ResultCache keyed by (country, province, metric type)
+    and data version, so popular countries are served instantly, layouts
+    rendered by one worker are reused by the others and layouts of a
+    previous data version age out of the cache.
+
+    Figures of the comparison tab are cached the same way. Series of
+    zoomable charts are cached in the process only together with their
+    downsampling pyramid, they are cheaper to take from the snapshot than
+    to transfer. Key metrics traces of the content skeleton share the
+    layout cache, which holds no layouts in figures mode.
+"""
+import os
+from collections import namedtuple
+
+import compare
+import downsample
+import instrumentation
+import layouts
+from lru import LRUCache
+from result_cache import ResultCache
+
+COUNTRY_LAYOUT_CACHE_SIZE = int(os.environ.get('COUNTRY_LAYOUT_CACHE_SIZE', 64))
+
+CHART_CACHE_SIZE = int(os.environ.get('CHART_CACHE_SIZE', 256))
+
+COMPARISON_CACHE_SIZE = int(os.environ.get('COMPARISON_CACHE_SIZE', 64))
+
+DEFAULT_COUNTRY = 'Russia'
+
+country_layout_cache = ResultCache('country_layouts', COUNTRY_LAYOUT_CACHE_SIZE)
+instrumentation.register_cache('country_layouts', country_layout_cache)
+
+chart_cache = LRUCache(CHART_CACHE_SIZE)
+instrumentation.register_cache('charts', chart_cache)
+
+comparison_cache = ResultCache('comparisons', COMPARISON_CACHE_SIZE)
+instrumentation.register_cache('comparisons', comparison_cache)
+
+# dates, value arrays of every trace and downsample.build_pyramid() levels
+Chart = namedtuple('Chart', ['dates', 'values', 'pyramid'])
+
+
+def get_country_layout(snapshot, country, metric_type, province=None):
+    """
+        Return rendered country or province layout from the cache
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Published data snapshot
+
+        country : str
+            Country name as in the source files
+
+        metric_type : str
+            One of ['cumulative', 'new']
+
+        province : str
+            Province name as in the source files, None for the whole country
+
+
+        Return
+        ------
+
+        dash_html_components.Div
+            Country layout
+    """
+
+    province = province or None
+    return country_layout_cache.get_or_create(
+        (country, province, metric_type), snapshot.version,
+        lambda: layouts.render_country_layout(
+            snapshot.stores, country, metric_type, province)
+    )
+
+
+def _build_key_metrics_traces(snapshot, country, province, metric_type):
+    series = [
+        layouts.get_metric_series(snapshot.stores, metric, metric_type, country, province)
+        for metric in ('confirmed', 'recovered', 'deaths')
+    ]
+    if series[0].empty:
+        return []
+    return layouts.get_key_metrics_fig(*series, metric_type).to_plotly_json()['data']
+
+
+def get_key_metrics_traces(snapshot, metric_type, country=None, province=None):
+    """
+        Return traces of the key metrics figure of the world, a country or a
+        province from the cache, empty if there is no data
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Published data snapshot
+
+        metric_type : str
+            One of ['cumulative', 'new']
+
+        country : str
+            Country name, None for the world
+
+        province : str
+            Province name, None for whole countries
+
+
+        Return
+        ------
+
+        list
+            Indicator traces, the layout is the same for all of them
+    """
+
+    country = country or None
+    province = province or None
+    return country_layout_cache.get_or_create(
+        ('key_metrics', country, province, metric_type), snapshot.version,
+        lambda: _build_key_metrics_traces(snapshot, country, province, metric_type)
+    )
+
+
+def _build_chart(snapshot, chart, country, province):
+    series = layouts.get_chart_series(snapshot.stores, chart, country, province)
+    values = [ser.to_numpy() for ser in series]
+    return Chart(series[0].index, values, downsample.build_pyramid(values[0]))
+
+
+def get_chart(snapshot, chart, country=None, province=None):
+    """
+        Return series of a zoomable chart from the cache
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Published data snapshot
+
+        chart : str
+            Chart name as in layouts.get_chart_series()
+
+        country : str
+            Country name, None or empty for worldwide charts
+
+        province : str
+            Province name, None or empty for whole countries
+
+
+        Return
+        ------
+
+        Chart
+    """
+
+    country = country or None
+    province = province or None
+    return chart_cache.get_or_create(
+        (chart, country, province, snapshot.version),
+        lambda: _build_chart(snapshot, chart, country, province)
+    )
+
+
+def _build_comparison_figure(snapshot, countries, chart, mode, threshold):
+    comparison_df = compare.build_comparison(
+        snapshot.stores, countries, chart, mode, threshold)
+    return compare.render_comparison_figure(comparison_df, chart, mode, threshold)
+
+
+def get_comparison_figure(snapshot, countries, chart, mode, threshold):
+    """
+        Return figure of the comparison tab from the cache
+
+        Parameters
+        ----------
+
+        snapshot : refresh.Snapshot
+            Published data snapshot
+
+        countries : list
+            Selected countries in the order of their lines
+
+        chart : str
+            Chart name as in compare.CHARTS
+
+        mode : str
+            One of ['absolute', 'per_capita', 'aligned']
+
+        threshold : int
+            Cumulative confirmed cases starting day 0 in aligned mode
+
+
+        Return
+        ------
+
+        dict
+            Figure
+    """
+
+    countries = tuple(countries[:compare.COMPARE_MAX_COUNTRIES])
+    # the threshold only matters for aligned series
+    threshold = int(threshold) if mode == 'aligned' else None
+    return comparison_cache.get_or_create(
+        (countries, chart, mode, threshold), snapshot.version,
+        lambda: _build_comparison_figure(snapshot, list(countries), chart, mode, threshold)
+    )